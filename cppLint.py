@@ -1,7 +1,17 @@
 import re
 import os.path
+import sys
+import bisect
+import functools
+import hashlib
+import json
+import subprocess
+import tempfile
+import time
 import logging
-# todo: python在进行正则表达式匹配有时候会卡死
+import threading
+import mmap
+import sourceScanner
 # todo: 如果需要检查正则表达式的语法，可以看图形化界面 https://jex.im/regulex/#!embed=false&flags=&re=%5E(a%7Cb)*%3F%24
 # 正则表达式模板字符串
 template_regex_str = r"(?P<template><[\w<>:\s\d,\*&]+>)?"       # 匹配<>里面的东西
@@ -35,38 +45,58 @@ class_static_init_regex = re.compile(type_regex_str + "\w+::\w+" + var_name_str)
 
 # 友元函数声明
 friend_declare_regex = re.compile(r"friend")
-# 多行的注释
-mul_line_comment_regex = re.compile(r"/\*(.|\n)*?(\*/)")
-# 单行的注释
-one_line_comment_regex = re.compile(r"//.*")
+# 字符串和字符常量
+literal_regex_str = r"\"(?:\\[\s\S]|[^\"\\\n])*\"?|(?<!\w)'(?:\\[\s\S]|[^'\\\n])*'?"
+# 单行注释,多行注释,字符串和字符常量,删除注释的时候需要跳过字符串和字符常量里面的内容
+comment_and_literal_regex_str = r"(?P<line_comment>//[^\n]*)" \
+                                r"|(?P<block_comment>/\*[\s\S]*?\*/)" \
+                                r"|(?P<literal>" + literal_regex_str + ")"
+# 括号,跳过字符串和字符常量里面的括号,以及预处理指令(包括\续行)里面的括号, 比如#define NS_BEGIN namespace a {
+bracket_regex = re.compile(r"(?P<directive>^[ \t]*#(?:\\\n|[^\n])*)"
+                           r"|(?P<bracket>[{}()\[\]])|(?P<literal>" + literal_regex_str + ")", re.M)
+# 模板的尖括号以及会影响尖括号匹配的符号
+template_token_regex = re.compile(r"(?P<token><<=?|<=|<|>>=|>=|>>|>|->|&&|\|\||[(){};])"
+                                  r"|(?P<literal>" + literal_regex_str + ")")
+# 换行符
+line_break_regex = re.compile(r"\n")
+# 非空白字符
+non_space_regex = re.compile(r"\S")
+# 分隔语句的符号
+statement_end_regex = re.compile(r"[;{}]")
+# 单词的字符
+word_char_regex = re.compile(r"\w")
 
 # 重载操作符的正则表达式
 operator_regex = re.compile(r"(static\s+)?(\w+::)?(\w+)(<[\w<>:\s\d,\*&]+>)?(\*|&|\s)+"
                             r"operator(\s|\+|\-|\*|/|!|=|<<|>>|<|>)+\(")
 # do..while表达式
 do_while_stat_regex = re.compile(r"do\s*\{")
+# 下面的正则表达式里面不要使用(.|\s)这样的写法, .和\s都可以匹配空格, 匹配失败的时候会指数级回溯导致卡死,
+# 任意字符使用[\s\S], 到第一个分号为止使用[^;]*;
 # while表达式
-while_stat_regex = re.compile(r"while\s*\((.|\s)+?\)\s*\{")
+while_stat_regex = re.compile(r"while\s*\([\s\S]+?\)\s*\{")
 # while表达式1
-while_match_regex = re.compile(r"[ \t\r]*while\s*\((.|\s)+?\)\s*\{")
-# for表达式
-for_stat_regex = re.compile(r"for\s*\((.|\s)*?;(.|\s)*?;(.|\s)*?\)\s*?{")
+while_match_regex = re.compile(r"[ \t\r]*while\s*\([\s\S]+?\)\s*\{")
+# for表达式, 前两个分号取第一个出现的分号, 和非贪婪匹配的结果一致
+for_stat_regex = re.compile(r"for\s*\([^;]*;[^;]*;[\s\S]*?\)\s*\{")
 # for表达式1
-for_match_regex = re.compile(r"[ \t\r]*for\s*\((.|\s)*?;(.|\s)*?;(.|\s)*?\)\s*?{")
+for_match_regex = re.compile(r"[ \t\r]*for\s*\([^;]*;[^;]*;[\s\S]*?\)\s*\{")
 # foreach表达式
 foreach_stat_regex = re.compile(r"foreach\s*\(")
 # switch表达式
-switch_stat_regex = re.compile(r"switch\s*\((.|\s)+?\)\s*\{")
+switch_stat_regex = re.compile(r"switch\s*\([\s\S]+?\)\s*\{")
 # switch表达式1
-switch_match_regex = re.compile(r"[ \t\r]*switch\s*\((.|\s)+?\)\s*\{")
+switch_match_regex = re.compile(r"[ \t\r]*switch\s*\([\s\S]+?\)\s*\{")
 # return 表达式
-return_stat_regex = re.compile(r"return (.|\s)+?;")
+return_stat_regex = re.compile(r"return [\s\S][^;]*;")
 # function调用表达式
 function_call_regex = re.compile(r"\w+\(")
 # if表达式
 if_stat_regex = re.compile(r"if\s*\(")
 # if表达式1
 if_match_regex = re.compile(r"[ \t\r]*if\s*\(")
+# 行的开头是if,for,while,switch语句, 统计语句行数的时候用来跳过不可能是嵌套语句的行
+control_stat_prefix_regex = re.compile(r"[ \t\r]*(?:if|for|while|switch)\s*\(")
 # 赋值表达式
 assign_start_regex = re.compile(var_name_str + r"\s*=")
 
@@ -74,7 +104,7 @@ assign_start_regex = re.compile(var_name_str + r"\s*=")
 class_member_impl_begin_regex = re.compile(type_regex_str + r"\w+::\w+\s*"+template_operator_symbol+"?\(")
 
 # delete 语句
-delete_stat_regex = re.compile(r"delete(\s|.)+?;")
+delete_stat_regex = re.compile(r"delete[\s\S][^;]*;")
 # stream 语句
 stream_stat_regex = re.compile(r".+\s*(<<|>>)\s*.[^;]+")
 # define 开头语句
@@ -82,13 +112,13 @@ define_start_regex = re.compile(r"#define")
 # typedef 语句
 typedef_stat_regex = re.compile(r"typedef")
 # enum语句
-enum_stat_regex = re.compile(r"enum\s*\w*\s*\{(.|\s)*?\}\s*\w*;")
+enum_stat_regex = re.compile(r"enum\s*\w*\s*\{[\s\S]*?\}\s*\w*;")
 # #include "..."
 self_include_regex = re.compile(r'#include\s+"(?P<include_name>(.)+)?"')
 # #include <...>
 system_include_regex = re.compile(r"#include\s+<(?P<include_name>(.)+)?>")
 # using namespace ...;
-using_name_regex = re.compile(r"using namespace (.|\s)+?;")
+using_name_regex = re.compile(r"using namespace [\s\S][^;]*;")
 # qobject
 qobject_regex = re.compile(r"Q_OBJECT")
 # public, protected, private访问控制
@@ -101,13 +131,13 @@ destroy_impl_start_regex = re.compile(r"\w+::~\w+\(")
 construct_impl_start_regex = re.compile(r"\w+::\w+\(")
 
 # CIT_BEGIN_ENUM
-cit_begin_enum_regex = re.compile(r"CIT_BEGIN_ENUM\((\w+)\)(\s|.)+?CIT_END_ENUM")
+cit_begin_enum_regex = re.compile(r"CIT_BEGIN_ENUM\((\w+)\)[\s\S]+?CIT_END_ENUM")
 # 参数间隔的正则表达式
 param_regex = re.compile(r"\s*(?:const\s+)?((\w+::)?(\w+))(<[\w<>:\s\d,]+>)?(\s|\*|&)+\w+,")
 # emit 语句
 emit_stat_regex = re.compile(r"emit\s+.+?;")
 # Q_PROPERTY
-qproperty_stat_regex = re.compile(r"Q_PROPERTY\((.| )+?\)")
+qproperty_stat_regex = re.compile(r"Q_PROPERTY\(.+?\)")
 #泛型指针类型的正则表达式
 raw_pointer_in_generics_regex = re.compile(r"\w+<\s*\w+\s*\*\s*>")
 #C数组的正则表达式
@@ -147,6 +177,34 @@ SYSTEM_INCLUDE_AFTER_SELF_INCLUDE = r"include顺序错误，应该把系统库
 QOBJECT_MUST_BE_END_WITH_CLASS = r"Q_OBJECT必须放在类的结尾"
 DESTROY_ADVISE_VIRTUAL = r"析构函数建议是virtual"
 OVER_LINES_NUM = 10         #while for if switch语句限制行数
+UNNECESSARY_KEYS = (r"unsigned",)    # 会影响解析但是不关键的关键字,预处理的时候删除
+BRACKET_NOT_MATCH = r"括号不匹配"
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024     # 检测结果缓存默认的最大字节数
+LINT_TIMEOUT = r"检测超时(lint timeout),最后解析的位置:{0}"
+HARD_TIMEOUT_FACTOR = 2     # 并行检测的时候,超过时间限制的这个倍数还没有结束,则强制结束检测的子进程
+
+# 所有的规则, 规则的ID就是错误信息常量的名称, 只能在后面添加,不要修改顺序,SARIF里面的ruleIndex依赖这个顺序
+RULE_IDS = ("CLASS_NAME_MUST_CIT_BEGIN", "CLASS_NAME_3RD_MUST_UPPER", "CLASS_INHERIT_COLON_MUST_BE_SPACE",
+            "CLASS_MEMBER_MUST_M_BEGIN", "VAR_TOO_MANY", "FUNCTION_PARAM_MUST_BE_SPACE", "FUNCTION_NAME_BEGIN_CIT",
+            "LOCAL_VAR_MUST_BE_L_BEGIN", "DEFINE_BEGIN_PREFIX_MUST_BE_CIT", "DEFINE_MUST_BE_UPPER",
+            "ENUM_USE_CIT_BEGIN_ENUM", "STATIC_VAR_BEGIN_S", "GLOBAL_VAR_BEGIN_G", "VAR_NAME_TOO_SHORT",
+            "POINT_OR_REF_NEAR_TYPE", "RAW_POINTER", "RAW_ARRAY", "C_STYLE_CAST", "MEMSET_MEMCPY",
+            "TOO_MANY_LINES", "SYSTEM_INCLUDE_AFTER_SELF_INCLUDE", "QOBJECT_MUST_BE_END_WITH_CLASS",
+            "DESTROY_ADVISE_VIRTUAL", "BRACKET_NOT_MATCH", "LINT_TIMEOUT")
+UNKNOWN_RULE_ID = "UNKNOWN"
+REPORT_BUFFER_SIZE = 64 * 1024      # 输出检测结果的时候,缓冲的最大字符数
+MMAP_THRESHOLD = 4 * 1024 * 1024    # 超过这个字节数的源文件使用mmap读取
+FALLBACK_ENCODING = "gb18030"       # 不是UTF-8的源文件使用的编码, 兼容GB2312和GBK
+
+# git diff -U0输出的修改块的头部, @@ -a,b +c,d @@
+git_hunk_regex = re.compile(r"^@@ -\d+(?:,\d+)? \+(?P<start>\d+)(?:,(?P<count>\d+))? @@")
+# git文件名里面的C语言转义字符
+git_path_escapes = {"a": "\a", "b": "\b", "t": "\t", "n": "\n", "v": "\v", "f": "\f", "r": "\r"}
+
+# 左括号对应的右括号
+bracket_pair_symbol = {"<": ">", "{": "}", "(": ")", "[": "]"}
+# 右括号对应的左括号
+bracket_open_symbol = {">": "<", "}": "{", ")": "(", "]": "["}
 
 def remove_begin_space_and_newline(parser_string):
     """
@@ -168,350 +226,636 @@ def remove_begin_space_and_newline(parser_string):
     return parser_string[begin_pos:]
 
 
-def find_token_pair_by_pos(parser_string, start_pos, token):
+def find_token_pair_by_pos(parser_string, start_pos, token, context=None):
     """
-    从start_pos开始，找到对应匹配符号,比如'<'则会找到下一个'>',如果是<<..>>这种语法，将会找到最后那个'>'
+    从start_pos开始，找到对应匹配符号,比如'('则会找到对应的')',如果是((..))这种语法，将会找到最后那个')'
+    '<'按照模板的语法进行匹配,比如vector<vector<int>>会找到最后那个'>'
     :param parser_string: 解析的字符串
     :param start_pos: 从哪里开始查找匹配的
     :param token: 匹配的符号
+    :param context: 文件的检测上下文FileContext
     :return: pos 读取到的字符的位置, 没读到则返回-1
     """
+    if context is None:
+        context = FileContext()
     assert token == "<" or token == "{" or token == "(" or token == "["
     c = parser_string[start_pos]
     assert c == "<" or c == "{" or c == "(" or c == "["
 
-    redundancy = 0      # 冗余的符号个数，因为解析可能解析到<<>>,如果是第一个<则需要一直读取到第四个>才算匹配
-    if token == "<":
-        pattern_symbol = ">"
-    elif token == "{":
-        pattern_symbol = "}"
-    elif token == "(":
-        pattern_symbol = ")"
-    elif token == "[":
-        pattern_symbol = "]"
-    else:
-        assert False
+    pos = None
+    if c == token:
+        bracket_index = context.get_bracket_index(parser_string)
+        if token == "<":
+            pos = bracket_index.template_pair(start_pos)
+        else:
+            pos = bracket_index.pair(start_pos)
+
+    if pos is None:
+        # start_pos不是索引里面的括号,比如字符串里面的括号,逐个字符查找
+        pos = scan_token_pair_by_pos(parser_string, start_pos, token)
+    return pos
 
-    ret_string = ""
+
+def scan_token_pair_by_pos(parser_string, start_pos, token):
+    """
+    从start_pos开始逐个字符查找对应的匹配符号,只有在括号索引里面找不到的时候才使用
+    :param parser_string: 解析的字符串
+    :param start_pos: 从哪里开始查找匹配的
+    :param token: 匹配的符号
+    :return: pos 读取到的字符的位置, 没读到则返回-1
+    """
+    redundancy = 0      # 冗余的符号个数，因为解析可能解析到<<>>,如果是第一个<则需要一直读取到第四个>才算匹配
+    pattern_symbol = bracket_pair_symbol[token]
     for i in range(start_pos, len(parser_string)):
         c = parser_string[i]
         if c == token:
             redundancy += 1
-            ret_string += c
         elif c == pattern_symbol:
             redundancy -= 1
-            if redundancy != 0:
-                ret_string += c
-        else:
-            ret_string += c
 
         if redundancy == 0:
             return i
 
     return -1
 
-def process_nested_region_linenum(parser_str, regtype, start_pos, end_pos):
-    region_str = parser_str[start_pos:end_pos+1]
-    start_pos_old = start_pos
-    start_pos = find_token_pair_by_pos(parser_str, parser_str.find("(",start_pos), "(")
-    str_11 = parser_str[start_pos_old:start_pos]
-    current_line  = parser_str.count("\n", 0, start_pos_old)+1
-    start_pos = next_line_break_pos(parser_str,start_pos)+1
+
+class BracketIndex:
+    """
+    括号匹配索引,遍历一次文件,用栈记录(),{},[]每一个左括号对应的右括号位置,
+    字符串,字符常量和预处理指令里面的括号不参与匹配.模板的<>只有在需要的时候才生成
+    """
+    def __init__(self, parser_string):
+        self.parser_string = parser_string
+        self.pair_pos = dict()          # 左括号的位置->右括号的位置, 没有匹配的右括号则为-1
+        self.unmatched_pos = list()     # 没有匹配的括号的位置
+        self.template_pair_pos = None   # 模板左尖括号的位置->右尖括号的位置
+
+        stacks = {"(": [], "{": [], "[": []}
+        for match in bracket_regex.finditer(parser_string):
+            c = match.group("bracket")
+            if c is None:
+                continue
+
+            pos = match.start()
+            if c in stacks:
+                stacks[c].append(pos)
+                continue
+
+            stack = stacks[bracket_open_symbol[c]]
+            if len(stack):
+                self.pair_pos[stack.pop()] = pos
+            else:
+                self.unmatched_pos.append(pos)
+
+        for stack in stacks.values():
+            for pos in stack:
+                self.pair_pos[pos] = -1
+                self.unmatched_pos.append(pos)
+        self.unmatched_pos.sort()
+
+    def pair(self, pos):
+        """
+        返回pos处的左括号对应的右括号位置
+        :param pos: 左括号的位置
+        :return: 右括号的位置,没有匹配则返回-1, pos不是索引里面的左括号则返回None
+        """
+        return self.pair_pos.get(pos)
+
+    def template_pair(self, pos):
+        """
+        返回pos处模板左尖括号对应的右尖括号位置
+        :param pos: 左尖括号的位置
+        :return: 右尖括号的位置, pos不是模板的左尖括号或者没有匹配则返回None, 由调用者逐个字符查找
+        """
+        if self.template_pair_pos is None:
+            self.template_pair_pos = self.build_template_pair()
+        pos = self.template_pair_pos.get(pos, -1)
+        return pos if pos != -1 else None
+
+    def build_template_pair(self):
+        """
+        生成模板尖括号的匹配,只有跟在标识符后面的'<'才认为是模板的开始,
+        '>>'可以同时结束两层模板, 遇到;{}或者括号层次变化时,还没有匹配的'<'都认为是比较运算符
+        :return: 左尖括号的位置->右尖括号的位置
+        """
+        parser_string = self.parser_string
+        template_pair_pos = dict()
+        stack = list()      # (左尖括号的位置, 所在的括号层次)
+        depth = 0
+
+        def discard(min_depth):
+            while len(stack) and stack[-1][1] >= min_depth:
+                template_pair_pos[stack.pop()[0]] = -1
+
+        for match in template_token_regex.finditer(parser_string):
+            token = match.group("token")
+            if token is None:
+                continue
+
+            pos = match.start()
+            if token == "<":
+                prev_pos = pos - 1
+                while prev_pos >= 0 and parser_string[prev_pos] in " \t":
+                    prev_pos -= 1
+                if prev_pos >= 0 and (parser_string[prev_pos].isalnum() or parser_string[prev_pos] == "_"):
+                    stack.append((pos, depth))
+            elif token == ">" or token == ">>":
+                for close_pos in range(pos, pos + len(token)):
+                    if len(stack) and stack[-1][1] == depth:
+                        template_pair_pos[stack.pop()[0]] = close_pos
+            elif token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+                discard(depth + 1)
+            elif token == "&&" or token == "||":
+                discard(depth)
+            elif token == ";" or token == "{" or token == "}":
+                discard(-1)
+                depth = 0
+
+        discard(-1)
+        return template_pair_pos
+
+
+def count_control_block_lines(parser_str, regtype, start_pos, end_pos, context=None):
+    """
+    统计if,for,while,switch语句的行数, 嵌套的if,for,while,switch语句只算一行, 同时统计所有嵌套语句的行数.
+    用栈代替递归, 只遍历一次语句里面的每一行, 每一行只有开头是if,for,while,switch的时候才尝试匹配嵌套的语句
+    :param parser_str: 解析的字符串
+    :param regtype: 语句的类型,if,for,while,switch
+    :param start_pos: 语句开始的位置
+    :param end_pos: 语句结束的位置
+    :param context: 文件的检测上下文FileContext
+    :return: line_num, error_message 语句的行数和所有超过OVER_LINES_NUM行的语句的错误
+    """
+    if context is None:
+        context = FileContext()
+    # 匹配函数在跟踪和统计的时候会被替换, 每次调用的时候再获取
+    block_matchers = (("if", match_if_stat), ("for", match_for_stat),
+                      ("while", match_while_stat), ("switch", match_switch_stat))
     error_message = []
-    line_num = 0
-    while start_pos < end_pos:
-        str = parser_str[start_pos:start_pos+20]
-        if_start_pos, if_end_pos = match_if_stat(parser_str, start_pos)
-        if if_start_pos != -1:
-            if_line_num, temp_list = process_nested_region_linenum(parser_str, "if", if_start_pos, if_end_pos)
-            if temp_list is not None:
-                for er in temp_list:
-                    error_message.append(er)
-            line_num = line_num + 1
-            start_pos = next_line_break_pos(parser_str,if_end_pos) + 1
-            continue
+    # 每一层语句: [类型, 开始的位置, 结束的位置, 行数, 下一行开始的位置]
+    block_stack = []
 
-        for_start_pos, for_end_pos = match_for_stat(parser_str, start_pos)
-        if for_start_pos != -1:
-            for_line_num, temp_list = process_nested_region_linenum(parser_str, "for", for_start_pos, for_end_pos)
-            if temp_list is not None:
-                for er in temp_list:
-                    error_message.append(er)
-            line_num = line_num + 1
-            start_pos = next_line_break_pos(parser_str, for_end_pos) + 1
-            continue
+    def push_block(block_type, block_start, block_end):
+        condition_end = find_token_pair_by_pos(parser_str, parser_str.find("(", block_start), "(", context)
+        block_stack.append([block_type, block_start, block_end, 0, next_line_break_pos(parser_str, condition_end) + 1])
 
-        while_start_pos, while_end_pos = match_while_stat(parser_str, start_pos)
-        if while_start_pos != -1:
-            while_line_num, temp_list = process_nested_region_linenum(parser_str, "while", while_start_pos, while_end_pos)
-            if temp_list is not None:
-                for er in temp_list:
-                    error_message.append(er)
-            line_num = line_num + 1
-            start_pos = next_line_break_pos(parser_str, while_end_pos) + 1
+    push_block(regtype, start_pos, end_pos)
+    while True:
+        block = block_stack[-1]
+        line_pos = block[4]
+        if line_pos < block[2]:
+            context.check_deadline(line_pos)
+            block[3] += 1
+            block[4] = next_line_break_pos(parser_str, line_pos) + 1
+            if control_stat_prefix_regex.match(parser_str, line_pos):
+                for block_type, block_matcher in block_matchers:
+                    nested_start, nested_end = block_matcher(parser_str, line_pos, context)
+                    if nested_start != -1:
+                        block[4] = next_line_break_pos(parser_str, nested_end) + 1
+                        push_block(block_type, nested_start, nested_end)
+                        break
             continue
 
-        switch_start_pos, switch_end_pos = match_switch_stat(parser_str, start_pos)
-        if switch_start_pos != -1:
-            switch_line_num, temp_list = process_nested_region_linenum(parser_str, "switch", switch_start_pos, switch_end_pos)
-            if temp_list is not None:
-                for er in temp_list:
-                    error_message.append(er)
-            line_num = line_num + 1
-            start_pos = next_line_break_pos(parser_str, switch_end_pos) + 1
-            continue
+        block_stack.pop()
+        block_type, block_start, block_end, line_num = block[:4]
+        if line_num > OVER_LINES_NUM:
+            context_start, context_end = strip_range(parser_str, block_start, parser_str.find(")", block_start)+1)
+            error_message.append(
+                ErrorReport(
+                    line=context.get_line_index(parser_str).line_of(block_start),
+                    message=TOO_MANY_LINES.format(block_type),
+                    source=parser_str,
+                    context_start=context_start,
+                    context_end=context_end
+                )
+            )
+        if not block_stack:
+            return line_num, error_message
 
-        start_pos = next_line_break_pos(parser_str,start_pos) + 1
-        line_num = line_num +1
 
-    if line_num > OVER_LINES_NUM:
-        temp_str = parser_str[start_pos_old:parser_str.find(")", start_pos_old)+1]
-        error_message.append(
-            ErrorReport(
-                line=parser_str.count("\n", 0, start_pos_old)+1,
-                message=TOO_MANY_LINES.format(regtype),
-                error_context=temp_str.strip()
-            )
-        )
-    return line_num, error_message
+class MatcherDispatch:
+    """
+    按照语句开头的字符分派匹配规则, 语句开头不可能匹配的规则直接跳过, 不再执行正则表达式.
+    分派出来的规则保持原来的顺序, 检测的结果和按顺序逐个匹配一致
+    """
+    ANY = "any"         # 任意字符开头都可能匹配
+    WORD = "word"       # \w开头才可能匹配
+
+    def __init__(self, rules):
+        """
+        :param rules: [(规则名称, 开头)] 按照匹配顺序排列, 开头为ANY, WORD或者开头字符串的tuple
+        """
+        self.rules = rules
+        self.table = dict()     # 开头的字符->[(规则名称, 开头字符串的tuple或者None)]
+
+    def rules_of(self, c):
+        """
+        获取c开头的语句可能匹配的规则
+        :param c: 语句开头的字符
+        :return: [(规则名称, 开头字符串的tuple或者None)]
+        """
+        rules = self.table.get(c)
+        if rules is None:
+            is_word = word_char_regex.match(c) is not None
+            rules = list()
+            for name, prefix in self.rules:
+                if prefix == self.ANY or (prefix == self.WORD and is_word):
+                    rules.append((name, None))
+                elif prefix not in (self.ANY, self.WORD) and any(p[0] == c for p in prefix):
+                    rules.append((name, prefix))
+            self.table[c] = rules
+        return rules
+
+    def candidates(self, parser_string, pos):
+        """
+        获取pos位置开始的语句可能匹配的规则
+        :param parser_string: 解析的字符串
+        :param pos: 语句开始的位置
+        :return: 规则名称的集合
+        """
+        return set(name for name, prefix in self.rules_of(parser_string[pos])
+                   if prefix is None or parser_string.startswith(prefix, pos))
 
 
-def match_and_check_function_body(parser_string, start_pos):
+class MasterRegexDispatch(MatcherDispatch):
+    """
+    用一个合并了所有开头字符串的正则表达式给语句开头分类, 一次正则表达式调用就得到可能匹配的规则.
+    每个命名分组对应的规则在生成的时候已经算好, 和MatcherDispatch.candidates的结果一致.
+    只是用一次正则表达式代替逐个比较开头字符串, 分类出来的每个规则仍然要执行自己的正则表达式,
+    最常见的单词开头的语句仍然是class_impl,static_init,function,var四个规则, 速度和chain基本一样
+    """
+    def __init__(self, rules):
+        MatcherDispatch.__init__(self, rules)
+        prefixes = set()
+        for name, prefix in rules:
+            if prefix not in (self.ANY, self.WORD):
+                prefixes.update(prefix)
+        # 长的开头字符串放在前面, 同时符合多个开头字符串的时候取最长的一个
+        prefixes = sorted(prefixes, key=lambda p: (-len(p), p))
+        self.group_candidates = dict()      # 分组名称->规则名称的集合
+        patterns = list()
+        for index, prefix in enumerate(prefixes):
+            group = "prefix%d" % index
+            patterns.append("(?P<%s>%s)" % (group, re.escape(prefix)))
+            self.group_candidates[group] = self.prefix_candidates(prefix)
+        patterns.append(r"(?P<word>\w)")
+        self.group_candidates["word"] = frozenset(name for name, prefix in rules if prefix in (self.ANY, self.WORD))
+        patterns.append(r"(?P<other>[\s\S])")
+        self.group_candidates["other"] = frozenset(name for name, prefix in rules if prefix == self.ANY)
+        self.regex = re.compile("|".join(patterns))
+
+    def prefix_candidates(self, text):
+        """
+        以text开头的语句可能匹配的规则
+        :param text: 语句开头的字符串
+        :return: 规则名称的集合
+        """
+        return frozenset(name for name, prefix in self.rules_of(text[0])
+                         if prefix is None or text.startswith(prefix))
+
+    def candidates(self, parser_string, pos):
+        return self.group_candidates[self.regex.match(parser_string, pos).lastgroup]
+
+
+# match_and_check里面文件级别的匹配规则
+file_matcher_dispatch = MatcherDispatch([
+    ("define", ("#define",)),
+    ("enum", ("enum",)),
+    ("include", ("#include",)),
+    ("typedef", ("typedef",)),
+    ("class", ("class",)),
+    ("class_impl", MatcherDispatch.WORD),
+    ("prec", ("#if", "#endif")),
+    ("cit_begin_enum", ("CIT_BEGIN_ENUM",)),
+    ("using", ("using",)),
+    ("struct", ("struct",)),
+    ("static_init", MatcherDispatch.WORD),
+    ("function", MatcherDispatch.WORD),
+    ("var", MatcherDispatch.WORD),
+])
+
+# 检测文件级别语句的引擎, chain: 按照开头的字符分派后逐个匹配, master: 合并的开头字符串正则表达式一次分类,
+# 两种引擎都只是跳过开头不可能匹配的规则, 可以用lintBenchmark.py --engine比较速度
+SCANNER_ENGINE_CHAIN = "chain"
+SCANNER_ENGINE_MASTER = "master"
+file_dispatch_engines = {SCANNER_ENGINE_CHAIN: file_matcher_dispatch,
+                         SCANNER_ENGINE_MASTER: MasterRegexDispatch(file_matcher_dispatch.rules)}
+
+
+def set_scanner_engine(engine):
+    """
+    选择match_and_check使用的引擎, 替换模块里面的file_matcher_dispatch, 两种引擎检测的结果一致
+    :param engine: SCANNER_ENGINE_CHAIN或者SCANNER_ENGINE_MASTER
+    """
+    global file_matcher_dispatch
+    if engine not in file_dispatch_engines:
+        raise ValueError("未知的引擎:" + str(engine))
+    file_matcher_dispatch = file_dispatch_engines[engine]
+
+
+# match_and_check_class里面类声明的匹配规则
+class_matcher_dispatch = MatcherDispatch([
+    ("access", ("public", "protected", "private", "signals", "slots")),
+    ("friend", ("friend",)),
+    ("enum", ("enum",)),
+    ("qproperty", ("Q_PROPERTY",)),
+    ("define", ("#define",)),
+    ("qobject", ("Q_OBJECT",)),
+    ("destroy", ("virtual", "~")),
+    ("construct", MatcherDispatch.WORD),
+    ("function", MatcherDispatch.WORD),
+    ("typedef", ("typedef",)),
+    ("var", MatcherDispatch.WORD),
+])
+
+# match_and_check_function_body里面函数体的匹配规则
+function_body_matcher_dispatch = MatcherDispatch([
+    ("if", ("if",)),
+    ("delete", ("delete",)),
+    ("for", ("for",)),
+    ("foreach", ("foreach",)),
+    ("stream", MatcherDispatch.ANY),
+    ("while", ("while",)),
+    ("do_while", ("do",)),
+    ("emit", ("emit",)),
+    ("switch", ("switch",)),
+    ("memset", ("memset", "memcpy")),
+    ("function_call", MatcherDispatch.WORD),
+    ("return", ("return",)),
+    ("assign", MatcherDispatch.WORD),
+    ("cast", MatcherDispatch.ANY),
+    ("var", MatcherDispatch.WORD),
+])
+
+
+def match_and_check_function_body(parser_string, start_pos, context=None):
     """
     返回函数解析出来的问题
     :param parser_string  解析的字符串
     :param start_pos:     从start_pos处开始解析
+    :param context: 文件的检测上下文FileContext
     :return: function_body_begin_pos, function_body_end_pos, error_message
     """
+    if context is None:
+        context = FileContext()
 
     assert parser_string[start_pos] == "{"
-    function_body_end_pos = find_token_pair_by_pos(parser_string, start_pos, "{")
+    function_body_end_pos = find_token_pair_by_pos(parser_string, start_pos, "{", context)
     function_body_begin_pos = start_pos
     error_message = list()
-    function_line_begin = FileContext.current_line
-    logging.debug("开始匹配函数体->")
+    function_line_begin = context.current_line
+    line_index = context.get_line_index(parser_string)
+    statement_index = context.get_statement_index(parser_string)
     while start_pos < function_body_end_pos:
         start_pos = next_token_pos_not_space(parser_string, start_pos+1)
-        FileContext.current_line = function_line_begin + parser_string.count("\n", function_body_begin_pos, start_pos)
-        logging.debug("开始匹配->" + parser_string[start_pos:next_line_break_pos(parser_string, start_pos+1)])
-
-        logging.debug("匹配if语句")
-        if_start_pos, if_end_pos = match_if_stat(parser_string, start_pos)
-        if if_start_pos != -1:
-            line_num, temp_list = process_nested_region_linenum(parser_string,"if", if_start_pos, if_end_pos)
-            if temp_list is not None:
-                for er in temp_list:
-                    error_message.append(er)
-            start_pos = if_end_pos+1
-            continue
+        context.check_deadline(start_pos)
+        context.current_line = function_line_begin + line_index.count(function_body_begin_pos, start_pos)
+
+        candidates = function_body_matcher_dispatch.candidates(parser_string, start_pos)
+        if "if" in candidates:
+            if_start_pos, if_end_pos = match_if_stat(parser_string, start_pos, context)
+            if if_start_pos != -1:
+                line_num, temp_list = count_control_block_lines(parser_string,"if", if_start_pos, if_end_pos, context)
+                if temp_list is not None:
+                    for er in temp_list:
+                        error_message.append(er)
+                start_pos = if_end_pos+1
+                continue
 
-        logging.debug("匹配delete语句")
-        del_start_pos, del_end_pos = match_delete_stat(parser_string, start_pos)
-        if del_start_pos != -1:
-            start_pos = del_end_pos+1
-            continue
+        if "delete" in candidates:
+            del_start_pos, del_end_pos = match_delete_stat(parser_string, start_pos, context)
+            if del_start_pos != -1:
+                start_pos = del_end_pos+1
+                continue
 
-        logging.debug("匹配for语句")
-        for_start_pos, for_end_pos = match_for_stat(parser_string, start_pos)
-        if for_start_pos != -1:
-            line_num, temp_list = process_nested_region_linenum(parser_string,"for", for_start_pos, for_end_pos)
-            if temp_list is not None:
-                for er in temp_list:
-                    error_message.append(er)
-            start_pos = for_end_pos+1
-            continue
+        if "for" in candidates:
+            for_start_pos, for_end_pos = match_for_stat(parser_string, start_pos, context)
+            if for_start_pos != -1:
+                line_num, temp_list = count_control_block_lines(parser_string,"for", for_start_pos, for_end_pos, context)
+                if temp_list is not None:
+                    for er in temp_list:
+                        error_message.append(er)
+                start_pos = for_end_pos+1
+                continue
 
-        logging.debug("匹配foreach语句")
-        foreach_start_pos, foreach_end_pos = match_foreach_stat(parser_string, start_pos)
-        if foreach_start_pos != -1:
-            start_pos = foreach_end_pos+1
-            continue
+        if "foreach" in candidates:
+            foreach_start_pos, foreach_end_pos = match_foreach_stat(parser_string, start_pos, context)
+            if foreach_start_pos != -1:
+                start_pos = foreach_end_pos+1
+                continue
 
-        logging.debug("匹配<< 和 >> 语句")
-        stream_start_pos, stream_end_pos = match_stream_stat(parser_string, start_pos)
-        if stream_start_pos != -1:
-            start_pos = stream_end_pos+1
-            continue
+        if "stream" in candidates:
+            stream_start_pos, stream_end_pos = match_stream_stat(parser_string, start_pos, context)
+            if stream_start_pos != -1:
+                start_pos = stream_end_pos+1
+                continue
 
-        logging.debug("匹配while语句")
-        while_start_pos, while_end_pos = match_while_stat(parser_string, start_pos)
-        if while_start_pos != -1:
-            line_num, temp_list = process_nested_region_linenum(parser_string,"while", while_start_pos, while_end_pos)
-            if temp_list is not None:
-                for er in temp_list:
-                    error_message.append(er)
-            start_pos = while_end_pos+1
-            continue
+        if "while" in candidates:
+            while_start_pos, while_end_pos = match_while_stat(parser_string, start_pos, context)
+            if while_start_pos != -1:
+                line_num, temp_list = count_control_block_lines(parser_string,"while", while_start_pos, while_end_pos, context)
+                if temp_list is not None:
+                    for er in temp_list:
+                        error_message.append(er)
+                start_pos = while_end_pos+1
+                continue
 
-        logging.debug("匹配do...while语句")
-        do_while_start_pos, do_while_end_pos = match_do_while_stat(parser_string, start_pos)
-        if do_while_start_pos != -1:
-            start_pos = do_while_end_pos+1
-            continue
+        if "do_while" in candidates:
+            do_while_start_pos, do_while_end_pos = match_do_while_stat(parser_string, start_pos, context)
+            if do_while_start_pos != -1:
+                start_pos = do_while_end_pos+1
+                continue
 
-        logging.debug("匹配emit语句")
-        emit_start_pos, emit_end_pos = match_stat(parser_string, start_pos, emit_stat_regex)
-        if emit_start_pos != -1:
-            start_pos = emit_end_pos+1
-            continue
+        if "emit" in candidates:
+            emit_start_pos, emit_end_pos = match_stat(parser_string, start_pos, emit_stat_regex, None, context)
+            if emit_start_pos != -1:
+                start_pos = emit_end_pos+1
+                continue
 
-        logging.debug("匹配switch语句")
-        switch_start_pos, switch_end_pos = match_switch_stat(parser_string,start_pos)
-        if switch_start_pos != -1:
-            line_num, temp_list = process_nested_region_linenum(parser_string,"switch", switch_start_pos, switch_end_pos)
-            if temp_list is not None:
-                for er in temp_list:
-                    error_message.append(er)
-            start_pos = switch_end_pos+1
-            continue
+        if "switch" in candidates:
+            switch_start_pos, switch_end_pos = match_switch_stat(parser_string,start_pos, context)
+            if switch_start_pos != -1:
+                line_num, temp_list = count_control_block_lines(parser_string,"switch", switch_start_pos, switch_end_pos, context)
+                if temp_list is not None:
+                    for er in temp_list:
+                        error_message.append(er)
+                start_pos = switch_end_pos+1
+                continue
 
-        logging.debug("匹配memset和memcpy")
-        mem_str, end__pos = check_memset_memcpy(parser_string, start_pos)
-        temp_str = parser_string[start_pos:end__pos]
-        if mem_str is not None:
-            error_message.append(
-                ErrorReport(
-                    line=FileContext.current_line,
-                    message=mem_str,
-                    error_context=temp_str
+        if "memset" in candidates:
+            mem_str, end__pos = check_memset_memcpy(parser_string, start_pos)
+            if mem_str is not None:
+                error_message.append(
+                    ErrorReport(
+                        line=context.current_line,
+                        message=mem_str,
+                        source=parser_string,
+                        context_start=start_pos,
+                        context_end=end__pos
+                    )
                 )
-            )
-            if (start_pos < end__pos):
-                start_pos = end__pos + 1
+                if (start_pos < end__pos):
+                    start_pos = end__pos + 1
+                    continue
+
+        if "function_call" in candidates:
+            # 函数调用,赋值和变量的正则表达式不会跨过;{}, 只需要在当前语句的范围里面匹配
+            statement_end = statement_index.statement_end(start_pos)
+            function_call_start_pos, function_call_end_pos = match_stat(parser_string, start_pos, function_call_regex,
+                                                                        statement_end, context)
+            if function_call_start_pos != -1:
+                start_pos = function_call_end_pos + 1
                 continue
 
-        logging.debug("匹配函数调用语句")
-        function_call_start_pos, function_call_end_pos = match_stat(parser_string, start_pos, function_call_regex)
-        if function_call_start_pos != -1:
-            start_pos = function_call_end_pos + 1
-            continue
-
-        logging.debug("匹配return语句")
-        match = return_stat_regex.match(parser_string, start_pos)  # return 语句略过不解析
-        if match:
-            start_pos = match.end()
-            continue
-
-        logging.debug("匹配=语句")
-        match = assign_start_regex.match(parser_string, start_pos)
-        if match:
-            # 获取=号前面的语句，然后进行解析
-            for var_index in range(match.end()-1, match.start(), -1):
-                c = parser_string[var_index]
-                if c is not "=" \
-                        and c is not "+"\
-                        and c is not "-"\
-                        and c is not "*"\
-                        and c is not "/"\
-                        and c is not " ":
-                    break
+        if "return" in candidates:
+            match = return_stat_regex.match(parser_string, start_pos)  # return 语句略过不解析
+            if match:
+                start_pos = match.end()
+                continue
 
-            left_op = parser_string[match.start():var_index+1]
-            var_match = var_regex.match(left_op)
-            if var_match:
-                var_str = parser_string[match.start(): var_index+1]
-                var_error_message = check_scope_var(var_str)
-                if var_error_message:
-                    error_message.append(
-                        ErrorReport(
-                            line=FileContext.current_line,
-                            message=var_error_message,
-                            error_context=var_str
+        if "assign" in candidates:
+            statement_end = statement_index.statement_end(start_pos)
+            match = assign_start_regex.match(parser_string, start_pos, statement_end)
+            if match:
+                # 获取=号前面的语句，然后进行解析
+                for var_index in range(match.end()-1, match.start(), -1):
+                    c = parser_string[var_index]
+                    if c is not "=" \
+                            and c is not "+"\
+                            and c is not "-"\
+                            and c is not "*"\
+                            and c is not "/"\
+                            and c is not " ":
+                        break
+
+                left_op = parser_string[match.start():var_index+1]
+                var_match = var_regex.match(left_op)
+                if var_match:
+                    var_start, var_end = match.start(), var_index + 1
+                    var_str = parser_string[var_start:var_end]
+                    var_error_message = check_scope_var(var_str)
+                    if var_error_message:
+                        error_message.append(
+                            ErrorReport(
+                                line=context.current_line,
+                                message=var_error_message,
+                                source=parser_string,
+                                context_start=var_start,
+                                context_end=var_end
+                            )
                         )
-                    )
-                raw_pointer = check_raw_pointer(var_str)
-                if raw_pointer is not None:
-                    error_message.append(
-                        ErrorReport(
-                            line=FileContext.current_line,
-                            message=RAW_POINTER,
-                            error_context=var_str
+                    raw_pointer = check_raw_pointer(var_str)
+                    if raw_pointer is not None:
+                        error_message.append(
+                            ErrorReport(
+                                line=context.current_line,
+                                message=RAW_POINTER,
+                                source=parser_string,
+                                context_start=var_start,
+                                context_end=var_end
+                            )
                         )
-                    )
-                raw_array, array_str = check_raw_array(parser_string, start_pos)
-                if raw_array is not None:
-                    error_message.append(
-                        ErrorReport(
-                            line=FileContext.current_line,
-                            message=raw_array,
-                            error_context=array_str
+                    raw_array, array_start, array_end = find_raw_array(parser_string, start_pos, statement_end)
+                    if raw_array is not None:
+                        error_message.append(
+                            ErrorReport(
+                                line=context.current_line,
+                                message=raw_array,
+                                source=parser_string,
+                                context_start=array_start,
+                                context_end=array_end
+                            )
                         )
-                    )
-                std_string = check_std_container(var_str)
-                if std_string is not None:
-                    error_message.append(
-                        ErrorReport(
-                            line=FileContext.current_line,
-                            message=std_string,
-                            error_context=var_str
+                    std_string = check_std_container(var_str)
+                    if std_string is not None:
+                        error_message.append(
+                            ErrorReport(
+                                line=context.current_line,
+                                message=std_string,
+                                source=parser_string,
+                                context_start=var_start,
+                                context_end=var_end
+                            )
                         )
-                    )
-
-            start_pos = parser_string.find(";", match.end())+1
-            continue
 
-        logging.debug("匹配强制类型转换")
-        cast_str, end_pos = check_C_cast(parser_string,start_pos)
-        temp_str = parser_string[start_pos:end_pos]
-        if cast_str is not None:
-            error_message.append(
-                ErrorReport(
-                    line=FileContext.current_line,
-                            message=cast_str,
-                            error_context=temp_str
-                )
-            )
-            if (start_pos<end_pos):
-                start_pos = end_pos + 1
+                start_pos = parser_string.find(";", match.end())+1
                 continue
 
-        logging.debug("匹配变量声明")
-        match = var_regex.match(parser_string, start_pos)
-        if match:
-            end_token = parser_string.find(";", match.end())
-            if end_token is not -1:
-                var_str = parser_string[match.start():end_token+1]
-                var_error_message = check_scope_var(var_str)
-                if var_error_message:
-                    error_message.append(
-                        ErrorReport(
-                            line=FileContext.current_line,
-                            message=var_error_message,
-                            error_context=var_str
-                        )
+        if "cast" in candidates:
+            cast_str, end_pos = check_C_cast(parser_string,start_pos)
+            if cast_str is not None:
+                error_message.append(
+                    ErrorReport(
+                        line=context.current_line,
+                        message=cast_str,
+                        source=parser_string,
+                        context_start=start_pos,
+                        context_end=end_pos
                     )
-                raw_pointer = check_raw_pointer(var_str)
-                if raw_pointer is not None:
-                    error_message.append(
-                        ErrorReport(
-                            line=FileContext.current_line,
-                            message=RAW_POINTER,
-                            error_context=var_str
+                )
+                if (start_pos<end_pos):
+                    start_pos = end_pos + 1
+                    continue
+
+        if "var" in candidates:
+            statement_end = statement_index.statement_end(start_pos)
+            match = var_regex.match(parser_string, start_pos, statement_end)
+            if match:
+                end_token = parser_string.find(";", match.end())
+                if end_token is not -1:
+                    var_start, var_end = match.start(), end_token + 1
+                    var_str = parser_string[var_start:var_end]
+                    var_error_message = check_scope_var(var_str)
+                    if var_error_message:
+                        error_message.append(
+                            ErrorReport(
+                                line=context.current_line,
+                                message=var_error_message,
+                                source=parser_string,
+                                context_start=var_start,
+                                context_end=var_end
+                            )
                         )
-                    )
-                raw_array, array_str = check_raw_array(parser_string, start_pos)
-                if raw_array is not None:
-                    error_message.append(
-                        ErrorReport(
-                            line=FileContext.current_line,
-                            message=raw_array,
-                            error_context=array_str
+                    raw_pointer = check_raw_pointer(var_str)
+                    if raw_pointer is not None:
+                        error_message.append(
+                            ErrorReport(
+                                line=context.current_line,
+                                message=RAW_POINTER,
+                                source=parser_string,
+                                context_start=var_start,
+                                context_end=var_end
+                            )
                         )
-                    )
-                std_string = check_std_container(var_str)
-                if std_string is not None:
-                    error_message.append(
-                        ErrorReport(
-                            line=FileContext.current_line,
-                            message=std_string,
-                            error_context=var_str
+                    raw_array, array_start, array_end = find_raw_array(parser_string, start_pos, statement_end)
+                    if raw_array is not None:
+                        error_message.append(
+                            ErrorReport(
+                                line=context.current_line,
+                                message=raw_array,
+                                source=parser_string,
+                                context_start=array_start,
+                                context_end=array_end
+                            )
                         )
-                    )
-                start_pos = end_token+1
-                continue
+                    std_string = check_std_container(var_str)
+                    if std_string is not None:
+                        error_message.append(
+                            ErrorReport(
+                                line=context.current_line,
+                                message=std_string,
+                                source=parser_string,
+                                context_start=var_start,
+                                context_end=var_end
+                            )
+                        )
+                    start_pos = end_token+1
+                    continue
 
 
-        logging.debug("位置的语句，跳过，直到下一个;之后")
         end = parser_string.find(";", start_pos)
         if end == -1:
             break
@@ -556,19 +900,35 @@ def check_raw_pointer(var_str):
         return RAW_POINTER
     return None
 
-def check_raw_array(parser_str, start_pos):
+def check_raw_array(parser_str, start_pos, end_pos=None):
     """
        检测C数组
        :param parser_str: 输入字符串
        :param start_pos:  解析位置
+       :param end_pos:  匹配的结束位置, None则匹配到字符串的结尾
        :return: error_message
        """
-    array_match = raw_array_regex.match(parser_str, start_pos)
-    if array_match is not None:
-        array_str = parser_str[array_match.start():array_match.end()]
-        return RAW_ARRAY,array_str
+    raw_array, array_start, array_end = find_raw_array(parser_str, start_pos, end_pos)
+    if raw_array is not None:
+        return raw_array, parser_str[array_start:array_end]
     return None,""
 
+
+def find_raw_array(parser_str, start_pos, end_pos=None):
+    """
+    检测C数组, 返回数组语句的位置, 错误报告不需要复制数组语句的字符串
+    :param parser_str: 输入字符串
+    :param start_pos:  解析位置
+    :param end_pos:  匹配的结束位置, None则匹配到字符串的结尾
+    :return: error_message, array_start, array_end 没有C数组则返回None, -1, -1
+    """
+    if end_pos is None:
+        end_pos = len(parser_str)
+    array_match = raw_array_regex.match(parser_str, start_pos, end_pos)
+    if array_match is not None:
+        return RAW_ARRAY, array_match.start(), array_match.end()
+    return None, -1, -1
+
 def check_std_container(var_str):
     """
        检测C数组
@@ -630,29 +990,177 @@ def is_static(var_str):
     return var_str.find("static ") != -1
 
 
+class LineIndex:
+    """
+    行号索引,记录文件里面每一个换行符的位置,通过二分查找将位置转换成行号,
+    避免每次都用parser_string.count("\n", 0, pos)从文件头开始统计
+    """
+    def __init__(self, parser_string):
+        self.parser_string = parser_string
+        self.line_break_pos = [match.start() for match in line_break_regex.finditer(parser_string)]
+
+    def _normalize_pos(self, pos):
+        """
+        和str.count的end参数的处理方式保持一致,负数从字符串结尾开始计算
+        """
+        length = len(self.parser_string)
+        if pos < 0:
+            pos += length
+            if pos < 0:
+                pos = 0
+        elif pos > length:
+            pos = length
+        return pos
+
+    def count(self, start_pos, end_pos):
+        """
+        统计[start_pos, end_pos)之间的换行符个数,等同于parser_string.count("\n", start_pos, end_pos)
+        :param start_pos:
+        :param end_pos:
+        :return: 换行符个数
+        """
+        start_pos = self._normalize_pos(start_pos)
+        end_pos = self._normalize_pos(end_pos)
+        if end_pos <= start_pos:
+            return 0
+        return bisect.bisect_left(self.line_break_pos, end_pos) - bisect.bisect_left(self.line_break_pos, start_pos)
+
+    def line_of(self, pos):
+        """
+        返回pos所在的行号,行号从1开始
+        :param pos:
+        :return: 行号
+        """
+        return bisect.bisect_left(self.line_break_pos, self._normalize_pos(pos)) + 1
+
+
+class StatementIndex:
+    """
+    语句索引,遍历一次文件,记录;{}的位置,这些位置把文件分成一条条语句.
+    函数体里面的规则只在当前语句的范围里面匹配,不会扫描到后面的语句.
+    for(;;)和字符串里面的;也会分开语句,这些规则的正则表达式都不会匹配;{},分得更细不影响匹配的结果
+    """
+    def __init__(self, parser_string):
+        self.parser_string = parser_string
+        # 语句结束的位置,也就是;{}的位置
+        self.statement_end_pos = [match.start() for match in statement_end_regex.finditer(parser_string)]
+
+    def statement_end(self, pos):
+        """
+        返回pos所在的语句结束的位置
+        :param pos:
+        :return: 语句结束的;{}的位置, 后面没有语句结束的符号则返回字符串的长度
+        """
+        index = bisect.bisect_left(self.statement_end_pos, pos)
+        if index == len(self.statement_end_pos):
+            return len(self.parser_string)
+        return self.statement_end_pos[index]
+
+
 class FileContext:
+    """
+    单个文件的检测上下文,检测过程中的状态都保存在这里,
+    每个文件使用单独的FileContext,可以在多个线程里面同时检测不同的文件
+    """
     PARSER_TYPE_FILE = "FILE"
     PARSER_TYPE_CLASS = "CLASS"
 
-    current_file_name = None        # 当前文件名
+    def __init__(self, file_name=None):
+        self.current_file_name = file_name        # 当前文件名
 
-    """
-    检测include文件的时候，如果已经检测到了""包含的文件，那么会将这个标志位设置True,
-    如果后续再遇见<>包含的文件，则会错误
-    """
-    include_system_end = False
-    # 当前解析的行数
-    current_line = 0
+        """
+        检测include文件的时候，如果已经检测到了""包含的文件，那么会将这个标志位设置True,
+        如果后续再遇见<>包含的文件，则会错误
+        """
+        self.include_system_end = False
+        # 当前解析的行数
+        self.current_line = 1
+
+        # 当前在检测的数据类型
+        self.current_parser_context = FileContext.PARSER_TYPE_FILE
+
+        # 当前文件的行号索引
+        self.line_index = None
+        # 当前文件的括号索引
+        self.bracket_index = None
+        # 当前文件的语句索引
+        self.statement_index = None
+
+        # 匹配函数的钩子(MatcherTrace等), 只有这个上下文里面的匹配函数调用会通知这些钩子,
+        # 默认使用enable_trace设置的钩子
+        self.matcher_hooks = default_matcher_hooks
+
+        # 检测的截止时间(time.monotonic), None表示不限制检测的时间
+        self.deadline = None
+        # 最后解析的位置
+        self.last_offset = 0
+        # 是否因为超时放弃检测
+        self.timed_out = False
+        # match_and_check已经检测出的错误,超时的时候返回这部分结果
+        self.error_message = list()
+
+    def current_is_header(self):
+        return self.current_file_name.endswith(".h")
+
+    def get_line_index(self, parser_string):
+        """
+        获取parser_string对应的行号索引,如果当前缓存的不是这个字符串,则重新生成
+        :param parser_string:
+        :return: LineIndex
+        """
+        if self.line_index is None or self.line_index.parser_string is not parser_string:
+            self.line_index = LineIndex(parser_string)
+        return self.line_index
 
-    # 当前在检测的数据类型
-    current_parser_context = PARSER_TYPE_FILE
+    def get_bracket_index(self, parser_string):
+        """
+        获取parser_string对应的括号索引,如果当前缓存的不是这个字符串,则重新生成
+        :param parser_string:
+        :return: BracketIndex
+        """
+        if self.bracket_index is None or self.bracket_index.parser_string is not parser_string:
+            self.bracket_index = BracketIndex(parser_string)
+        return self.bracket_index
 
-    def __init__(self):
-        pass
+    def get_statement_index(self, parser_string):
+        """
+        获取parser_string对应的语句索引,如果当前缓存的不是这个字符串,则重新生成
+        :param parser_string:
+        :return: StatementIndex
+        """
+        if self.statement_index is None or self.statement_index.parser_string is not parser_string:
+            self.statement_index = StatementIndex(parser_string)
+        return self.statement_index
+
+    def set_time_budget(self, time_budget):
+        """
+        设置检测的时间限制
+        :param time_budget: 单位为秒, None表示不限制
+        """
+        self.deadline = None if time_budget is None else time.monotonic() + time_budget
+
+    def check_deadline(self, pos):
+        """
+        记录解析的位置,超过检测的截止时间则抛出LintTimeout
+        :param pos: 当前解析的位置
+        """
+        self.last_offset = pos
+        if watchdog_progress is not None:
+            # 在watchdog的子进程里面检测, 记录解析的位置, 子进程被结束的时候报告在这个位置
+            watchdog_progress[0] = pos
+            watchdog_progress[1] = 0 if self.line_index is None else self.line_index.line_of(pos)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.timed_out = True
+            raise LintTimeout(pos)
 
-    @staticmethod
-    def current_is_header():
-        return FileContext.current_file_name.endswith(".h")
+
+class LintTimeout(Exception):
+    """
+    检测超过时间限制
+    """
+    def __init__(self, offset):
+        Exception.__init__(self, LINT_TIMEOUT.format(offset))
+        self.offset = offset
 
 
 def check_params(parser_string, start_pos, end_pos):
@@ -685,25 +1193,90 @@ def check_params(parser_string, start_pos, end_pos):
 class ErrorReport:
     """
     错误报告
+    错误的上下文可以直接传入字符串, 也可以传入源代码和上下文的位置, 需要输出的时候才生成上下文字符串
     """
+    __slots__ = ("line", "message", "file_full_path", "context_string", "source", "context_start", "context_end")
+
     def __init__(self,
                  line=None,
                  message=None,
                  file_full_path=None,
-                 error_context=None):
+                 error_context=None,
+                 source=None,
+                 context_start=None,
+                 context_end=None):
 
         self.line = line
-        self.message = message
-        self.file_full_path = file_full_path
-        self.error_context = error_context
+        self.message = intern_string(message)
+        self.file_full_path = intern_string(file_full_path)
+        self.context_string = error_context
+        self.source = source                    # 上下文所在的源代码, 同一个文件的错误共用一个字符串
+        self.context_start = context_start
+        self.context_end = context_end
+
+    @property
+    def error_context(self):
+        if self.context_string is None and self.source is not None:
+            return self.source[self.context_start:self.context_end]
+        return self.context_string
+
+    def materialize(self):
+        """
+        生成上下文字符串并且不再引用源代码, 需要长时间保存错误报告的时候使用,避免保留整个文件的源代码
+        :return: self
+        """
+        if self.source is not None:
+            self.context_string = self.error_context
+            self.source = None
+        return self
+
+    def drop_context(self):
+        """
+        丢弃上下文并且不再引用源代码, 只需要错误信息的时候使用, 比如只统计错误的数量
+        :return: self
+        """
+        self.context_string = None
+        self.source = None
+        return self
+
+    def __reduce__(self):
+        # 在进程之间传递的时候只传递上下文字符串,不传递整个源代码
+        return ErrorReport, (self.line, self.message, self.file_full_path, self.error_context)
 
     def __str__(self):
-        if self.error_context is not None:
-            return "%s(%d): < %s >======%s" % (self.file_full_path, self.line, self.error_context, self.message)
+        error_context = self.error_context
+        if error_context is not None:
+            return "%s(%d): < %s >======%s" % (self.file_full_path, self.line, error_context, self.message)
         else:
             return "%s(%d): %s" % (self.file_full_path, self.line, self.message)
 
 
+def intern_string(value):
+    """
+    字符串驻留, 大量相同的文件路径和错误信息只保存一份
+    :param value: 字符串或者None
+    :return: 驻留后的字符串
+    """
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+def strip_range(parser_string, start, end):
+    """
+    去掉start到end之间首尾的空白字符,结果和parser_string[start:end].strip()一致
+    :param parser_string:
+    :param start: 开始的位置
+    :param end: 结束的位置
+    :return: start, end 去掉空白字符之后的位置
+    """
+    while start < end and parser_string[start].isspace():
+        start += 1
+    while end > start and parser_string[end-1].isspace():
+        end -= 1
+    return start, end
+
+
 class TokenParser:
     """
     辅助解析Token的,负责从begin_pos开始解析每一个token
@@ -748,11 +1321,12 @@ class TokenParser:
         return len(search)
 
 
-def match_stream_stat(parser_string, start_pos):
+def match_stream_stat(parser_string, start_pos, context=None):
     """
     从start_pos开始检测,是否符合stream语句的语法，如果符合，则返回整个stream语句的作用域(指的是{}这个里面，或者if语句的下一句)
     :param parser_string: 需要解析的语句
     :param start_pos: 开始的位置,
+    :param context: 文件的检测上下文FileContext, 只用来传递匹配函数的钩子
     :return: stat_start, stat_end, 如果没有匹配，则都返回-1
     """
     match = stream_stat_regex.match(parser_string, start_pos)
@@ -763,11 +1337,12 @@ def match_stream_stat(parser_string, start_pos):
     return match.start(), end_pos
 
 
-def match_using_namespace(parser_string, start_pos):
+def match_using_namespace(parser_string, start_pos, context=None):
     """
     检测using namespace ...的语法
     :param parser_string:
     :param start_pos:
+    :param context: 文件的检测上下文FileContext, 只用来传递匹配函数的钩子
     :return: stat_start, stat_end, 如果没有匹配，则返回-1,否则返回
     """
     match = using_name_regex.match(parser_string, start_pos)
@@ -777,11 +1352,12 @@ def match_using_namespace(parser_string, start_pos):
     return match.start(), match.end()-1
 
 
-def match_delete_stat(parser_string, start_pos):
+def match_delete_stat(parser_string, start_pos, context=None):
     """
     从start_pos开始检测,是否符合delete语句的语法，如果符合，则返回整个delete语句的作用域(指的是{}这个里面，或者if语句的下一句)
     :param parser_string: 需要解析的语句
     :param start_pos: 开始的位置,
+    :param context: 文件的检测上下文FileContext, 只用来传递匹配函数的钩子
     :return: stat_start, stat_end, 如果没有匹配，则都返回-1
     """
     match = delete_stat_regex.match(parser_string, start_pos)
@@ -798,10 +1374,10 @@ def next_token_pos_not_space(parser_string, start_pos):
     :param start_pos:
     :return: 下一个的起始位置
     """
-    for i in range(start_pos, len(parser_string)):
-        if not parser_string[i].isspace():
-            return i
-    return -1
+    match = non_space_regex.search(parser_string, start_pos)
+    if match is None:
+        return -1
+    return match.start()
 
 
 def next_token(parser_string, start_pos):
@@ -823,8 +1399,6 @@ def next_line_break_pos(parser_string, start_pos):
     :param start_pos:
     :return: 如果有找到则返回位置，没有则返回字符串结束的位置
     """
-
-    line_break_regex = re.compile("\n")
     search = line_break_regex.search(parser_string, start_pos)
     if search is None:
         return len(parser_string)
@@ -832,14 +1406,17 @@ def next_line_break_pos(parser_string, start_pos):
     return search.start()
 
 
-def match_and_check_class_declare_function(parser_string, start_pos):
+def match_and_check_class_declare_function(parser_string, start_pos, context=None):
     """
     从start_pos开始检测，查看是否符合类成员函数声明的语法
     这个检测的是在class声明里面的函数
     :param parser_string:
     :param start_pos:
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, error_message, 如果没有匹配，则返回-1, -1, []
     """
+    if context is None:
+        context = FileContext()
     error_message = list()
     while True:
         match = function_regex.match(parser_string, start_pos)
@@ -850,14 +1427,16 @@ def match_and_check_class_declare_function(parser_string, start_pos):
             break
         return -1, -1, error_message
 
-    function_declare_end_pos = find_token_pair_by_pos(parser_string, match.end()-1, "(")
+    function_declare_end_pos = find_token_pair_by_pos(parser_string, match.end()-1, "(", context)
     param_error = check_params(parser_string, match.end()-1, function_declare_end_pos)
     if param_error:
         error_message.append(
             ErrorReport(
-                line=FileContext.current_line,
+                line=context.current_line,
                 message=param_error,
-                error_context=parser_string[match.start():function_declare_end_pos+1]
+                source=parser_string,
+                context_start=match.start(),
+                context_end=function_declare_end_pos+1
             )
         )
 
@@ -868,20 +1447,23 @@ def match_and_check_class_declare_function(parser_string, start_pos):
         elif c == "{":
             break
 
-    body_start, body_end, body_error = match_and_check_function_body(parser_string, i)
+    body_start, body_end, body_error = match_and_check_function_body(parser_string, i, context)
     if len(body_error):
         error_message.extend(body_error)
 
     return start_pos, body_end, error_message
 
 
-def match_and_check_function(parser_string, start_pos):
+def match_and_check_function(parser_string, start_pos, context=None):
     """
     从start_pos开始检测,是否符合函数定义语法, 检测的是普通函数的语法
     :param parser_string: 需要解析的语句
     :param start_pos: 开始的位置,
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, error_message,如果没有匹配，则返回-1, -1, []
     """
+    if context is None:
+        context = FileContext()
     error_message = list()
     while True:
         match = function_regex.match(parser_string, start_pos)
@@ -894,14 +1476,16 @@ def match_and_check_function(parser_string, start_pos):
             break
         return -1, -1, error_message
 
-    function_declare_end_pos = find_token_pair_by_pos(parser_string, match.end()-1, "(")
+    function_declare_end_pos = find_token_pair_by_pos(parser_string, match.end()-1, "(", context)
     param_error = check_params(parser_string, match.end()-1, function_declare_end_pos)
     if param_error:
         error_message.append(
             ErrorReport(
-                line=FileContext.current_line,
+                line=context.current_line,
                 message=param_error,
-                error_context=parser_string[start_pos:function_declare_end_pos+1]
+                source=parser_string,
+                context_start=start_pos,
+                context_end=function_declare_end_pos+1
             )
         )
 
@@ -910,9 +1494,11 @@ def match_and_check_function(parser_string, start_pos):
         if function_name[0:3] != "cit" and function_name != "main":
             error_message.append(
                 ErrorReport(
-                    line=FileContext.current_line,
+                    line=context.current_line,
                     message=FUNCTION_NAME_BEGIN_CIT,
-                    error_context=parser_string[start_pos:function_declare_end_pos+1]
+                    source=parser_string,
+                    context_start=start_pos,
+                    context_end=function_declare_end_pos+1
                 )
             )
 
@@ -922,22 +1508,25 @@ def match_and_check_function(parser_string, start_pos):
             return start_pos, i, error_message
         elif c == "{":
             break
-    FileContext.current_line = parser_string.count("\n", 0, i)+1
+    context.current_line = context.get_line_index(parser_string).line_of(i)
     body_start_pos, body_end_pos, body_error = \
-        match_and_check_function_body(parser_string, i)
+        match_and_check_function_body(parser_string, i, context)
     if len(body_error):
         error_message.extend(body_error)
 
     return start_pos, body_end_pos, error_message
 
 
-def match_and_check_class_var(parser_string, start_pos):
+def match_and_check_class_var(parser_string, start_pos, context=None):
     """
     从start_pos开始检测,是否符合变量语法，并且检测错误
     :param parser_string: 需要解析的语句
     :param start_pos: 开始的位置,
+    :param context: 文件的检测上下文FileContext
     :return: start_pos, end_pos, error_message,如果没有匹配，则返回-1, -1, []
     """
+    if context is None:
+        context = FileContext()
     error_message = list()
     match = var_regex.match(parser_string, start_pos)
     if match is None:
@@ -947,29 +1536,36 @@ def match_and_check_class_var(parser_string, start_pos):
     if len(var_name) == 0:
         return -1, -1, error_message
 
-    var_str = parser_string[match.start():match.end()]
+    var_start, var_end = match.start(), match.end()
+    var_str = parser_string[var_start:var_end]
 
     while True:
         if len(var_name) < 3:
-            error_message.append(ErrorReport(line=FileContext.current_line,
+            error_message.append(ErrorReport(line=context.current_line,
                                              message=VAR_NAME_TOO_SHORT,
-                                             error_context=var_str))
+                                             source=parser_string,
+                                             context_start=var_start,
+                                             context_end=var_end))
             break
 
         if var_name[0:2] != "m_":
             error_message.append(ErrorReport(
-                line=FileContext.current_line,
+                line=context.current_line,
                 message=CLASS_MEMBER_MUST_M_BEGIN,
-                error_context=var_str
+                source=parser_string,
+                context_start=var_start,
+                context_end=var_end
             ))
 
         pointer_err = check_pointer_and_ref(var_str)
         if pointer_err is not None:
             error_message.append(
                 ErrorReport(
-                    line=FileContext.current_line,
+                    line=context.current_line,
                     message=POINT_OR_REF_NEAR_TYPE,
-                    error_context=var_str
+                    source=parser_string,
+                    context_start=var_start,
+                    context_end=var_end
                 )
             )
             break
@@ -977,19 +1573,23 @@ def match_and_check_class_var(parser_string, start_pos):
         if raw_pointer is not None:
             error_message.append(
                 ErrorReport(
-                    line=FileContext.current_line,
+                    line=context.current_line,
                     message=RAW_POINTER,
-                    error_context=var_str
+                    source=parser_string,
+                    context_start=var_start,
+                    context_end=var_end
                 )
             )
             break
-        raw_array,array_str = check_raw_array(parser_string,start_pos)
+        raw_array, array_start, array_end = find_raw_array(parser_string, start_pos)
         if raw_array is not None:
             error_message.append(
                 ErrorReport(
-                    line=FileContext.current_line,
+                    line=context.current_line,
                     message=raw_array,
-                    error_context=array_str
+                    source=parser_string,
+                    context_start=array_start,
+                    context_end=array_end
                 )
             )
             break
@@ -997,9 +1597,11 @@ def match_and_check_class_var(parser_string, start_pos):
         if std_string is not None:
             error_message.append(
                 ErrorReport(
-                    line=FileContext.current_line,
+                    line=context.current_line,
                     message=std_string,
-                    error_context=var_str
+                    source=parser_string,
+                    context_start=var_start,
+                    context_end=var_end
                 )
             )
             break
@@ -1010,13 +1612,16 @@ def match_and_check_class_var(parser_string, start_pos):
     return match.start(), end_pos, error_message
 
 
-def match_and_check_var(parser_string, start_pos):
+def match_and_check_var(parser_string, start_pos, context=None):
     """
     从start_pos开始检测,是否符合变量语法，并且检测错误
     :param parser_string: 需要解析的语句
     :param start_pos: 开始的位置,
+    :param context: 文件的检测上下文FileContext
     :return: start_pos, end_pos, error_message,如果没有匹配，则返回-1, -1, []
     """
+    if context is None:
+        context = FileContext()
     error_message = list()
     match = var_regex.match(parser_string, start_pos)
     if match is None:
@@ -1026,15 +1631,18 @@ def match_and_check_var(parser_string, start_pos):
     if len(var_name) == 0:
         return -1, -1, error_message
 
-    var_str = parser_string[match.start():match.end()]
+    var_start, var_end = match.start(), match.end()
+    var_str = parser_string[var_start:var_end]
 
     while True:
         if len(var_name) < 3:
             error_message.append(
                 ErrorReport(
-                    line=FileContext.current_line,
+                    line=context.current_line,
                     message=VAR_NAME_TOO_SHORT,
-                    error_context=var_str
+                    source=parser_string,
+                    context_start=var_start,
+                    context_end=var_end
                 )
             )
             break
@@ -1043,18 +1651,22 @@ def match_and_check_var(parser_string, start_pos):
             if var_name[0:2] != "s_":
                 error_message.append(
                     ErrorReport(
-                        line=FileContext.current_line,
+                        line=context.current_line,
                         message=STATIC_VAR_BEGIN_S,
-                        error_context=var_str
+                        source=parser_string,
+                        context_start=var_start,
+                        context_end=var_end
                     )
                 )
                 break
         elif var_name[0:2] != "g_":
             error_message.append(
                 ErrorReport(
-                    line=FileContext.current_line,
+                    line=context.current_line,
                     message=GLOBAL_VAR_BEGIN_G,
-                    error_context=var_str
+                    source=parser_string,
+                    context_start=var_start,
+                    context_end=var_end
                 )
             )
             break
@@ -1063,9 +1675,11 @@ def match_and_check_var(parser_string, start_pos):
         if pointer_err is not None:
             error_message.append(
                 ErrorReport(
-                    line=FileContext.current_line,
+                    line=context.current_line,
                     message=pointer_err,
-                    error_context=var_str
+                    source=parser_string,
+                    context_start=var_start,
+                    context_end=var_end
                 )
             )
             break
@@ -1073,27 +1687,33 @@ def match_and_check_var(parser_string, start_pos):
         if raw_pointer is not None:
             error_message.append(
                 ErrorReport(
-                    line=FileContext.current_line,
+                    line=context.current_line,
                     message=RAW_POINTER,
-                    error_context=var_str
+                    source=parser_string,
+                    context_start=var_start,
+                    context_end=var_end
                 )
             )
-        raw_array, array_str = check_raw_array(parser_string, start_pos)
+        raw_array, array_start, array_end = find_raw_array(parser_string, start_pos)
         if raw_array is not None:
             error_message.append(
                 ErrorReport(
-                    line=FileContext.current_line,
+                    line=context.current_line,
                     message=raw_array,
-                    error_context=array_str
+                    source=parser_string,
+                    context_start=array_start,
+                    context_end=array_end
                 )
             )
         std_string = check_std_container(var_str)
         if std_string is not None:
             error_message.append(
                 ErrorReport(
-                    line=FileContext.current_line,
+                    line=context.current_line,
                     message=std_string,
-                    error_context=var_str
+                    source=parser_string,
+                    context_start=var_start,
+                    context_end=var_end
                 )
             )
         break
@@ -1103,11 +1723,12 @@ def match_and_check_var(parser_string, start_pos):
     return match.start(), end_pos, error_message
 
 
-def match_and_check_typedef(parser_string, start_pos):
+def match_and_check_typedef(parser_string, start_pos, context=None):
     """
     从start_pos开始检测，是否符合typedef语法，并且检测错误
     :param parser_string:
     :param start_pos:
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, error_message, 如果没有匹配，则返回-1, -1, []
     """
     error_message = list()
@@ -1117,11 +1738,11 @@ def match_and_check_typedef(parser_string, start_pos):
 
     # 匹配typedef
     next_token_begin = next_token_pos_not_space(parser_string, match.end())
-    enum_start_pos, enum_end_pos, error_message = match_and_check_enum(parser_string, next_token_begin)
+    enum_start_pos, enum_end_pos, error_message = match_and_check_enum(parser_string, next_token_begin, context)
     if enum_start_pos != -1:
         return match.start(), enum_end_pos, error_message
 
-    struct_start_pos, struct_end_pos = match_struct(parser_string, next_token_begin)
+    struct_start_pos, struct_end_pos = match_struct(parser_string, next_token_begin, context)
     if struct_start_pos != -1:
         return match.start(), struct_end_pos, error_message
 
@@ -1130,13 +1751,16 @@ def match_and_check_typedef(parser_string, start_pos):
     return match.start(), typedef_end_pos, error_message
 
 
-def match_and_check_qobject(parser_string, start_pos):
+def match_and_check_qobject(parser_string, start_pos, context=None):
     """
     检测Q_OBJECT是否在类的尾部
     :param parser_string:
     :param start_pos:
+    :param context: 文件的检测上下文FileContext
     :return: start_pos, end_pos, error_message
     """
+    if context is None:
+        context = FileContext()
     error_message = list()
     match = qobject_regex.match(parser_string, start_pos)
     if match is None:
@@ -1145,17 +1769,20 @@ def match_and_check_qobject(parser_string, start_pos):
     seek_first_token_pos = next_token_pos_not_space(parser_string, match.end())
 
     if parser_string[seek_first_token_pos:seek_first_token_pos+2] != "};":
-        error_message.append(ErrorReport(line=FileContext.current_line,
-                                         error_context=parser_string[match.start():match.end()],
-                                         message=QOBJECT_MUST_BE_END_WITH_CLASS))
+        error_message.append(ErrorReport(line=context.current_line,
+                                         message=QOBJECT_MUST_BE_END_WITH_CLASS,
+                                         source=parser_string,
+                                         context_start=match.start(),
+                                         context_end=match.end()))
     return match.start(), match.end(), error_message
 
 
-def match_class_access(parser_string, start_pos):
+def match_class_access(parser_string, start_pos, context=None):
     """
     从start pos开始，检测是否符合public, protected, private等访问控制的语法
     :param parser_string:
     :param start_pos:
+    :param context: 文件的检测上下文FileContext, 只用来传递匹配函数的钩子
     :return: start_pos, end_pos     开始位置，结束位置
     """
     match = access_control_regex.match(parser_string, start_pos)
@@ -1166,26 +1793,31 @@ def match_class_access(parser_string, start_pos):
     return match.start(), end_pos
 
 
-def match_stat(parser_string, start_pos, regex):
+def match_stat(parser_string, start_pos, regex, end_pos=None, context=None):
     """
     查看是否符合regex的语句,如果符合则返回起始和结束为止,否则返回-1, -1
     :param parser_string:
     :param start_pos:
     :param regex: 匹配的正则表达式
+    :param end_pos: 匹配的结束位置, None则匹配到字符串的结尾
+    :param context: 文件的检测上下文FileContext, 只用来传递匹配函数的钩子
     :return: start_pos, end_pos, 语句开始和结束的位置,如果没有则返回-1,-1
     """
-    match = regex.match(parser_string, start_pos)
+    if end_pos is None:
+        end_pos = len(parser_string)
+    match = regex.match(parser_string, start_pos, end_pos)
     if match is None:
         return -1, -1
 
     return match.start(), match.end()-1
 
 
-def match_friend_declare(parser_string, start_pos):
+def match_friend_declare(parser_string, start_pos, context=None):
     """
     从start_pos开始检测，是否符合友元函数语法，并且检测错误
     :param parser_string:
     :param start_pos:
+    :param context: 文件的检测上下文FileContext, 只用来传递匹配函数的钩子
     :return: stat_start, stat_end 开始的位置，结束的位置
     """
     match = friend_declare_regex.match(parser_string, start_pos)
@@ -1197,11 +1829,12 @@ def match_friend_declare(parser_string, start_pos):
     return match.start(), end_pos
 
 
-def match_and_check_construct_from_class_decl(parser_string, start_pos):
+def match_and_check_construct_from_class_decl(parser_string, start_pos, context=None):
     """
     在类声明里面,从start_pos开始检测，是否符合构造函数语法，并且检测错误
     :param parser_string:
     :param start_pos:
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, error_message 开始的位置，结束的位置, 检测的错误
     """
     error_message = []
@@ -1210,7 +1843,7 @@ def match_and_check_construct_from_class_decl(parser_string, start_pos):
         return -1, -1, error_message
 
     # 查找函数参数的结束位置
-    param_end_pos = find_token_pair_by_pos(parser_string, match.end()-1, "(")
+    param_end_pos = find_token_pair_by_pos(parser_string, match.end()-1, "(", context)
     param_error = check_params(parser_string, match.end()-1, param_end_pos)
     if param_error is not None:
         error_message.extend(param_error)
@@ -1227,7 +1860,7 @@ def match_and_check_construct_from_class_decl(parser_string, start_pos):
         if next_token(parser_string, param_end_pos+1) == "{":
             function_body_begin = parser_string.find("{", param_end_pos+1)
             function_body_begin, function_end_pos, function_body_error = \
-                match_and_check_function_body(parser_string, function_body_begin)
+                match_and_check_function_body(parser_string, function_body_begin, context)
             error_message.extend(function_body_error)
             if next_token(parser_string, param_end_pos+1) == ";":
                 end_pos = parser_string.find(";", function_end_pos)
@@ -1241,13 +1874,16 @@ def match_and_check_construct_from_class_decl(parser_string, start_pos):
     return match.start(), end_pos, error_message
 
 
-def match_and_check_destroy_from_class_decl(parser_string, start_pos):
+def match_and_check_destroy_from_class_decl(parser_string, start_pos, context=None):
     """
     在类声明里面，检测析构函数是否符合语法
     :param parser_string: 解析的字符串
     :param start_pos: 从start_pos处开始解析
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, error_message
     """
+    if context is None:
+        context = FileContext()
     error_message = list()
     match = destroy_declare_regex.match(parser_string, start_pos)
     if match is None:
@@ -1255,15 +1891,17 @@ def match_and_check_destroy_from_class_decl(parser_string, start_pos):
 
     has_virtual = parser_string.find("virtual", match.start(), match.end())
     if has_virtual == -1:
-        error_message.append(ErrorReport(line=FileContext.current_line,
+        error_message.append(ErrorReport(line=context.current_line,
                                          message=DESTROY_ADVISE_VIRTUAL,
-                                         error_context=parser_string[match.start():match.end()]))
+                                         source=parser_string,
+                                         context_start=match.start(),
+                                         context_end=match.end()))
     end_pos = match.end()
     # 检测析构函数体
     if next_token(parser_string, match.end()) == "{":
         function_body_begin = parser_string.find("{", match.end())
         function_body_begin, function_body_end, function_body_error_message = \
-            match_and_check_function_body(parser_string, function_body_begin)
+            match_and_check_function_body(parser_string, function_body_begin, context)
         error_message.extend(function_body_error_message)
         end_pos = function_body_end
 
@@ -1273,13 +1911,16 @@ def match_and_check_destroy_from_class_decl(parser_string, start_pos):
     return match.start(), end_pos, error_message
 
 
-def match_and_check_class_impl(parser_string, start_pos):
+def match_and_check_class_impl(parser_string, start_pos, context=None):
     """
     检测类成员函数的实现
     :param parser_string: 需要解析的字符串
     :param start_pos: 从start_pos开始解析
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, error_message 开始的位置，结束的位置，错误信息
     """
+    if context is None:
+        context = FileContext()
     error_message = list()
     while True:
         match = destroy_impl_start_regex.match(parser_string, start_pos)
@@ -1295,21 +1936,24 @@ def match_and_check_class_impl(parser_string, start_pos):
             break
         return -1, -1, error_message
 
-    function_declare_end_pos = find_token_pair_by_pos(parser_string, match.end()-1, "(")
+    function_declare_end_pos = find_token_pair_by_pos(parser_string, match.end()-1, "(", context)
     function_body_begin_pos = parser_string.find("{", function_declare_end_pos)
-    FileContext.current_line = parser_string.count("\n", 0, function_body_begin_pos)+1
+    context.current_line = context.get_line_index(parser_string).line_of(function_body_begin_pos)
     function_body_start_pos, function_body_end_pos, error_message = \
-        match_and_check_function_body(parser_string, function_body_begin_pos)
+        match_and_check_function_body(parser_string, function_body_begin_pos, context)
     return start_pos, function_body_end_pos, error_message
 
 
-def match_and_check_class(parser_string, start_pos):
+def match_and_check_class(parser_string, start_pos, context=None):
     """
     从start_pos开始检测,是否符合class的语法，并且检测错误
     :param parser_string:
     :param start_pos:
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, error_message, 如果没有匹配，则返回-1, -1, []
     """
+    if context is None:
+        context = FileContext()
     error_message = list()
     match = class_declare_regex.match(parser_string, start_pos)
     if match:
@@ -1321,34 +1965,42 @@ def match_and_check_class(parser_string, start_pos):
 
     # 检测类名称规则
     class_name = match.groupdict().get("class_name")
+    class_name_start, class_name_end = match.span("class_name")
     if class_name[0:3] != "cit":
         error_message.append(
-            ErrorReport(line=FileContext.current_line,
+            ErrorReport(line=context.current_line,
                         message=CLASS_NAME_MUST_CIT_BEGIN,
-                        error_context=class_name)
+                        source=parser_string,
+                        context_start=class_name_start,
+                        context_end=class_name_end)
         )
 
     c = class_name[3]
     if not c.isupper() and not c.isdigit():
         error_message.append(
             ErrorReport(
-                line=FileContext.current_line,
+                line=context.current_line,
                 message=CLASS_NAME_3RD_MUST_UPPER,
-                error_context=class_name
+                source=parser_string,
+                context_start=class_name_start,
+                context_end=class_name_end
             )
         )
 
     try:
-        FileContext.current_parser_context = FileContext.PARSER_TYPE_CLASS
+        context.current_parser_context = FileContext.PARSER_TYPE_CLASS
         next_token_pos = next_token_pos_not_space(parser_string, match.end())
 
         # 检测类冒号前后是否有空格
         if parser_string[next_token_pos] == ":":
             if parser_string[next_token_pos-1] != " " and parser_string[next_token_pos+1] != " ":
-                error_message.append(ErrorReport(line=FileContext.current_line,
+                error_message.append(ErrorReport(line=context.current_line,
                                                  message=CLASS_INHERIT_COLON_MUST_BE_SPACE,
-                                                 error_context=parser_string[match.start(): match.end()]))
+                                                 source=parser_string,
+                                                 context_start=match.start(),
+                                                 context_end=match.end()))
         class_declare_begin = parser_string.find("{", next_token_pos)
+        line_index = context.get_line_index(parser_string)
 
         old_class_start_pos = class_declare_begin
         class_start_pos = class_declare_begin+1
@@ -1359,88 +2011,101 @@ def match_and_check_class(parser_string, start_pos):
             if parser_string[class_start_pos] == ";":
                 class_start_pos += 1
                 continue
-            logging.debug("开始匹配:" + parser_string[class_start_pos:next_line_break_pos(parser_string, class_start_pos)])
-            FileContext.current_line = parser_string.count("\n", 0, class_start_pos)+1
+            context.check_deadline(class_start_pos)
+            context.current_line = line_index.line_of(class_start_pos)
 
+            candidates = class_matcher_dispatch.candidates(parser_string, class_start_pos)
             # 开始匹配public等修饰符
-            access_start, access_end = match_class_access(parser_string, class_start_pos)
-            if access_start != -1:
-                class_start_pos = access_end + 1
-                continue
+            if "access" in candidates:
+                access_start, access_end = match_class_access(parser_string, class_start_pos, context)
+                if access_start != -1:
+                    class_start_pos = access_end + 1
+                    continue
 
             # 匹配友元函数声明
-            friend_start, friend_end = match_friend_declare(parser_string, class_start_pos)
-            if friend_start != -1:
-                class_start_pos = friend_end + 1
-                continue
+            if "friend" in candidates:
+                friend_start, friend_end = match_friend_declare(parser_string, class_start_pos, context)
+                if friend_start != -1:
+                    class_start_pos = friend_end + 1
+                    continue
 
             # 匹配枚举
-            enum_stat_start, enum_stat_end = match_stat(parser_string, class_start_pos, enum_stat_regex)
-            if enum_stat_start != -1:
-                class_start_pos = enum_stat_end+1
-                continue
+            if "enum" in candidates:
+                enum_stat_start, enum_stat_end = match_stat(parser_string, class_start_pos, enum_stat_regex, None, context)
+                if enum_stat_start != -1:
+                    class_start_pos = enum_stat_end+1
+                    continue
 
             # 匹配q_property
-            q_property_stat_start, q_property_stat_end = match_stat(parser_string, class_start_pos, qproperty_stat_regex)
-            if q_property_stat_start != -1:
-                class_start_pos = q_property_stat_end+1
-                continue
+            if "qproperty" in candidates:
+                q_property_stat_start, q_property_stat_end = match_stat(parser_string, class_start_pos,
+                                                                        qproperty_stat_regex, None, context)
+                if q_property_stat_start != -1:
+                    class_start_pos = q_property_stat_end+1
+                    continue
 
             # 匹配define
-            class_start_pos, is_continue = helper_match_and_check(error_message,
-                                                                  parser_string,
-                                                                  class_start_pos,
-                                                                  match_and_check_define)
-            if is_continue:
-                continue
+            if "define" in candidates:
+                class_start_pos, is_continue = helper_match_and_check(error_message,
+                                                                      parser_string,
+                                                                      class_start_pos,
+                                                                      match_and_check_define, context)
+                if is_continue:
+                    continue
 
             # 匹配Q_OBJECT
-            class_start_pos, is_continue = helper_match_and_check(error_message,
-                                                                  parser_string,
-                                                                  class_start_pos,
-                                                                  match_and_check_qobject)
-            if is_continue:
-                continue
+            if "qobject" in candidates:
+                class_start_pos, is_continue = helper_match_and_check(error_message,
+                                                                      parser_string,
+                                                                      class_start_pos,
+                                                                      match_and_check_qobject, context)
+                if is_continue:
+                    continue
 
             # 匹配析构函数
-            class_start_pos, is_continue = helper_match_and_check(error_message,
-                                                                  parser_string,
-                                                                  class_start_pos,
-                                                                  match_and_check_destroy_from_class_decl)
-            if is_continue:
-                continue
+            if "destroy" in candidates:
+                class_start_pos, is_continue = helper_match_and_check(error_message,
+                                                                      parser_string,
+                                                                      class_start_pos,
+                                                                      match_and_check_destroy_from_class_decl, context)
+                if is_continue:
+                    continue
 
             # 匹配构造函数
-            class_start_pos, is_continue = helper_match_and_check(error_message,
-                                                                  parser_string,
-                                                                  class_start_pos,
-                                                                  match_and_check_construct_from_class_decl)
-            if is_continue:
-                continue
+            if "construct" in candidates:
+                class_start_pos, is_continue = helper_match_and_check(error_message,
+                                                                      parser_string,
+                                                                      class_start_pos,
+                                                                      match_and_check_construct_from_class_decl, context)
+                if is_continue:
+                    continue
 
             # 匹配函数声明
-            class_start_pos, is_continue = helper_match_and_check(error_message,
-                                                                  parser_string,
-                                                                  class_start_pos,
-                                                                  match_and_check_class_declare_function)
-            if is_continue:
-                continue
+            if "function" in candidates:
+                class_start_pos, is_continue = helper_match_and_check(error_message,
+                                                                      parser_string,
+                                                                      class_start_pos,
+                                                                      match_and_check_class_declare_function, context)
+                if is_continue:
+                    continue
 
             # 匹配typedef语句
-            class_start_pos, is_continue = helper_match_and_check(error_message,
-                                                                  parser_string,
-                                                                  class_start_pos,
-                                                                  match_and_check_typedef)
-            if is_continue:
-                continue
+            if "typedef" in candidates:
+                class_start_pos, is_continue = helper_match_and_check(error_message,
+                                                                      parser_string,
+                                                                      class_start_pos,
+                                                                      match_and_check_typedef, context)
+                if is_continue:
+                    continue
 
             # 匹配类成员变量声明
-            class_start_pos, is_continue = helper_match_and_check(error_message,
-                                                                  parser_string,
-                                                                  class_start_pos,
-                                                                  match_and_check_class_var)
-            if is_continue:
-                continue
+            if "var" in candidates:
+                class_start_pos, is_continue = helper_match_and_check(error_message,
+                                                                      parser_string,
+                                                                      class_start_pos,
+                                                                      match_and_check_class_var, context)
+                if is_continue:
+                    continue
 
             # 检测类是否结束
             if parser_string[class_start_pos:class_start_pos+2] == "};":
@@ -1453,16 +2118,19 @@ def match_and_check_class(parser_string, start_pos):
             if len(parser_string) <= class_start_pos:
                 break
     finally:
-        FileContext.current_parser_context = FileContext.PARSER_TYPE_FILE
+        context.current_parser_context = FileContext.PARSER_TYPE_FILE
 
 
-def match_and_check_define(parser_string, start_pos):
+def match_and_check_define(parser_string, start_pos, context=None):
     """
     从start_pos开始检测,是否符合define语法，并且检测错误
     :param parser_string: 需要解析的语句
     :param start_pos: 开始的位置,
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, error_message,如果没有匹配，则返回-1, -1, []
     """
+    if context is None:
+        context = FileContext()
 
     # 匹配宏定义的开始
     error_message = list()
@@ -1477,16 +2145,19 @@ def match_and_check_define(parser_string, start_pos):
     define_name_regex = re.compile("(\w+)(\(.+?\))?")
     define_name_match = define_name_regex.match(parser_string, define_name_begin_pos)
     assert define_name_match is not None
-    define_name = parser_string[define_name_match.start():define_name_match.end()]
+    define_name_start, define_name_end = define_name_match.start(), define_name_match.end()
+    define_name = parser_string[define_name_start:define_name_end]
 
     # 开始检测规则
     while True:
         if define_name[0:4] != "CIT_":
             error_message.append(
                 ErrorReport(
-                    line=FileContext.current_line,
+                    line=context.current_line,
                     message=DEFINE_BEGIN_PREFIX_MUST_BE_CIT,
-                    error_context=define_name
+                    source=parser_string,
+                    context_start=define_name_start,
+                    context_end=define_name_end
                 )
             )
             break
@@ -1496,9 +2167,11 @@ def match_and_check_define(parser_string, start_pos):
                 if not c.isupper():
                     error_message.append(
                         ErrorReport(
-                            line=FileContext.current_line,
+                            line=context.current_line,
                             message=DEFINE_MUST_BE_UPPER,
-                            error_context=define_name
+                            source=parser_string,
+                            context_start=define_name_start,
+                            context_end=define_name_end
                         )
                     )
                     break
@@ -1522,45 +2195,53 @@ def match_and_check_define(parser_string, start_pos):
     return match.start(), next_line_break, error_message
 
 
-def match_and_check_enum(parser_string, start_pos):
+def match_and_check_enum(parser_string, start_pos, context=None):
     """
     从start_pos开始,找到枚举相关的字符串, 并且检测错误
     :param parser_string: 分析的字符串
     :param start_pos: 开始的位置
+    :param context: 文件的检测上下文FileContext
     :return: 如果找到，则返回enum的起始和结束位置，并且报告错误的list()，否则返回-1, -1, []
     """
+    if context is None:
+        context = FileContext()
     error_message = list()
 
     match = enum_stat_regex.match(parser_string, start_pos)
     if match is None:
         return -1, -1, error_message
 
-    if FileContext.current_parser_context == FileContext.PARSER_TYPE_FILE:
-        error_message.append(ErrorReport(line=FileContext.current_line,
+    if context.current_parser_context == FileContext.PARSER_TYPE_FILE:
+        error_message.append(ErrorReport(line=context.current_line,
                                          message=ENUM_USE_CIT_BEGIN_ENUM))
 
     return match.start(), match.end()-1, error_message
 
 
-def match_and_check_include(parser_string, start_pos):
+def match_and_check_include(parser_string, start_pos, context=None):
     """
     检测include的顺序
     :param parser_string:
     :param start_pos:
+    :param context: 文件的检测上下文FileContext
     :return: start_pos, end_pos, error_message
     """
+    if context is None:
+        context = FileContext()
     error_message = list()
 
     while True:
         # 检测include系统库，如果之前已经include 自己的库，则会报错
         match = system_include_regex.match(parser_string, start_pos)
         if match:
-            if FileContext.include_system_end:
+            if context.include_system_end:
                 error_message.append(
                     ErrorReport(
-                        line=FileContext.current_line,
+                        line=context.current_line,
                         message=SYSTEM_INCLUDE_AFTER_SELF_INCLUDE,
-                        error_context=parser_string[match.start(): match.end()]
+                        source=parser_string,
+                        context_start=match.start(),
+                        context_end=match.end()
                     )
                 )
             break
@@ -1576,24 +2257,25 @@ def match_and_check_include(parser_string, start_pos):
         else:
             include_name = include_file_name
 
-        if FileContext.current_file_name.find(".") != -1:
-            current_file_name, current_file_ext = os.path.splitext(FileContext.current_file_name)
+        if context.current_file_name.find(".") != -1:
+            current_file_name, current_file_ext = os.path.splitext(context.current_file_name)
         else:
-            current_file_name = FileContext.current_file_name
+            current_file_name = context.current_file_name
 
         if current_file_name.lower() == include_name.lower():
             break
-        FileContext.include_system_end = True
+        context.include_system_end = True
         break
 
     return match.start(), match.end()-1, error_message
 
 
-def match_while_stat(parser_string, start_pos):
+def match_while_stat(parser_string, start_pos, context=None):
     """
     从start_pos开始检测,是否符合while语句的语法，如果符合，则返回整个while语句的作用域(指的是{}这个里面，或者while语句的下一句)
     :param parser_string: 需要解析的语句
     :param start_pos: 开始的位置,
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, 如果没有匹配，则都返回-1
     """
     match = while_match_regex.match(parser_string, start_pos)
@@ -1603,17 +2285,18 @@ def match_while_stat(parser_string, start_pos):
     token_parser = TokenParser(parser_string, match.end()-1)
     token_parser.next_token()
     if token_parser.current_token() == "{":
-        end_while_pos = find_token_pair_by_pos(parser_string, token_parser.current_token_end_pos()-1, "{")
+        end_while_pos = find_token_pair_by_pos(parser_string, token_parser.current_token_end_pos()-1, "{", context)
     else:
         end_while_pos = parser_string.find(";", match.end())
 
     return match.start(), end_while_pos
 
-def match_switch_stat(parser_string, start_pos):
+def match_switch_stat(parser_string, start_pos, context=None):
     """
     从start_pos开始检测,是否符合switch语句的语法，如果符合，则返回整个switch语句的作用域(指的是{}这个里面，或者switch语句的下一句)
     :param parser_string: 需要解析的语句
     :param start_pos: 开始的位置,
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, 如果没有匹配，则都返回-1
     """
     match = switch_match_regex.match(parser_string, start_pos)
@@ -1623,18 +2306,19 @@ def match_switch_stat(parser_string, start_pos):
     token_parser = TokenParser(parser_string, match.end()-1)
     token_parser.next_token()
     if token_parser.current_token() == "{":
-        end_switch_pos = find_token_pair_by_pos(parser_string, token_parser.current_token_end_pos()-1, "{")
+        end_switch_pos = find_token_pair_by_pos(parser_string, token_parser.current_token_end_pos()-1, "{", context)
     else:
         end_switch_pos = parser_string.find(";", match.end())
 
     return match.start(), end_switch_pos
 
 
-def match_prec_stat(parser_string, start_pos):
+def match_prec_stat(parser_string, start_pos, context=None):
     """
     匹配#ifdef #endi #if等预编译指令
     :param parser_string:
     :param start_pos:
+    :param context: 文件的检测上下文FileContext, 只用来传递匹配函数的钩子
     :return: stat_start, stat_end, 语句开始和结束的位置，如果没有的话，则返回-1, -1
     """
     ifdef_regex = re.compile("#ifdef")
@@ -1660,13 +2344,14 @@ def match_prec_stat(parser_string, start_pos):
     return match.start(), end_pos
 
 
-def match_do_while_stat(parser_string, start_pos):
+def match_do_while_stat(parser_string, start_pos, context=None):
     """
     从start_pos开始检测,是否符合do..while语句的语法，
     如果符合，
     则返回整个do..while语句的作用域(指的是{}这个里面，或者if语句的下一句)
     :param parser_string: 需要解析的语句
     :param start_pos: 开始的位置,
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, 如果没有匹配，则都返回-1
     """
     match = do_while_stat_regex.match(parser_string, start_pos)
@@ -1677,7 +2362,7 @@ def match_do_while_stat(parser_string, start_pos):
     token_parser.next_token()
 
     assert token_parser.current_token() == "{"
-    do_while_end_pos = find_token_pair_by_pos(parser_string, token_parser.current_token_end_pos()-1, "{")
+    do_while_end_pos = find_token_pair_by_pos(parser_string, token_parser.current_token_end_pos()-1, "{", context)
     assert parser_string[do_while_end_pos] == "}"
 
     token_parser = TokenParser(parser_string, do_while_end_pos+1)
@@ -1689,29 +2374,31 @@ def match_do_while_stat(parser_string, start_pos):
     return match.start(), do_while_end_pos
 
 
-def match_foreach_stat(parser_string, start_pos):
+def match_foreach_stat(parser_string, start_pos, context=None):
     """
     从start_pos开始检测,是否符合for语句的语法，如果符合，则返回整个for语句的作用域(指的是{}这个里面，或者if语句的下一句)
     :param parser_string: 需要解析的语句
     :param start_pos: 开始的位置,
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, 如果没有匹配，则都返回-1
     """
     match = foreach_stat_regex.match(parser_string, start_pos)
     if match is None:
         return -1, -1
 
-    for_each_end_pos = find_token_pair_by_pos(parser_string, match.end()-1, "(")
+    for_each_end_pos = find_token_pair_by_pos(parser_string, match.end()-1, "(", context)
     foreach_body_begin_pos = parser_string.find("{", for_each_end_pos+1)
-    body_end_pos = find_token_pair_by_pos(parser_string, foreach_body_begin_pos, "{")
+    body_end_pos = find_token_pair_by_pos(parser_string, foreach_body_begin_pos, "{", context)
     return start_pos, body_end_pos
 
 
 
-def match_for_stat(parser_string, start_pos):
+def match_for_stat(parser_string, start_pos, context=None):
     """
     从start_pos开始检测,是否符合for语句的语法，如果符合，则返回整个for语句的作用域(指的是{}这个里面，或者if语句的下一句)
     :param parser_string: 需要解析的语句
     :param start_pos: 开始的位置,
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, 如果没有匹配，则都返回-1
     """
     match = for_match_regex.match(parser_string, start_pos)
@@ -1721,7 +2408,7 @@ def match_for_stat(parser_string, start_pos):
     token_parser = TokenParser(parser_string, match.end()-1)
     token_parser.next_token()
     if token_parser.current_token() == "{":
-        pos = find_token_pair_by_pos(parser_string, token_parser.current_token_end_pos()-1, "{")
+        pos = find_token_pair_by_pos(parser_string, token_parser.current_token_end_pos()-1, "{", context)
         assert pos != -1
         return match.start(), pos
     else:
@@ -1730,24 +2417,25 @@ def match_for_stat(parser_string, start_pos):
     return match.start(), pos
 
 
-def match_if_stat(parser_string, start_pos):
+def match_if_stat(parser_string, start_pos, context=None):
     """
     从start_pos开始检测,是否符合if语句的语法，如果符合，则返回整个if语句的作用域(指的是{}这个里面，或者if语句的下一句)
     :param parser_string: 需要解析的语句
     :param start_pos: 开始的位置,
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end, 如果没有匹配，则都返回-1
     """
     match = if_match_regex.match(parser_string, start_pos)
     if match is None:
         return -1, -1
 
-    body_begin_pos = find_token_pair_by_pos(parser_string, match.end()-1, "(")
+    body_begin_pos = find_token_pair_by_pos(parser_string, match.end()-1, "(", context)
     assert body_begin_pos != -1
 
     token_parser = TokenParser(parser_string, body_begin_pos+1)
     token_parser.next_token()
     if token_parser.current_token() == "{":
-        if_stat_end_pos = find_token_pair_by_pos(parser_string, token_parser.current_token_end_pos() - 1, "{")
+        if_stat_end_pos = find_token_pair_by_pos(parser_string, token_parser.current_token_end_pos() - 1, "{", context)
         assert if_stat_end_pos != -1
     else:
         if_stat_end_pos = parser_string.find(";", match.end())
@@ -1765,12 +2453,12 @@ def match_if_stat(parser_string, start_pos):
                 assert token_parser.current_token() == "("
                 condition_end = find_token_pair_by_pos(parser_string,
                                                        token_parser.current_token_end_pos()-1,
-                                                       "(")
+                                                       "(", context)
                 token_parser = TokenParser(parser_string, condition_end+1)
                 token_parser.next_token()
 
             if token_parser.current_token() == "{":
-                if_stat_end_pos = find_token_pair_by_pos(parser_string, token_parser.current_token_end_pos() - 1, "{")
+                if_stat_end_pos = find_token_pair_by_pos(parser_string, token_parser.current_token_end_pos() - 1, "{", context)
                 assert if_stat_end_pos != -1
             else:
                 if_stat_end_pos = parser_string.find(";", token_parser.current_token_end_pos())
@@ -1780,16 +2468,17 @@ def match_if_stat(parser_string, start_pos):
     return match.start(), if_stat_end_pos
 
 
-def helper_match_and_check(all_error_message, parser_string, start_pos, match_and_check_func):
+def helper_match_and_check(all_error_message, parser_string, start_pos, match_and_check_func, context=None):
     """
     检测语法规则的辅助函数
     :param all_error_message:        所有的错误，调用match_and_check_func后有错误，则会添加到这里面
     :param start_pos:                开始的位置
     :param match_and_check_func:    检测的函数
     :param parser_string:           解析的数据
+    :param context:                 文件的检测上下文FileContext
     :return: start_pos, is_continue 所有的错误，下一次起始的位置, 是否continue
     """
-    match_start_pos, match_end_pos, error_message = match_and_check_func(parser_string, start_pos)
+    match_start_pos, match_end_pos, error_message = match_and_check_func(parser_string, start_pos, context)
     if match_start_pos != -1:
         start_pos = match_end_pos+1
         if len(error_message):
@@ -1799,11 +2488,12 @@ def helper_match_and_check(all_error_message, parser_string, start_pos, match_an
     return start_pos, False
 
 
-def match_static_init(parser_string, start_pos):
+def match_static_init(parser_string, start_pos, context=None):
     """
     好看是否符合静态变量初始化的语句
     :param parser_string:
     :param start_pos:
+    :param context: 文件的检测上下文FileContext, 只用来传递匹配函数的钩子
     :return: start_pos, end_pos
     """
 
@@ -1815,163 +2505,174 @@ def match_static_init(parser_string, start_pos):
     return start_pos, end_pos
 
 
-def match_and_check(parser_string, start_pos):
+def match_and_check(parser_string, start_pos, context=None):
     """
     检测语法规则
     :param parser_string: 解析的数据
     :param start_pos: 起始位置
+    :param context: 文件的检测上下文FileContext, 超过context的检测时间限制会抛出LintTimeout,
+                    已经检测出的错误保存在context.error_message里面
     :return: error_message  解析出来的异常信息
     """
+    if context is None:
+        context = FileContext()
+    error_message = context.error_message = list()
+    for er in iter_match_and_check(parser_string, start_pos, context):
+        error_message.append(er)
+    return error_message
+
+
+def iter_match_and_check(parser_string, start_pos, context=None):
+    """
+    检测语法规则,每检测完一条语句就返回这条语句里面检测出的错误
+    :param parser_string: 解析的数据
+    :param start_pos: 起始位置
+    :param context: 文件的检测上下文FileContext, 超过context的检测时间限制会抛出LintTimeout
+    :return: 生成器, 逐个返回检测出的ErrorReport
+    """
+    if context is None:
+        context = FileContext()
     all_error_message = list()
+    line_index = context.get_line_index(parser_string)
     old_pos = start_pos-1
     while True:
-        logging.debug("---------------------------------------")
+        if all_error_message:
+            yield from all_error_message
+            del all_error_message[:]
+
         start_pos = next_token_pos_not_space(parser_string, start_pos)
-        message_end = next_line_break_pos(parser_string, start_pos)
-        logging.debug("开始匹配:" + parser_string[start_pos:message_end] )
         if start_pos == -1:
             break
         assert start_pos > old_pos
-        FileContext.current_line = parser_string.count("\n", 0, start_pos)+1
+        context.check_deadline(start_pos)
+        context.current_line = line_index.line_of(start_pos)
 
         old_pos = start_pos
 
         if start_pos == -1:
             break
 
-        logging.debug("开始匹配#define")
-        start_pos, is_continue = helper_match_and_check(all_error_message,
-                                                        parser_string,
-                                                        start_pos,
-                                                        match_and_check_define)
-        if is_continue:
-            logging.debug("处理#define")
-            continue
-
-        logging.debug("开始匹配枚举")
-        start_pos, is_continue = helper_match_and_check(all_error_message,
-                                                        parser_string,
-                                                        start_pos,
-                                                        match_and_check_enum)
-        if is_continue:
-            logging.debug("处理枚举")
-            continue
+        candidates = file_matcher_dispatch.candidates(parser_string, start_pos)
+        if "define" in candidates:
+            start_pos, is_continue = helper_match_and_check(all_error_message,
+                                                            parser_string,
+                                                            start_pos,
+                                                            match_and_check_define, context)
+            if is_continue:
+                continue
 
-        logging.debug("开始匹配#include语句")
-        start_pos, is_continue = helper_match_and_check(all_error_message,
-                                                        parser_string,
-                                                        start_pos,
-                                                        match_and_check_include)
-        if is_continue:
-            logging.debug("处理#include")
-            continue
+        if "enum" in candidates:
+            start_pos, is_continue = helper_match_and_check(all_error_message,
+                                                            parser_string,
+                                                            start_pos,
+                                                            match_and_check_enum, context)
+            if is_continue:
+                continue
 
-        logging.debug("开始匹配typedef")
-        start_pos, is_continue = helper_match_and_check(all_error_message,
-                                                        parser_string,
-                                                        start_pos,
-                                                        match_and_check_typedef)
-        if is_continue:
-            logging.debug("处理typedef")
-            continue
+        if "include" in candidates:
+            start_pos, is_continue = helper_match_and_check(all_error_message,
+                                                            parser_string,
+                                                            start_pos,
+                                                            match_and_check_include, context)
+            if is_continue:
+                continue
 
-        logging.debug("匹配class")
-        start_pos, is_continue = helper_match_and_check(all_error_message,
-                                                        parser_string,
-                                                        start_pos,
-                                                        match_and_check_class)
-        if is_continue:
-            logging.debug("处理class完毕")
-            continue
+        if "typedef" in candidates:
+            start_pos, is_continue = helper_match_and_check(all_error_message,
+                                                            parser_string,
+                                                            start_pos,
+                                                            match_and_check_typedef, context)
+            if is_continue:
+                continue
 
-        logging.debug("匹配函数实现")
-        start_pos, is_continue = helper_match_and_check(all_error_message,
-                                                        parser_string,
-                                                        start_pos,
-                                                        match_and_check_class_impl)
+        if "class" in candidates:
+            start_pos, is_continue = helper_match_and_check(all_error_message,
+                                                            parser_string,
+                                                            start_pos,
+                                                            match_and_check_class, context)
+            if is_continue:
+                continue
 
-        if is_continue:
-            logging.debug("处理函数实现完毕")
-            continue
+        if "class_impl" in candidates:
+            start_pos, is_continue = helper_match_and_check(all_error_message,
+                                                            parser_string,
+                                                            start_pos,
+                                                            match_and_check_class_impl, context)
+            if is_continue:
+                continue
 
         # 预处理的语句直接跳到下一行去，不进行处理
-        prec_start_pos, prec_end_pos = match_prec_stat(parser_string, start_pos)
-        if prec_start_pos != -1:
-            start_pos = prec_end_pos+1
-            logging.debug("处理预处理语句:" + parser_string[prec_start_pos:prec_end_pos+1])
-            continue
+        if "prec" in candidates:
+            prec_start_pos, prec_end_pos = match_prec_stat(parser_string, start_pos, context)
+            if prec_start_pos != -1:
+                start_pos = prec_end_pos+1
+                continue
 
-        logging.debug("匹配CIT_BEGIN_ENUM")
         # cit begin enum 直接跳到尾部
-        cit_begin_enum_start_pos, cit_end_enum_end_pos = match_stat(parser_string, start_pos, cit_begin_enum_regex)
-        if cit_begin_enum_start_pos != -1:
-            start_pos = cit_end_enum_end_pos+1
-            logging.debug("处理CIT_BEGIN_ENUM" + parser_string[cit_begin_enum_start_pos:cit_end_enum_end_pos])
-            continue
+        if "cit_begin_enum" in candidates:
+            cit_begin_enum_start_pos, cit_end_enum_end_pos = match_stat(parser_string, start_pos,
+                                                                        cit_begin_enum_regex, None, context)
+            if cit_begin_enum_start_pos != -1:
+                start_pos = cit_end_enum_end_pos+1
+                continue
 
         # using namespace 直接跳过
-        logging.debug("开始匹配using namespace")
-        using_start_pos, using_end_pos = match_using_namespace(parser_string, start_pos)
-        if using_start_pos != -1:
-            start_pos = using_end_pos+1
-            logging.debug("处理namespace" + parser_string[using_start_pos:using_end_pos])
-            continue
+        if "using" in candidates:
+            using_start_pos, using_end_pos = match_using_namespace(parser_string, start_pos, context)
+            if using_start_pos != -1:
+                start_pos = using_end_pos+1
+                continue
 
-        logging.debug("开始匹配struct")
-        struct_start_pos, struct_end_pos = match_struct(parser_string, start_pos)
-        if struct_start_pos != -1:
-            logging.debug("处理struct语句")
-            start_pos = struct_end_pos+1
-            continue
+        if "struct" in candidates:
+            struct_start_pos, struct_end_pos = match_struct(parser_string, start_pos, context)
+            if struct_start_pos != -1:
+                start_pos = struct_end_pos+1
+                continue
 
-        logging.debug("匹配静态成员变量初始化")
-        static_init_start_pos, static_init_end_pos = match_static_init(parser_string, start_pos)
-        if static_init_start_pos != -1:
-            logging.debug("处理静态成员变量初始化")
-            start_pos = static_init_end_pos+1
-            continue
+        if "static_init" in candidates:
+            static_init_start_pos, static_init_end_pos = match_static_init(parser_string, start_pos, context)
+            if static_init_start_pos != -1:
+                start_pos = static_init_end_pos+1
+                continue
 
         '''
         # 匹配宏定义的函数调用
-        logging.debug("匹配宏定义函数调用")
         macro_call_start_pos, marco_call_end_pos = match_marco_call(parser_string, start_pos)
         if macro_call_start_pos != -1:
-            logging.debug("处理宏定义函数调用")
             start_pos = macro_call_start_pos + 1
             continue
         '''
 
-        logging.debug("匹配普通函数")
-        start_pos, is_continue = helper_match_and_check(all_error_message,
-                                                        parser_string,
-                                                        start_pos,
-                                                        match_and_check_function)
-        if is_continue:
-            logging.debug("处理普通函数结束")
-            continue
+        if "function" in candidates:
+            start_pos, is_continue = helper_match_and_check(all_error_message,
+                                                            parser_string,
+                                                            start_pos,
+                                                            match_and_check_function, context)
+            if is_continue:
+                continue
 
-        logging.debug("开始匹配变量")
-        start_pos, is_continue = helper_match_and_check(all_error_message,
-                                                        parser_string,
-                                                        start_pos,
-                                                        match_and_check_var)
-        if is_continue:
-            continue
+        if "var" in candidates:
+            start_pos, is_continue = helper_match_and_check(all_error_message,
+                                                            parser_string,
+                                                            start_pos,
+                                                            match_and_check_var, context)
+            if is_continue:
+                continue
 
         old_start_pos = start_pos
         start_pos = next_line_break_pos(parser_string, start_pos)
         if len(parser_string) <= start_pos:
             break
 
-        logging.debug("未知的代码，开始下一行匹配:" + parser_string[old_start_pos:start_pos])
-    return all_error_message
+    yield from all_error_message
 
 
-def match_struct(parser_string, start_pos):
+def match_struct(parser_string, start_pos, context=None):
     """
     解析struct语句
     :param parser_string:
     :param start_pos:
+    :param context: 文件的检测上下文FileContext
     :return: stat_start, stat_end
     """
     match = struct_regex.match(parser_string, start_pos)
@@ -1979,44 +2680,71 @@ def match_struct(parser_string, start_pos):
         return -1, -1
 
     assert parser_string[match.end()-1] == "{"
-    struct_end_pos = find_token_pair_by_pos(parser_string, match.end()-1, "{")
+    struct_end_pos = find_token_pair_by_pos(parser_string, match.end()-1, "{", context)
     assert struct_end_pos != -1
     struct_end_pos = parser_string.find(";", struct_end_pos+1)
     assert parser_string[struct_end_pos] == ";"
     return match.start(), struct_end_pos
 
 
-def remove_comment(parser_string):
+# 删除注释和关键字使用的正则表达式缓存, key是需要删除的关键字
+strip_regex_cache = dict()
+
+
+def get_strip_regex(keys):
     """
-    删除注释相关的文本
+    获取删除注释和关键字的正则表达式,keys相同的正则表达式只编译一次
+    :param keys: 需要删除的关键字,关键字后面需要跟着空白字符才会删除
+    :return: 编译后的正则表达式
+    """
+    regex = strip_regex_cache.get(keys)
+    if regex is None:
+        regex_str = comment_and_literal_regex_str
+        if len(keys):
+            regex_str += r"|(?P<key>(?:" + "|".join(keys) + r")(?=\s))"
+        regex = re.compile(regex_str)
+        strip_regex_cache[keys] = regex
+    return regex
+
+
+def strip_comment_and_key(parser_string, keys=(), strip_comment=True):
+    """
+    遍历一次文本,删除注释和指定的关键字,字符串和字符常量里面的内容不做处理.
+    删除多行注释的时候会保留注释里面的换行,保证删除后每一行的行号不变
     :param parser_string: 需要处理的文本
-    :return:  删除注释完毕后的文本
+    :param keys: 需要删除的关键字
+    :param strip_comment: 是否删除注释
+    :return: 处理完毕后的文本
     """
-    while True:
-        search = one_line_comment_regex.search(parser_string)
-        if search is None:
-            break
+    regex = get_strip_regex(tuple(keys))
+    pieces = list()
+    last_pos = 0
+    for match in regex.finditer(parser_string):
+        match_type = match.lastgroup
+        if match_type == "literal":
+            continue
+        if match_type != "key" and not strip_comment:
+            continue
 
-        comment_begin_pos = search.start(0)
-        comment_end_pos = search.end(0)
-        parser_string = parser_string[0:comment_begin_pos] + parser_string[comment_end_pos:]
+        pieces.append(parser_string[last_pos:match.start()])
+        if match_type == "block_comment":
+            pieces.append("\n" * parser_string.count("\n", match.start(), match.end()))
+        last_pos = match.end()
 
-    # 删除多行的时候,会在中间插入对应行数的换行,方便统计准备行数
-    while True:
-        search = mul_line_comment_regex.search(parser_string)
-        if search is None:
-            break
+    if last_pos == 0:
+        return parser_string
 
-        comment_begin_pos = search.start(0)
-        comment_end_pos = search.end(0)
-        line_break_count = parser_string.count("\n", comment_begin_pos, comment_end_pos)
-        replace_str = ""
-        for x in range(0, line_break_count):
-            replace_str += "\n"
+    pieces.append(parser_string[last_pos:])
+    return "".join(pieces)
 
-        parser_string = parser_string[0:comment_begin_pos] + replace_str + parser_string[comment_end_pos:]
 
-    return parser_string
+def remove_comment(parser_string):
+    """
+    删除注释相关的文本
+    :param parser_string: 需要处理的文本
+    :return:  删除注释完毕后的文本
+    """
+    return strip_comment_and_key(parser_string)
 
 
 def remove_key(parser_string, key):
@@ -2026,18 +2754,7 @@ def remove_key(parser_string, key):
     :param key:
     :return:
     """
-    key_regex = re.compile(r"\s*("+key + ")\s+")
-    while True:
-        search = key_regex.search(parser_string)
-        if search is None:
-            break
-
-        start = search.start(1)
-        end = search.end(1)
-
-        parser_string = parser_string[0:start] + parser_string[end:]
-
-    return parser_string
+    return strip_comment_and_key(parser_string, (key,), strip_comment=False)
 
 
 def remove_unnecessary_key(parser_string):
@@ -2046,8 +2763,7 @@ def remove_unnecessary_key(parser_string):
     :param parser_string:
     :return: 返回处理后的字符
     """
-    parser_string = remove_key(parser_string, r"unsigned")
-    return parser_string
+    return strip_comment_and_key(parser_string, UNNECESSARY_KEYS, strip_comment=False)
 
 
 def remove_unnecessary_data(data):
@@ -2056,50 +2772,624 @@ def remove_unnecessary_data(data):
     :param data:
     :return: 解析后的数据
     """
-    data = remove_comment(data)
-    data = remove_unnecessary_key(data)
+    return strip_comment_and_key(data, UNNECESSARY_KEYS)
+
+
+def normalize_newline(data):
+    """
+    把\r\n和\r统一转换成\n, 后面的正则表达式不需要再处理\r
+    :param data: 源代码
+    :return: 转换后的源代码
+    """
+    if "\r" in data:
+        data = data.replace("\r\n", "\n").replace("\r", "\n")
     return data
 
 
+def decode_source(raw):
+    """
+    解码源文件的字节, ASCII和UTF-8直接解码, 其他的按照GB18030解码
+    :param raw: bytes或者mmap
+    :return: 解码并且转换换行符之后的字符串
+    """
+    if isinstance(raw, bytes) and raw.isascii():
+        data = raw.decode("ascii")
+    else:
+        try:
+            data = str(raw, "utf-8-sig")
+        except UnicodeDecodeError:
+            data = str(raw, FALLBACK_ENCODING)
+    return normalize_newline(data)
+
+
+def read_file_source(file_path):
+    """
+    读取文件的原始内容, 一次读取所有的字节, 大文件使用mmap
+    :param file_path: 文件的路径
+    :return: 文件的内容, 编码错误会抛出UnicodeDecodeError
+    """
+    with open(file_path, mode="rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return decode_source(mm)
+        return decode_source(fp.read())
+
+
 def read_file_data(file_path):
     """
     读取文件解析出来的语句, 将会去除多余的文件
     :param file_path: 文件的路径
     :return:  返回去掉不需要的关键字后的数据
     """
-    with open(file_path, mode="r") as fp:
-        fp.seek(0, 2)
-        length = fp.tell()
-        fp.seek(0, 0)
-        data = fp.read(length)
-        data = remove_unnecessary_data(data)
-    return data
+    return remove_unnecessary_data(read_file_source(file_path))
+
+
+class ResultCache:
+    """
+    检测结果的磁盘缓存,以文件内容的hash和规则的版本作为key,保存检测出的ErrorReport,
+    文件内容没有变化的时候直接使用缓存的结果,不需要重新解析.
+    缓存文件先写到临时文件再替换,多个进程同时写入也不会读到不完整的文件
+    """
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size                            # 缓存的最大字节数,超过之后删除最久没有使用的缓存
+        self.rule_set_version = get_rule_set_version()
+
+    def make_key(self, file_name, data):
+        """
+        生成缓存的key,文件名会影响include的检测,所以也作为key的一部分
+        :param file_name: 文件名
+        :param data: 文件的原始内容
+        :return: key
+        """
+        sha1 = hashlib.sha1()
+        sha1.update(self.rule_set_version.encode("utf-8"))
+        sha1.update(b"\0")
+        sha1.update(file_name.encode("utf-8", "surrogatepass"))
+        sha1.update(b"\0")
+        sha1.update(data.encode("utf-8", "surrogatepass"))
+        return sha1.hexdigest()
+
+    def cache_path(self, key):
+        return os.path.join(self.cache_dir, key[0:2], key + ".json")
+
+    def get(self, key):
+        """
+        读取缓存的检测结果
+        :param key:
+        :return: 缓存的ErrorReport列表, 没有缓存则返回None
+        """
+        path = self.cache_path(key)
+        try:
+            with open(path, mode="r", encoding="utf-8") as fp:
+                records = json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            os.utime(path, None)        # 更新最后使用的时间,清理缓存的时候保留最近使用的
+        except OSError:
+            pass
+
+        return [ErrorReport(line=line, message=message, error_context=error_context)
+                for line, message, error_context in records]
+
+    def put(self, key, error_message):
+        """
+        保存检测结果
+        :param key:
+        :param error_message: 检测出的ErrorReport列表
+        """
+        path = self.cache_path(key)
+        records = [[er.line, er.message, er.error_context] for er in error_message]
+        temp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+            with os.fdopen(fd, mode="w", encoding="utf-8") as fp:
+                json.dump(records, fp, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning("写入缓存失败:" + str(e))
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def prune(self):
+        """
+        缓存超过max_size的时候,按照最后使用的时间从旧到新删除缓存,
+        同时删除写入失败残留的临时文件
+        """
+        entries = list()
+        total_size = 0
+        expire_time = time.time() - 3600
+        if not os.path.isdir(self.cache_dir):
+            return
+
+        for sub_dir in os.scandir(self.cache_dir):
+            if not sub_dir.is_dir():
+                continue
+            for entry in os.scandir(sub_dir.path):
+                try:
+                    stat = entry.stat()
+                    if entry.name.endswith(".tmp"):
+                        if stat.st_mtime < expire_time:
+                            os.remove(entry.path)
+                        continue
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        if total_size <= self.max_size:
+            return
+
+        entries.sort()
+        for mtime, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            if total_size <= self.max_size:
+                break
+
+
+def get_rule_set_version():
+    """
+    规则的版本,使用规则代码的hash,修改规则之后之前的缓存自动失效
+    :return: 版本字符串
+    """
+    with open(os.path.abspath(__file__), mode="rb") as fp:
+        return hashlib.sha1(fp.read()).hexdigest()
+
+
+class TraceEvent:
+    """
+    匹配函数的跟踪事件
+    """
+    __slots__ = ("matcher", "offset", "outcome", "end")
+
+    def __init__(self, matcher, offset, outcome, end):
+        self.matcher = matcher      # 匹配函数的名称
+        self.offset = offset        # 开始匹配的位置
+        self.outcome = outcome      # "hit" 匹配成功 "miss" 没有匹配
+        self.end = end              # 匹配成功的时候,匹配结束的位置
+
+    def __repr__(self):
+        return "TraceEvent(%s, %d, %s, %d)" % (self.matcher, self.offset, self.outcome, self.end)
+
+
+# 没有指定钩子的FileContext使用的匹配函数钩子, 由enable_trace设置
+default_matcher_hooks = ()
+
+# 安装钩子的时候被替换掉的匹配函数, 只在第一次替换的时候记录, 还原的时候使用
+hook_original_func = dict()
+
+# 安装和还原钩子的锁, 检测的线程只读取模块里面的函数, 不需要加锁
+hook_lock = threading.Lock()
+
+# 匹配的驱动函数, 返回的是错误列表而不是匹配的位置,不进行跟踪
+TRACE_EXCLUDE_FUNC = ("match_and_check", "match_and_check_function_body")
+
+
+def get_traceable_matchers():
+    """
+    获取所有可以跟踪的匹配函数的名称
+    :return: 名称的列表
+    """
+    return sorted(name for name, value in globals().items()
+                  if name.startswith("match_") and name not in TRACE_EXCLUDE_FUNC and callable(value))
+
+
+def make_hook_wrapper(name, func):
+    """
+    生成匹配函数的钩子包装函数, 从参数里面的FileContext获取钩子,
+    没有钩子的上下文直接调用匹配函数
+    :param name: 匹配函数的名称
+    :param func: 匹配函数
+    :return: 包装后的函数
+    """
+    @functools.wraps(func)
+    def hook_wrapper(parser_string, start_pos, *args, **kwargs):
+        context = kwargs.get("context", args[-1] if len(args) else None)
+        hooks = context.matcher_hooks if isinstance(context, FileContext) else default_matcher_hooks
+        if not len(hooks):
+            return func(parser_string, start_pos, *args, **kwargs)
+
+        begin = time.perf_counter()
+        result = func(parser_string, start_pos, *args, **kwargs)
+        elapsed = time.perf_counter() - begin
+        for hook in hooks:
+            hook.on_matcher(name, start_pos, result, elapsed)
+        return result
+    return hook_wrapper
+
+
+def install_matcher_hooks():
+    """
+    把模块里面的匹配函数替换成钩子包装函数, 已经替换过则不重复替换,
+    没有安装钩子的时候匹配的代码里面没有任何额外的开销
+    """
+    with hook_lock:
+        module_globals = globals()
+        for name in get_traceable_matchers():
+            if name not in hook_original_func:
+                hook_original_func[name] = module_globals[name]
+                module_globals[name] = make_hook_wrapper(name, module_globals[name])
+
+
+def uninstall_matcher_hooks():
+    """
+    还原被替换的匹配函数
+    """
+    with hook_lock:
+        module_globals = globals()
+        for name, func in hook_original_func.items():
+            module_globals[name] = func
+        hook_original_func.clear()
+
+
+def set_default_matcher_hooks(hooks):
+    """
+    设置之后新建的FileContext默认使用的钩子, 有钩子的时候安装钩子包装函数, 没有则还原匹配函数.
+    已经在检测的文件不受影响
+    :param hooks: 钩子的tuple
+    """
+    global default_matcher_hooks
+    default_matcher_hooks = tuple(hooks)
+    if len(default_matcher_hooks):
+        install_matcher_hooks()
+    else:
+        uninstall_matcher_hooks()
+
+
+class MatcherTrace:
+    """
+    匹配函数的跟踪钩子, 每次调用需要跟踪的匹配函数都会发送一个TraceEvent
+    """
+    def __init__(self, sink=None, matchers=None):
+        """
+        :param sink: 接收TraceEvent的函数, 为None则输出到logging.debug
+        :param matchers: 需要跟踪的匹配函数名称的列表, 为None则跟踪所有的匹配函数
+        """
+        traceable = get_traceable_matchers()
+        if matchers is None:
+            matchers = traceable
+        for name in matchers:
+            if name not in traceable:
+                raise ValueError("无法跟踪的匹配函数:" + name)
+        self.sink = sink if sink is not None else log_trace_event
+        self.matchers = frozenset(matchers)
+
+    def on_matcher(self, name, start_pos, result, elapsed):
+        if name in self.matchers:
+            self.sink(TraceEvent(name, start_pos, "miss" if result[0] == -1 else "hit", result[1]))
+
+
+def log_trace_event(event):
+    """
+    默认的跟踪输出, 输出到logging.debug
+    :param event: TraceEvent
+    """
+    logging.debug("%s offset=%d %s end=%d", event.matcher, event.offset, event.outcome, event.end)
+
+
+def enable_trace(sink=None, matchers=None):
+    """
+    开启匹配函数的跟踪, 之后新建的FileContext默认都使用这个跟踪钩子,
+    只跟踪一个文件的时候可以直接把MatcherTrace设置到FileContext.matcher_hooks, 再调用install_matcher_hooks
+    :param sink: 接收TraceEvent的函数, 为None则输出到logging.debug
+    :param matchers: 需要跟踪的匹配函数名称的列表, 为None则跟踪所有的匹配函数
+    :return: MatcherTrace
+    """
+    trace = MatcherTrace(sink, matchers)
+    set_default_matcher_hooks([hook for hook in default_matcher_hooks if not isinstance(hook, MatcherTrace)] + [trace])
+    return trace
+
+
+def disable_trace():
+    """
+    关闭匹配函数的跟踪, 没有其他钩子的时候还原被替换的匹配函数
+    """
+    set_default_matcher_hooks([hook for hook in default_matcher_hooks if not isinstance(hook, MatcherTrace)])
+
+
+class ProfileCounter:
+    """
+    匹配函数或者正则表达式的调用统计
+    """
+    __slots__ = ("name", "kind", "calls", "hits", "total_time")
+
+    def __init__(self, name, kind):
+        self.name = name            # 匹配函数或者正则表达式的变量名称
+        self.kind = kind            # "matcher" 匹配函数 "regex" 正则表达式
+        self.calls = 0
+        self.hits = 0
+        self.total_time = 0.0       # 累计的时间,单位为秒,包括内部调用其他匹配函数的时间
+
+    @property
+    def misses(self):
+        return self.calls - self.hits
+
+    def __repr__(self):
+        return "ProfileCounter(%s, %s, calls=%d, hits=%d, total_time=%f)" % \
+               (self.name, self.kind, self.calls, self.hits, self.total_time)
+
+
+class Profiler:
+    """
+    匹配函数和正则表达式的调用统计钩子, 可以和MatcherTrace同时设置到FileContext.matcher_hooks,
+    多个线程同时检测的时候用锁保护统计的数据
+    """
+    def __init__(self):
+        self.counters = dict()      # 名称->ProfileCounter
+        self.lock = threading.Lock()
+
+    def add(self, name, kind, calls, hits, elapsed):
+        with self.lock:
+            counter = self.counters.get(name)
+            if counter is None:
+                counter = self.counters[name] = ProfileCounter(name, kind)
+            counter.calls += calls
+            counter.hits += hits
+            counter.total_time += elapsed
+
+    def on_matcher(self, name, start_pos, result, elapsed):
+        self.add(name, "matcher", 1, 1 if result[0] != -1 else 0, elapsed)
+
+    def reset(self):
+        """
+        清空已经统计的数据
+        """
+        with self.lock:
+            self.counters.clear()
+
+    def get_stats(self):
+        """
+        :return: 有被调用过的ProfileCounter列表, 按照累计时间从大到小排序
+        """
+        with self.lock:
+            return sorted((counter for counter in self.counters.values() if counter.calls),
+                          key=lambda counter: counter.total_time, reverse=True)
+
+
+class ProfileRegex:
+    """
+    统计正则表达式调用的代理对象, 开启统计的时候替换模块里面的正则表达式
+    """
+    def __init__(self, regex, name, profiler):
+        self.regex = regex
+        self.name = name
+        self.profiler = profiler
+
+    def profile_call(self, func, args, kwargs):
+        begin = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.profiler.add(self.name, "regex", 1, 1 if result else 0, time.perf_counter() - begin)
+        return result
+
+    def match(self, *args, **kwargs):
+        return self.profile_call(self.regex.match, args, kwargs)
+
+    def search(self, *args, **kwargs):
+        return self.profile_call(self.regex.search, args, kwargs)
+
+    def fullmatch(self, *args, **kwargs):
+        return self.profile_call(self.regex.fullmatch, args, kwargs)
+
+    def findall(self, *args, **kwargs):
+        return self.profile_call(self.regex.findall, args, kwargs)
+
+    def sub(self, *args, **kwargs):
+        return self.profile_call(self.regex.sub, args, kwargs)
+
+    def finditer(self, *args, **kwargs):
+        is_hit = False
+        total_time = 0.0
+        iterator = self.regex.finditer(*args, **kwargs)
+        try:
+            while True:
+                begin = time.perf_counter()
+                match = next(iterator, None)
+                total_time += time.perf_counter() - begin
+                if match is None:
+                    break
+                is_hit = True
+                yield match
+        finally:
+            self.profiler.add(self.name, "regex", 1, 1 if is_hit else 0, total_time)
+
+    def __getattr__(self, name):
+        return getattr(self.regex, name)
+
+
+# enable_profile使用的统计, 可以通过get_profile_stats读取
+default_profiler = Profiler()
+
+# 开启统计时被替换掉的正则表达式, 关闭统计的时候还原
+profile_original_regex = dict()
+
+
+def enable_profile():
+    """
+    开启匹配函数和模块里面正则表达式的调用统计, 统计的数据累加在default_profiler里面.
+    匹配函数的统计是通过FileContext的钩子实现的, 和跟踪互不影响;
+    正则表达式是模块的全局对象, 只能替换成ProfileRegex, 统计的是所有线程的调用
+    """
+    set_default_matcher_hooks([hook for hook in default_matcher_hooks if hook is not default_profiler] +
+                              [default_profiler])
+    with hook_lock:
+        module_globals = globals()
+        regex_type = type(line_break_regex)
+        for name, value in list(module_globals.items()):
+            if isinstance(value, regex_type) and name not in profile_original_regex:
+                profile_original_regex[name] = value
+                module_globals[name] = ProfileRegex(value, name, default_profiler)
+
+
+def disable_profile():
+    """
+    关闭调用统计,还原被替换的正则表达式, 没有其他钩子的时候还原匹配函数, 已经统计的数据保留
+    """
+    set_default_matcher_hooks([hook for hook in default_matcher_hooks if hook is not default_profiler])
+    with hook_lock:
+        module_globals = globals()
+        for name, value in profile_original_regex.items():
+            module_globals[name] = value
+        profile_original_regex.clear()
+
+
+def is_profile_enabled():
+    """
+    :return: 是否已经通过enable_profile开启了调用统计
+    """
+    return default_profiler in default_matcher_hooks
+
+
+def reset_profile():
+    """
+    清空已经统计的数据
+    """
+    default_profiler.reset()
 
 
-def check_file(file_path):
+def get_profile_stats():
+    """
+    获取调用统计的数据
+    :return: 有被调用过的ProfileCounter列表, 按照累计时间从大到小排序
+    """
+    return default_profiler.get_stats()
+
+
+def format_profile_report(stats=None):
+    """
+    把调用统计格式化成报表
+    :param stats: ProfileCounter列表, 为None则使用get_profile_stats的结果
+    :return: 报表字符串
+    """
+    if stats is None:
+        stats = get_profile_stats()
+    lines = ["%-48s %-8s %10s %10s %10s %8s %12s" % ("name", "kind", "calls", "hits", "misses", "hit%", "time(ms)")]
+    for counter in stats:
+        lines.append("%-48s %-8s %10d %10d %10d %7.1f%% %12.3f" %
+                     (counter.name, counter.kind, counter.calls, counter.hits, counter.misses,
+                      100.0 * counter.hits / counter.calls, counter.total_time * 1000))
+    return "\n".join(lines)
+
+
+def check_bracket(parser_string, context=None):
+    """
+    检测文件里面的括号是否都能匹配,括号不匹配的文件无法正确解析语句
+    :param parser_string: 解析的数据
+    :param context: 文件的检测上下文FileContext
+    :return: error_message 每一个不匹配的括号对应一个错误
+    """
+    if context is None:
+        context = FileContext()
+    error_message = list()
+    line_index = context.get_line_index(parser_string)
+    for pos in context.get_bracket_index(parser_string).unmatched_pos:
+        line_begin = parser_string.rfind("\n", 0, pos) + 1
+        context_start, context_end = strip_range(parser_string, line_begin, next_line_break_pos(parser_string, pos))
+        error_message.append(
+            ErrorReport(
+                line=line_index.line_of(pos),
+                message=BRACKET_NOT_MATCH,
+                source=parser_string,
+                context_start=context_start,
+                context_end=context_end
+            )
+        )
+    return error_message
+
+
+def check_data(data, file_name, cache=None, time_budget=None):
+    """
+    检测内存里面的源代码, 供check_file和编辑器的检测服务使用
+    :param data: 源代码字符串,没有去掉注释
+    :param file_name: 文件名,用来判断头文件以及include的规则
+    :param cache: 检测结果的缓存ResultCache, 为None则不使用缓存
+    :param time_budget: 检测的时间限制,单位为秒,超时则返回已经检测出的结果和一个超时的错误, None表示不限制
+    :return: 检测出的ErrorReport列表
+    """
+    return list(iter_check_data(data, file_name, cache, time_budget))
+
+
+def iter_check_data(data, file_name, cache=None, time_budget=None):
+    """
+    检测内存里面的源代码,检测出错误就马上返回
+    :param data: 源代码字符串,没有去掉注释
+    :param file_name: 文件名,用来判断头文件以及include的规则
+    :param cache: 检测结果的缓存ResultCache, 为None则不使用缓存, 全部检测完毕才会写入缓存
+    :param time_budget: 检测的时间限制,单位为秒,超时则最后返回一个超时的错误, None表示不限制
+    :return: 生成器, 逐个返回检测出的ErrorReport
+    """
+    context = FileContext(file_name)
+    context.set_time_budget(time_budget)
+    if cache is not None:
+        cache_key = cache.make_key(context.current_file_name, data)
+        match_and_check_result = cache.get(cache_key)
+        if match_and_check_result is not None:
+            yield from match_and_check_result
+            return
+
+    data = remove_unnecessary_data(data)
+    if watchdog_progress is not None:
+        # watchdog的子进程需要记录最后解析的位置对应的行号
+        context.get_line_index(data)
+    match_and_check_result = check_bracket(data, context)
+    yield from match_and_check_result
+    try:
+        for er in iter_match_and_check(data, 0, context):
+            match_and_check_result.append(er)
+            yield er
+    except LintTimeout as e:
+        yield ErrorReport(line=context.get_line_index(data).line_of(e.offset), message=str(e))
+    except AssertionError:
+        # 括号不匹配的时候语句可能无法解析,已经报告了括号不匹配,保留前面检测出的结果
+        if not len(context.get_bracket_index(data).unmatched_pos):
+            raise
+        logging.error(context.current_file_name + "括号不匹配,括号后面的语句无法解析")
+    if cache is not None and not context.timed_out:
+        cache.put(cache_key, match_and_check_result)
+
+
+def check_file(file_path, cache=None, time_budget=None, with_context=True):
     """
     解析文件的规则
     :param file_path: 文件路径
+    :param cache: 检测结果的缓存ResultCache, 为None则不使用缓存
+    :param time_budget: 检测的时间限制,单位为秒, None表示不限制
+    :param with_context: 是否保留错误的上下文, False则不生成上下文字符串, 只统计数量的时候使用
     :return: rule 有检测出错误,返回检测出的结果
              None 没有检测出错误
     """
+    # 返回的结果可能会长时间保存, 生成上下文字符串或者丢弃上下文, 不再引用整个文件的源代码
+    finish = ErrorReport.materialize if with_context else ErrorReport.drop_context
     try:
-        FileContext.current_file_name = os.path.basename(file_path)
-        FileContext.current_line = 1
-        data = read_file_data(file_path)
-        match_and_check_result = match_and_check(data, 0)
-        for rule in match_and_check_result:
-            rule.file_full_path = os.path.abspath(file_path)
-
-        return match_and_check_result
+        return [finish(er) for er in iter_check_file(file_path, cache, time_budget)]
     except UnicodeDecodeError:
         logging.error("源文件编码错误，请查看是否GB2312编码")
-    finally:
-        FileContext.include_system_end = False
 
     return None
 
 
+def iter_check_file(file_path, cache=None, time_budget=None):
+    """
+    检测文件的规则,检测出错误就马上返回
+    :param file_path: 文件路径
+    :param cache: 检测结果的缓存ResultCache, 为None则不使用缓存
+    :param time_budget: 检测的时间限制,单位为秒, None表示不限制
+    :return: 生成器, 逐个返回检测出的ErrorReport, 文件编码错误会抛出UnicodeDecodeError
+    """
+    data = read_file_source(file_path)
+    file_full_path = intern_string(os.path.abspath(file_path))
+    for rule in iter_check_data(data, os.path.basename(file_path), cache, time_budget):
+        rule.file_full_path = file_full_path
+        yield rule
+
+
 def check_pointer_and_ref(var_str):
     """
     检测变量类型的*和&修饰符
@@ -2130,46 +3420,1140 @@ def count_rule(rules):
     return rule_count
 
 
-def check_dir(dir_path):
+def is_source_file(file_name):
+    """
+    是否是需要检测的.h和.cpp文件
+    :param file_name:
+    :return:
+    """
+    return file_name.endswith(".h") or file_name.endswith(".cpp")
+
+
+def find_source_files(dir_path):
+    """
+    找到目录下所有需要检测的.h和.cpp文件, 跳过.cpplintignore忽略的文件和Qt生成的文件
+    :param dir_path:
+    :return: 文件路径的列表,顺序和os.walk遍历的顺序一致
+    """
+    return sourceScanner.scan_files(dir_path, is_source_file)
+
+
+def check_dir_file(file_path, cache=None, time_budget=None, with_context=True):
+    """
+    检测目录里面的单个文件,文件编码错误和断言只记录日志,不影响其他文件的检测,
+    并行检测的时候在子进程里面调用
+    :param file_path: 文件路径
+    :param cache: 检测结果的缓存ResultCache
+    :param time_budget: 检测的时间限制,单位为秒, None表示不限制
+    :param with_context: 是否保留错误的上下文
+    :return: 检测出的结果,没有结果则返回None
+    """
+    file = os.path.basename(file_path)
+    try:
+        logging.info("解析文件"+file)
+        return check_file(file_path, cache, time_budget, with_context)
+    except UnicodeDecodeError as e:
+        logging.error("解析"+file+"文件编码错误:" + str(e))
+    except AssertionError as e:
+        logging.error("解析"+file+"文件有断言")
+
+    return None
+
+
+def check_dir(dir_path, jobs=1, use_threads=False, cache=None, time_budget=None):
     """
     检测目录下的所有.h和.cpp文件的规则
     :param dir_path:
-    :return:
+    :param jobs: 并行检测的进程数, 1表示在当前进程里面逐个检测, 0或者None表示使用cpu的个数
+    :param use_threads: 使用线程代替进程并行检测,适用于线程可以并行执行的python解释器
+    :param cache: 检测结果的缓存ResultCache, 检测完毕后会清理超过大小的缓存
+    :param time_budget: 每个文件检测的时间限制,单位为秒, None表示不限制,
+                        有时间限制的时候在子进程里面检测,卡死的子进程会被结束
+    :return: 检测出的结果,顺序和逐个检测的顺序一致
     """
-    import os
-    error_message = list()
-    for root, dirs, files in os.walk(dir_path):
-        for file in files:
-            if file.endswith(".h") or file.endswith(".cpp"):
-                try:
-                    logging.info("解析文件"+file)
-                    check_rule = check_file(root + '/' + file)
-                    if check_rule:
-                        error_message.extend(check_rule)
-                except UnicodeDecodeError as e:
-                    logging.error("解析"+file+"文件编码错误:" + str(e))
-                except AssertionError as e:
-                    logging.error("解析"+file+"文件有断言")
+    return [er.materialize() for er in iter_check_dir(dir_path, jobs, use_threads, cache, time_budget)]
+
+
+def iter_check_dir(dir_path, jobs=1, use_threads=False, cache=None, time_budget=None, with_context=True):
+    """
+    检测目录下的所有.h和.cpp文件的规则, 每检测完一个文件就返回这个文件的结果,
+    参数和check_dir一样
+    :param with_context: 是否保留错误的上下文, False则在检测的进程里面丢弃上下文, 不生成上下文字符串
+    :return: 生成器, 逐个返回检测出的ErrorReport,顺序和check_dir的结果一致
+    """
+    file_list = find_source_files(dir_path)
+    try:
+        yield from iter_check_file_list(file_list, jobs, use_threads, cache, time_budget, with_context)
+    finally:
+        if cache is not None:
+            cache.prune()
+
+
+def check_file_list(file_list, jobs=1, use_threads=False, cache=None, time_budget=None, with_context=True):
+    """
+    检测文件列表里面的所有文件
+    :param file_list: 文件路径的列表
+    :param jobs: 并行检测的进程数
+    :param use_threads: 使用线程代替进程并行检测
+    :param cache: 检测结果的缓存ResultCache
+    :param time_budget: 每个文件检测的时间限制,单位为秒, None表示不限制,
+                        有时间限制的时候在子进程里面检测,卡死的子进程会被结束
+    :param with_context: 是否保留错误的上下文, False则不生成上下文字符串
+    :return: 检测出的结果,顺序和file_list的顺序一致
+    """
+    check_result = iter_check_file_list(file_list, jobs, use_threads, cache, time_budget, with_context)
+    if not with_context:
+        return list(check_result)
+    return [er.materialize() for er in check_result]
+
+
+def iter_check_file_list(file_list, jobs=1, use_threads=False, cache=None, time_budget=None, with_context=True):
+    """
+    检测文件列表里面的所有文件, 每检测完一个文件就返回这个文件的结果,
+    参数和check_file_list一样
+    :param with_context: 是否保留错误的上下文
+    :return: 生成器, 逐个返回检测出的ErrorReport,顺序和file_list的顺序一致
+    """
+    check_func = functools.partial(check_dir_file, cache=cache, time_budget=time_budget, with_context=with_context)
+    yield from iter_map_file_list(check_func, file_list, jobs, use_threads, time_budget)
+
+
+def iter_map_file_list(check_func, file_list, jobs=1, use_threads=False, time_budget=None):
+    """
+    使用check_func检测文件列表里面的所有文件, 每检测完一个文件就返回这个文件的结果
+    :param check_func: 检测单个文件的函数, 参数为文件路径, 返回ErrorReport的列表或者None, 并行检测的时候需要可以pickle
+    :param file_list: 文件路径的列表
+    :param jobs: 并行检测的进程数, 1表示在当前进程里面逐个检测, 0或者None表示使用cpu的个数
+    :param use_threads: 使用线程代替进程并行检测
+    :param time_budget: 每个文件检测的时间限制,单位为秒, 有时间限制的时候在子进程里面检测
+    :return: 生成器, 逐个返回检测出的ErrorReport,顺序和file_list的顺序一致
+    """
+    if not jobs:
+        jobs = os.cpu_count() or 1
+
+    if time_budget is not None and file_list:
+        # 线程无法强制结束,有时间限制的时候即使是逐个检测或者use_threads也在子进程里面检测
+        yield from iter_check_file_list_with_watchdog(file_list, jobs, check_func, time_budget)
+        return
+
+    if jobs > 1 and len(file_list) > 1:
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        if use_threads:
+            executor = ThreadPoolExecutor(max_workers=jobs)
+        else:
+            executor = ProcessPoolExecutor(max_workers=jobs)
+        chunk_size = max(1, min(16, len(file_list) // (jobs * 4)))
+        with executor:
+            for check_rule in executor.map(check_func, file_list, chunksize=chunk_size):
+                if check_rule:
+                    yield from check_rule
+        return
+
+    for file_path in file_list:
+        check_rule = check_func(file_path)
+        if check_rule:
+            yield from check_rule
+
+
+# watchdog的子进程里面和父进程共享的(最后解析的位置, 行号), 只在watchdog的子进程里面设置
+watchdog_progress = None
+
+
+def watchdog_worker(conn, check_func, progress):
+    """
+    iter_check_file_list_with_watchdog检测文件的子进程, 从conn接收(文件的序号, 文件路径),
+    检测完毕之后发送(文件的序号, 检测的结果, 异常), 接收到None则结束
+    :param conn: 和父进程通信的multiprocessing.Connection
+    :param check_func: 检测单个文件的函数
+    :param progress: 共享内存的数组, 检测的时候FileContext.check_deadline写入最后解析的位置和行号
+    """
+    global watchdog_progress
+    watchdog_progress = progress
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        index, file_path = task
+        progress[0] = progress[1] = 0
+        try:
+            conn.send((index, check_func(file_path), None))
+        except Exception as e:
+            conn.send((index, None, e))
+
+
+class WatchdogWorker:
+    """
+    检测文件的子进程, 每次只检测一个文件, 检测超时的时候可以单独结束这个子进程
+    """
+    def __init__(self, check_func):
+        import multiprocessing
+        self.conn, child_conn = multiprocessing.Pipe()
+        # 子进程被结束之后仍然可以读取最后解析的位置和行号
+        self.progress = multiprocessing.Array("l", 2, lock=False)
+        self.process = multiprocessing.Process(target=watchdog_worker, args=(child_conn, check_func, self.progress),
+                                               daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.index = None           # 正在检测的文件序号, None表示空闲
+        self.start_time = None      # 开始检测的时间
+
+    def submit(self, index, file_path):
+        self.conn.send((index, file_path))
+        self.index = index
+        self.start_time = time.monotonic()
+
+    def receive(self):
+        """
+        接收检测的结果
+        :return: 检测的结果, 检测的时候子进程里面抛出异常则在这里重新抛出
+        """
+        index, result, error = self.conn.recv()
+        self.index = None
+        if error is not None:
+            raise error
+        return result
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+    def close(self):
+        if self.index is not None:
+            self.kill()
+            return
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+def iter_check_file_list_with_watchdog(file_list, jobs, check_func, time_budget):
+    """
+    使用多个子进程检测文件,同时监视每个文件的检测时间.
+    FileContext.check_deadline只在语句之间检查时间, 一般情况下超时的文件会在子进程里面自己结束检测,
+    如果一条语句里面的正则表达式或者循环卡死, 超过HARD_TIMEOUT_FACTOR倍的时间还没有结束,
+    则结束检测这个文件的子进程, 这个文件报告超时, 再创建新的子进程检测剩下的文件
+    :param file_list: 文件路径的列表
+    :param jobs: 并行检测的进程数, 1也会在子进程里面检测
+    :param check_func: 检测单个文件的函数, 在子进程里面调用
+    :param time_budget: 每个文件检测的时间限制,单位为秒
+    :return: 生成器, 逐个返回检测出的ErrorReport,顺序和file_list的顺序一致
+    """
+    from multiprocessing.connection import wait
+
+    hard_timeout = time_budget * HARD_TIMEOUT_FACTOR + 1
+    file_result = dict()    # 文件的序号->检测的结果, 按照顺序返回之后删除
+    next_index = 0          # 下一个按照顺序返回结果的文件序号
+    pending = 0             # 下一个提交的文件序号
+    workers = [WatchdogWorker(check_func) for _ in range(max(1, min(jobs, len(file_list))))]
+    try:
+        while next_index < len(file_list):
+            for worker in workers:
+                if worker.index is None and pending < len(file_list):
+                    worker.submit(pending, file_list[pending])
+                    pending += 1
+
+            busy = [worker for worker in workers if worker.index is not None]
+            ready = wait([worker.conn for worker in busy], timeout=min(hard_timeout, 0.5))
+            now = time.monotonic()
+            for worker in busy:
+                index = worker.index
+                if worker.conn in ready:
+                    try:
+                        file_result[index] = worker.receive()
+                        continue
+                    except EOFError:
+                        logging.error("检测" + file_list[index] + "的子进程异常退出")
+                        file_result[index] = None
+                elif now - worker.start_time > hard_timeout:
+                    logging.error("检测" + file_list[index] + "超时,结束检测的子进程")
+                    # 报告在子进程最后解析的位置, 还没有开始解析语句的时候报告在第0行,表示整个文件
+                    offset, line = worker.progress[0], worker.progress[1]
+                    file_result[index] = [ErrorReport(line=line, message=LINT_TIMEOUT.format(offset),
+                                                      file_full_path=os.path.abspath(file_list[index]))]
+                else:
+                    continue
+                worker.kill()
+                workers[workers.index(worker)] = WatchdogWorker(check_func)
+
+            while next_index in file_result:
+                check_rule = file_result.pop(next_index)
+                next_index += 1
+                if check_rule:
+                    yield from check_rule
+    finally:
+        for worker in workers:
+            worker.close()
+
+
+def run_git(args, repo_dir, decode=True):
+    """
+    在repo_dir里面执行git命令
+    :param args: git的参数
+    :param repo_dir: git仓库的目录
+    :param decode: 是否把输出解码成字符串
+    :return: 命令的输出
+    """
+    output = subprocess.check_output(["git", "-c", "core.quotepath=off"] + args, cwd=repo_dir)
+    if not decode:
+        return output
+    return output.decode("utf-8", "surrogateescape")
+
+
+def git_diff_args(base=None, staged=False):
+    """
+    生成git diff比较的参数
+    :param base: 比较的基准, 可以是提交(比较工作区和这个提交)或者A..B这种提交范围, None表示HEAD
+    :param staged: 只比较暂存区的修改
+    :return: git diff的参数
+    """
+    args = ["diff", "--no-color", "--no-ext-diff", "--diff-filter=ACMR"]
+    if staged:
+        args.append("--cached")
+    args.append(base or "HEAD")
+    return args
+
+
+def git_diff_revision(base=None, staged=False):
+    """
+    git diff修改后的行号对应的版本, 检测的时候需要读取这个版本的文件内容
+    :param base: 比较的基准, 可以是提交或者A..B这种提交范围, None表示HEAD
+    :param staged: 只比较暂存区的修改
+    :return: 提交, ""表示暂存区, None表示工作区
+    """
+    if staged:
+        return ""
+    if base is None:
+        return None
+    for separator in ("...", ".."):
+        if base.find(separator) != -1:
+            return base.split(separator, 1)[1] or "HEAD"
+    return None
+
+
+def check_git_file(file_path, top_dir, revision, cache=None, time_budget=None, with_context=True):
+    """
+    检测git里面某个版本的文件内容, 文件编码错误和断言只记录日志,不影响其他文件的检测
+    :param file_path: 文件的绝对路径
+    :param top_dir: git仓库的根目录
+    :param revision: 提交, ""表示暂存区
+    :param cache: 检测结果的缓存ResultCache
+    :param time_budget: 检测的时间限制,单位为秒, None表示不限制
+    :param with_context: 是否保留错误的上下文
+    :return: 检测出的结果,没有结果则返回None
+    """
+    file = os.path.basename(file_path)
+    rel_path = os.path.relpath(file_path, top_dir).replace(os.sep, "/")
+    try:
+        logging.info("解析文件" + file)
+        data = decode_source(run_git(["show", revision + ":" + rel_path], top_dir, decode=False))
+        file_full_path = intern_string(file_path)
+        result = list()
+        for er in iter_check_data(data, file, cache, time_budget):
+            er.file_full_path = file_full_path
+            result.append(er.materialize() if with_context else er.drop_context())
+        return result
+    except UnicodeDecodeError as e:
+        logging.error("解析"+file+"文件编码错误:" + str(e))
+    except AssertionError as e:
+        logging.error("解析"+file+"文件有断言")
+
+    return None
+
+
+def unquote_git_path(file_name):
+    """
+    解析git diff输出的文件名, 包含空格的文件名后面有一个制表符,
+    包含特殊字符的文件名使用双引号和C语言的转义, 非ASCII的字符转义为八进制的utf-8字节
+    :param file_name: git diff输出的文件名
+    :return: 文件名
+    """
+    if not file_name.startswith('"'):
+        return file_name.rstrip("\t")
+    file_name = file_name[1:file_name.rfind('"')]
+    data = bytearray()
+    pos = 0
+    while pos < len(file_name):
+        c = file_name[pos]
+        pos += 1
+        if c != "\\":
+            data.extend(c.encode("utf-8", "surrogateescape"))
+            continue
+        c = file_name[pos]
+        if c in "01234567":
+            data.append(int(file_name[pos:pos+3], 8))
+            pos += 3
+        else:
+            data.append(ord(git_path_escapes.get(c, c)))
+            pos += 1
+    return data.decode("utf-8", "surrogateescape")
+
+
+def git_changed_lines(repo_dir=".", base=None, staged=False):
+    """
+    获取git修改过的.h和.cpp文件,以及每个文件修改后的行号.
+    比较工作区的时候,还没有加入git的文件也算作修改过的文件
+    :param repo_dir: git仓库里面的目录
+    :param base: 比较的基准, 可以是提交或者A..B这种提交范围, None表示HEAD
+    :param staged: 只比较暂存区的修改
+    :return: {文件的绝对路径: 修改过的行号set}, 行号为None表示整个文件都是新的
+    """
+    top_dir = run_git(["rev-parse", "--show-toplevel"], repo_dir).strip()
+    changed_lines = dict()
+    file_path = None
+    for line in run_git(git_diff_args(base, staged) + ["-U0"], top_dir).splitlines():
+        if line.startswith("+++ "):
+            file_name = unquote_git_path(line[4:])
+            file_path = None
+            if file_name.startswith("b/") and is_source_file(file_name):
+                file_path = os.path.abspath(os.path.join(top_dir, file_name[2:]))
+                changed_lines.setdefault(file_path, set())
+            continue
+
+        if file_path is None:
+            continue
+        match = git_hunk_regex.match(line)
+        if match:
+            start = int(match.group("start"))
+            count = match.group("count")
+            count = 1 if count is None else int(count)
+            changed_lines[file_path].update(range(start, start + count))
+
+    if not staged and (base is None or base.find("..") == -1):
+        for file_name in run_git(["ls-files", "-z", "--others", "--exclude-standard"], top_dir).split("\0"):
+            if is_source_file(file_name):
+                changed_lines[os.path.abspath(os.path.join(top_dir, file_name))] = None
+
+    return changed_lines
+
+
+def check_git_changes(repo_dir=".", base=None, staged=False, only_hunks=False,
+                      jobs=1, use_threads=False, cache=None, time_budget=None):
+    """
+    只检测git修改过的.h和.cpp文件, 检测的内容和修改的行号来自同一个版本:
+    比较工作区的时候检测工作区里面的文件, staged检测暂存区里面的文件, A..B检测提交B里面的文件
+    :param repo_dir: git仓库里面的目录
+    :param base: 比较的基准, 可以是提交或者A..B这种提交范围, None表示HEAD
+    :param staged: 只检测暂存区修改过的文件
+    :param only_hunks: 只报告修改过的行上面的问题
+    :param jobs: 并行检测的进程数
+    :param use_threads: 使用线程代替进程并行检测
+    :param cache: 检测结果的缓存ResultCache
+    :param time_budget: 每个文件检测的时间限制,单位为秒, None表示不限制
+    :return: 检测出的结果
+    """
+    return [er.materialize() for er in iter_check_git_changes(repo_dir, base, staged, only_hunks,
+                                                              jobs, use_threads, cache, time_budget)]
+
+
+def iter_check_git_changes(repo_dir=".", base=None, staged=False, only_hunks=False,
+                           jobs=1, use_threads=False, cache=None, time_budget=None, with_context=True):
+    """
+    只检测git修改过的.h和.cpp文件, 每检测完一个文件就返回这个文件的结果,
+    参数和check_git_changes一样
+    :param with_context: 是否保留错误的上下文
+    :return: 生成器, 逐个返回检测出的ErrorReport
+    """
+    changed_lines = git_changed_lines(repo_dir, base, staged)
+    revision = git_diff_revision(base, staged)
+    if revision is None:
+        file_list = [file_path for file_path in sorted(changed_lines) if os.path.isfile(file_path)]
+        check_result = iter_check_file_list(file_list, jobs, use_threads, cache, time_budget, with_context)
+    else:
+        # 暂存区和提交里面的文件可能和工作区不一样, 从git读取对应版本的内容
+        top_dir = run_git(["rev-parse", "--show-toplevel"], repo_dir).strip()
+        check_func = functools.partial(check_git_file, top_dir=top_dir, revision=revision,
+                                       cache=cache, time_budget=time_budget, with_context=with_context)
+        check_result = iter_map_file_list(check_func, sorted(changed_lines), jobs, use_threads, time_budget)
+    for er in check_result:
+        if not only_hunks or changed_lines[er.file_full_path] is None or er.line in changed_lines[er.file_full_path]:
+            yield er
+
+
+def check_watch_file(file_path, cache=None):
+    """
+    检测监视目录里面的单个文件, .qss文件使用qss的规则检测
+    :param file_path: 文件路径
+    :param cache: 检测结果的缓存ResultCache
+    :return: 检测出的结果
+    """
+    if file_path.endswith(".qss"):
+        import qss
+        return qss.check_file(file_path)
+    return check_dir_file(file_path, cache)
+
+
+class Watcher:
+    """
+    监视目录下的.h,.cpp和.qss文件,文件修改之后只重新检测修改过的文件,
+    每个文件上一次的检测结果保存在内存里面,返回和上一次检测结果的差异
+    """
+    def __init__(self, dir_path, cache=None):
+        self.dir_path = dir_path
+        self.cache = cache
+        self.file_stat = dict()         # 文件路径->(修改时间, 文件大小)
+        self.file_result = dict()       # 文件路径->上一次检测出的结果
+
+    def scan(self):
+        """
+        遍历目录,获取所有监视的文件的状态
+        :return: {文件路径: (修改时间, 文件大小)}
+        """
+        file_stat = dict()
+        # 生成的文件每次编译都会变化, 只根据文件名跳过, 不读取文件的内容
+        for file_path in sourceScanner.scan_files(self.dir_path, lambda file: is_source_file(file) or file.endswith(".qss"),
+                                                  check_header=False):
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            file_stat[file_path] = (stat.st_mtime_ns, stat.st_size)
+        return file_stat
+
+    def poll(self):
+        """
+        检测一次目录的变化,重新检测新增和修改过的文件
+        :return: added, removed 新出现的问题和已经消失的问题
+        """
+        current_stat = self.scan()
+        added = list()
+        removed = list()
+        for file_path in sorted(set(self.file_stat) - set(current_stat)):
+            removed.extend(self.file_result.pop(file_path, []))
+
+        for file_path in sorted(current_stat):
+            if self.file_stat.get(file_path) == current_stat[file_path]:
+                continue
+            new_result = check_watch_file(file_path, self.cache) or []
+            old_result = self.file_result.get(file_path, [])
+            file_added, file_removed = diff_error_report(old_result, new_result)
+            added.extend(file_added)
+            removed.extend(file_removed)
+            self.file_result[file_path] = new_result
+
+        self.file_stat = current_stat
+        return added, removed
+
+
+def diff_error_report(old_result, new_result):
+    """
+    比较两次检测的结果,比较的时候不考虑行号,避免在文件前面增加一行之后,后面所有的问题都算作变化
+    :param old_result: 上一次检测的结果
+    :param new_result: 这一次检测的结果
+    :return: added, removed 新出现的问题和已经消失的问题
+    """
+    old_count = dict()
+    for er in old_result:
+        key = (er.message, er.error_context)
+        old_count[key] = old_count.get(key, 0) + 1
+
+    added = list()
+    for er in new_result:
+        key = (er.message, er.error_context)
+        if old_count.get(key, 0) > 0:
+            old_count[key] -= 1
+        else:
+            added.append(er)
+
+    removed = list()
+    for er in reversed(old_result):
+        key = (er.message, er.error_context)
+        if old_count.get(key, 0) > 0:
+            old_count[key] -= 1
+            removed.append(er)
+    removed.reverse()
+    return added, removed
+
+
+def watch_dir(dir_path, interval=1.0, cache=None):
+    """
+    持续监视目录,文件保存之后重新检测并且输出问题的变化, 按Ctrl+C退出
+    :param dir_path: 监视的目录
+    :param interval: 检查文件修改的间隔,单位为秒
+    :param cache: 检测结果的缓存ResultCache
+    """
+    watcher = Watcher(dir_path, cache)
+    try:
+        while True:
+            added, removed = watcher.poll()
+            for result in removed:
+                print("- " + str(result))
+            for result in added:
+                print("+ " + str(result))
+            if len(added) or len(removed):
+                print("总共发现:" + str(sum(len(result) for result in watcher.file_result.values())))
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+def error_report_to_dict(er):
+    """
+    把ErrorReport转换成可以序列化为JSON的dict
+    :param er: ErrorReport
+    :return: dict
+    """
+    return {"file": er.file_full_path, "line": er.line, "message": er.message, "context": er.error_context}
+
+
+def handle_server_request(request, cache=None):
+    """
+    处理检测服务的一个请求
+    请求的格式:
+        {"id": 1, "path": "a.cpp"}                              检测磁盘上的文件
+        {"id": 1, "file_name": "a.cpp", "content": "..."}       检测编辑器里面还没有保存的内容
+        {"id": 1, "method": "shutdown"}                         关闭服务
+    :param request: 解析好的请求dict
+    :param cache: 检测结果的缓存ResultCache
+    :return: 返回给客户端的dict
+    """
+    response = {"id": request.get("id")}
+    method = request.get("method", "check")
+    if method == "shutdown":
+        response["result"] = "shutdown"
+    elif method != "check":
+        response["error"] = "未知的请求:" + str(method)
+    elif "content" in request:
+        file_name = request.get("file_name") or os.path.basename(request.get("path") or "")
+        result = check_data(normalize_newline(request["content"]), file_name, cache)
+        file_full_path = os.path.abspath(request["path"]) if request.get("path") else file_name
+        for er in result:
+            er.file_full_path = file_full_path
+        response["results"] = [error_report_to_dict(er) for er in result]
+    elif "path" in request:
+        try:
+            result = check_file(request["path"], cache)
+        except OSError as e:
+            response["error"] = str(e)
+        else:
+            if result is None:
+                response["error"] = "源文件编码错误"
+            else:
+                response["results"] = [error_report_to_dict(er) for er in result]
+    else:
+        response["error"] = "请求里面没有path或者content"
+    return response
+
+
+def serve_stream(input_stream, output_stream, cache=None):
+    """
+    从input_stream按行读取JSON请求,把结果按行写到output_stream,
+    服务一直保持在同一个进程里面,省掉每次启动python和编译正则表达式的时间
+    :param input_stream: 输入流,每行一个JSON请求
+    :param output_stream: 输出流,每行一个JSON结果
+    :param cache: 检测结果的缓存ResultCache
+    :return: True 收到了shutdown请求 False 输入流结束
+    """
+    for line in input_stream:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("请求必须是JSON对象")
+        except ValueError as e:
+            response = {"id": None, "error": "请求格式错误:" + str(e)}
+        else:
+            try:
+                response = handle_server_request(request, cache)
+            except Exception as e:
+                logging.exception("处理请求失败")
+                response = {"id": request.get("id"), "error": str(e)}
+
+        data = json.dumps(response, ensure_ascii=False) + "\n"
+        if "b" in getattr(output_stream, "mode", "") or not hasattr(output_stream, "encoding"):
+            data = data.encode("utf-8")
+        output_stream.write(data)
+        output_stream.flush()
+        if response.get("result") == "shutdown":
+            return True
+    return False
+
+
+def serve_unix_socket(socket_path, cache=None):
+    """
+    在Unix socket上提供检测服务,每个连接的协议和serve_stream一样
+    :param socket_path: socket文件的路径
+    :param cache: 检测结果的缓存ResultCache
+    """
+    import socketserver
+
+    class LintRequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            if serve_stream(self.rfile, self.wfile, cache):
+                # shutdown()会等待serve_forever退出,需要在其他线程里面调用
+                import threading
+                threading.Thread(target=self.server.shutdown).start()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, LintRequestHandler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def count_error_report(error_reports):
+    """
+    按照错误信息统计错误的数量, 不会生成错误的上下文字符串
+    :param error_reports: ErrorReport的列表或者生成器
+    :return: [(错误信息, 数量)], 按照数量从多到少排序
+    """
+    message_count = dict()
+    for er in error_reports:
+        message_count[er.message] = message_count.get(er.message, 0) + 1
+    return sorted(message_count.items(), key=lambda item: (-item[1], item[0]))
+
+
+def build_rule_id_table():
+    """
+    生成错误信息到规则ID的映射, 带{0}参数的错误信息生成对应的正则表达式
+    :return: (错误信息到规则ID的dict, [(正则表达式, 规则ID)])
+    """
+    message_rule_id = dict()
+    template_rule_id = []
+    for rule_id in RULE_IDS:
+        message = globals()[rule_id]
+        if "{0}" in message:
+            prefix, _, suffix = message.partition("{0}")
+            template_rule_id.append((re.compile(re.escape(prefix) + r"[\s\S]*" + re.escape(suffix) + "$"), rule_id))
+        else:
+            message_rule_id[message] = rule_id
+    return message_rule_id, template_rule_id
+
+
+message_rule_id_table, template_rule_id_table = build_rule_id_table()
+
+
+@functools.lru_cache(maxsize=1024)
+def get_rule_id(message):
+    """
+    根据错误信息得到稳定的规则ID,规则ID就是错误信息常量的名称,错误信息的文字修改了也不会变化
+    :param message: ErrorReport的错误信息
+    :return: 规则ID, 找不到对应的规则的时候返回UNKNOWN_RULE_ID
+    """
+    rule_id = message_rule_id_table.get(message)
+    if rule_id is not None:
+        return rule_id
+    for regex, rule_id in template_rule_id_table:
+        if regex.match(message):
+            return rule_id
+    return UNKNOWN_RULE_ID
+
+
+class ReportWriter:
+    """
+    流式输出检测结果, 每个结果格式化之后先放到缓冲里面, 缓冲满了再一次写到输出流
+    默认每行输出一个str(ErrorReport), 其他格式的子类重写format_report, 需要文件头和文件尾的格式重写header和footer
+    """
+    def __init__(self, output_stream, buffer_size=REPORT_BUFFER_SIZE):
+        self.output_stream = output_stream
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffer_length = 0
+        self.count = 0
+        self.write_text(self.header())
+
+    def header(self):
+        return ""
+
+    def footer(self):
+        return ""
+
+    def format_report(self, er):
+        return str(er) + "\n"
+
+    def write(self, er):
+        """
+        输出一个检测结果
+        :param er: ErrorReport
+        """
+        self.write_text(self.format_report(er))
+        self.count += 1
+
+    def write_text(self, text):
+        if not text:
+            return
+        self.buffer.append(text)
+        self.buffer_length += len(text)
+        if self.buffer_length >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.output_stream.write("".join(self.buffer))
+            self.buffer = []
+            self.buffer_length = 0
+        self.output_stream.flush()
+
+    def close(self):
+        """
+        输出文件尾并且把缓冲里面的内容全部写到输出流, 不会关闭输出流
+        """
+        self.write_text(self.footer())
+        self.flush()
+
+
+class TextReportWriter(ReportWriter):
+    """
+    每行输出一个str(ErrorReport), 和控制台输出的格式一致
+    """
+
+
+class JsonLinesReportWriter(ReportWriter):
+    """
+    JSON Lines格式, 每行一个JSON对象
+    """
+    def format_report(self, er):
+        record = {"rule_id": get_rule_id(er.message)}
+        record.update(error_report_to_dict(er))
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+class SarifReportWriter(ReportWriter):
+    """
+    SARIF 2.1.0格式, 规则的列表放在文件头里面, 检测结果逐个写到results数组里面,不需要缓存所有的结果
+    """
+    SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+    TOOL_NAME = "cppLint"
+
+    def header(self):
+        rules = [{"id": rule_id, "shortDescription": {"text": globals()[rule_id]}} for rule_id in RULE_IDS]
+        rules.append({"id": UNKNOWN_RULE_ID, "shortDescription": {"text": UNKNOWN_RULE_ID}})
+        driver = json.dumps({"name": self.TOOL_NAME, "rules": rules}, ensure_ascii=False)
+        return ('{"$schema": "%s", "version": "2.1.0", "runs": [{"tool": {"driver": %s}, "results": ['
+                % (self.SARIF_SCHEMA, driver))
+
+    def footer(self):
+        return "]}]}\n"
+
+    @staticmethod
+    def file_uri(file_path):
+        if os.path.isabs(file_path):
+            import pathlib
+            return pathlib.Path(file_path).as_uri()
+        return file_path.replace(os.sep, "/")
+
+    def format_report(self, er):
+        rule_id = get_rule_id(er.message)
+        rule_index = RULE_IDS.index(rule_id) if rule_id != UNKNOWN_RULE_ID else len(RULE_IDS)
+        location = {"artifactLocation": {"uri": self.file_uri(er.file_full_path or "")}}
+        if er.line:
+            region = {"startLine": er.line}
+            error_context = er.error_context
+            if error_context is not None:
+                region["snippet"] = {"text": error_context}
+            location["region"] = region
+        result = {"ruleId": rule_id,
+                  "ruleIndex": rule_index,
+                  "level": "warning",
+                  "message": {"text": er.message},
+                  "locations": [{"physicalLocation": location}]}
+        text = json.dumps(result, ensure_ascii=False)
+        return text if self.count == 0 else "," + text
+
+
+report_writer_classes = {"text": TextReportWriter, "jsonl": JsonLinesReportWriter, "sarif": SarifReportWriter}
+
+
+def normalize_error_context(error_context):
+    """
+    规范化错误的上下文, 合并连续的空白字符, 只修改缩进或者换行的时候指纹不变
+    :param error_context: 错误的上下文,可以是None
+    :return: 规范化之后的字符串
+    """
+    if not error_context:
+        return ""
+    return " ".join(error_context.split())
+
+
+@functools.lru_cache(maxsize=1024)
+def get_baseline_path(file_path, base_dir):
+    """
+    基线文件里面保存的文件路径, 相对于base_dir并且使用/分隔, 在不同的机器上面也一样
+    :param file_path: 文件路径
+    :param base_dir: 计算相对路径的目录
+    :return: 相对路径
+    """
+    if os.path.isabs(file_path):
+        file_path = os.path.relpath(file_path, base_dir)
+    return file_path.replace(os.sep, "/")
+
+
+def fingerprint_error_report(er, base_dir="."):
+    """
+    计算检测结果的指纹, 由规则ID,相对路径和规范化之后的上下文计算, 和行号无关,
+    在出错的代码前面插入或者删除代码之后指纹不变.
+    check_data的结果没有file_full_path, 不同文件里面相同的结果指纹相同, 基线需要使用check_file等带有路径的结果
+    :param er: ErrorReport
+    :param base_dir: 计算相对路径的目录
+    :return: (指纹, 规则ID, 相对路径, 规范化之后的上下文)
+    """
+    rule_id = get_rule_id(er.message)
+    if rule_id == UNKNOWN_RULE_ID:
+        rule_id = er.message
+    file_path = get_baseline_path(er.file_full_path or "", base_dir)
+    error_context = normalize_error_context(er.error_context)
+    digest = hashlib.sha1("\0".join((rule_id, file_path, error_context)).encode("utf-8")).hexdigest()
+    return digest, rule_id, file_path, error_context
+
+
+class Baseline:
+    """
+    基线文件, 记录已有的检测结果的指纹, 之后检测的时候只报告新的结果
+    文件格式是每行一个结果: 指纹\t规则ID\t相对路径\t上下文, 读取的时候只需要每行的指纹,
+    同一个文件里面上下文相同的结果会有多行相同的指纹, 按照数量抵消
+    """
+    HEADER = "# cppLint baseline v1\n"
+
+    def __init__(self, fingerprints=None, base_dir="."):
+        self.fingerprints = fingerprints if fingerprints is not None else dict()    # 指纹 -> 数量
+        self.base_dir = base_dir
+
+    def __len__(self):
+        return sum(self.fingerprints.values())
+
+    @classmethod
+    def load(cls, baseline_path, base_dir="."):
+        """
+        读取基线文件
+        :param baseline_path: 基线文件的路径
+        :param base_dir: 计算相对路径的目录
+        :return: Baseline
+        """
+        fingerprints = dict()
+        get_count = fingerprints.get
+        with open(baseline_path, "r", encoding="utf-8") as fp:
+            for line in fp:
+                if line.startswith("#"):
+                    continue
+                digest = line[:line.find("\t")] if "\t" in line else line.rstrip("\n")
+                if digest:
+                    fingerprints[digest] = get_count(digest, 0) + 1
+        return cls(fingerprints, base_dir)
+
+    @staticmethod
+    def write(baseline_path, error_reports, base_dir="."):
+        """
+        把检测结果写到基线文件, 检测超时的结果和运行环境有关, 不写到基线里面
+        :param baseline_path: 基线文件的路径
+        :param error_reports: ErrorReport的列表或者生成器
+        :param base_dir: 计算相对路径的目录
+        :return: 写入的结果数量
+        """
+        lines = []
+        for er in error_reports:
+            fingerprint = fingerprint_error_report(er, base_dir)
+            if fingerprint[1] == "LINT_TIMEOUT":
+                continue
+            lines.append("\t".join(fingerprint) + "\n")
+        # 排序之后基线文件的diff比较稳定
+        lines.sort()
+        with open(baseline_path, "w", encoding="utf-8") as fp:
+            fp.write(Baseline.HEADER)
+            fp.writelines(lines)
+        return len(lines)
+
+    def filter(self, error_reports):
+        """
+        过滤掉基线里面已经有的检测结果
+        :param error_reports: ErrorReport的列表或者生成器
+        :return: 基线里面没有的ErrorReport的生成器
+        """
+        remaining = dict(self.fingerprints)
+        for er in error_reports:
+            digest = fingerprint_error_report(er, self.base_dir)[0]
+            count = remaining.get(digest, 0)
+            if count:
+                remaining[digest] = count - 1
+            else:
+                yield er
+
+
+USAGE = """用法:
+    python cppLint.py -f 文件 | -d 目录 | --git [--git-base 提交或者A..B] [--git-staged] [--git-hunks]
+                      [-j 进程数] [-t] [--cache-dir 目录] [--cache-size MB] [--time-budget 秒]
+                      [--count-only] [--format text|jsonl|sarif] [--output 文件]
+                      [--baseline 文件] [--write-baseline 文件] [--trace all|匹配函数,...] [--profile]
+                      [--engine 引擎]
+    python cppLint.py --watch 目录 [--watch-interval 秒]
+    python cppLint.py --server | --socket 路径"""
 
-    return error_message
 
 if __name__ == "__main__":
-    import sys
     import getopt
-    opts, args = getopt.getopt(sys.argv[1:], "hf:d:")
-    logging.basicConfig(level=logging.DEBUG,
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hf:d:j:t", ["cache-dir=", "cache-size=",
+                                                              "git", "git-base=", "git-staged", "git-hunks",
+                                                              "watch=", "watch-interval=", "server", "socket=",
+                                                              "trace=", "profile", "time-budget=", "count-only",
+                                                              "format=", "output=", "baseline=", "write-baseline=",
+                                                              "engine="])
+    except getopt.GetoptError as e:
+        print(str(e) + "\n" + USAGE)
+        sys.exit(2)
+    log_level = logging.INFO
+    for opt, value in opts:
+        if opt == "-h":
+            print(USAGE)
+            sys.exit(0)
+        elif opt == "--trace":
+            # --trace=all 跟踪所有的匹配函数, 或者用逗号分隔需要跟踪的匹配函数
+            log_level = logging.DEBUG
+            try:
+                enable_trace(matchers=None if value == "all" else value.split(","))
+            except ValueError as e:
+                print(str(e) + ", 可以跟踪的匹配函数:all," + ",".join(get_traceable_matchers()))
+                sys.exit(2)
+        elif opt == "--profile":
+            enable_profile()
+        elif opt == "--engine":
+            set_scanner_engine(value)
+    logging.basicConfig(level=log_level,
                         format="[line:%(lineno)d] %(levelname)s %(message)s")
     check_result = None
+    jobs = 1
+    use_threads = False
+    cache_dir = None
+    cache_size = DEFAULT_CACHE_SIZE
+    git_mode = False
+    git_base = None
+    git_staged = False
+    git_hunks = False
+    watch_interval = 1.0
+    time_budget = None
+    count_only = False
+    report_format = "text"
+    output_path = None
+    baseline = None
+    write_baseline_path = None
+    for opt, value in opts:
+        if opt == "-j":
+            jobs = int(value)
+        elif opt == "-t":
+            use_threads = True
+        elif opt == "--cache-dir":
+            cache_dir = value
+        elif opt == "--cache-size":
+            cache_size = int(value) * 1024 * 1024
+        elif opt == "--git":
+            git_mode = True
+        elif opt == "--git-base":
+            git_mode = True
+            git_base = value
+        elif opt == "--git-staged":
+            git_mode = True
+            git_staged = True
+        elif opt == "--git-hunks":
+            git_mode = True
+            git_hunks = True
+        elif opt == "--watch-interval":
+            watch_interval = float(value)
+        elif opt == "--time-budget":
+            time_budget = float(value)
+        elif opt == "--count-only":
+            count_only = True
+        elif opt == "--format":
+            if value not in report_writer_classes:
+                print("不支持的输出格式:" + value + ", 可选的格式:" + ",".join(report_writer_classes))
+                sys.exit(2)
+            report_format = value
+        elif opt == "--output":
+            output_path = value
+        elif opt == "--baseline":
+            baseline = Baseline.load(value)
+        elif opt == "--write-baseline":
+            write_baseline_path = value
+
+    cache = None
+    if cache_dir is not None:
+        cache = ResultCache(cache_dir, cache_size)
+
+    if is_profile_enabled():
+        # 子进程里面的统计数据无法汇总, 统计的时候在当前进程里面检测, 可以使用多个线程
+        if time_budget is not None:
+            print("--profile需要在当前进程里面检测, 不能和--time-budget同时使用")
+            sys.exit(2)
+        if not use_threads:
+            jobs = 1
+
+    # 只统计数量的时候不需要生成上下文字符串, 基线的指纹需要使用上下文
+    with_context = not count_only or baseline is not None or write_baseline_path is not None
+
+    if git_mode:
+        check_result = iter_check_git_changes(".", git_base, git_staged, git_hunks, jobs, use_threads, cache,
+                                              time_budget, with_context)
+
+    for opt, value in opts:
+        if opt == "--watch":
+            watch_dir(value, watch_interval, cache)
+            sys.exit(0)
+        elif opt == "--server":
+            serve_stream(sys.stdin, sys.stdout, cache)
+            sys.exit(0)
+        elif opt == "--socket":
+            serve_unix_socket(value, cache)
+            sys.exit(0)
+
     for opt, value in opts:
         if opt == "-f":
-            check_result = check_file(value)
+            # 单个文件使用check_file检测, 解析时的断言直接抛出, 不像检测目录那样只记录日志
+            check_func = functools.partial(check_file, cache=cache, time_budget=time_budget, with_context=with_context)
+            check_result = iter_map_file_list(check_func, [value], 1, False, time_budget)
 
         elif opt == "-d":
-            check_result = check_dir(value)
+            check_result = iter_check_dir(value, jobs, use_threads, cache, time_budget, with_context)
         else:
             continue
 
-    for result in check_result:
-        print(result)
-
-    print("总共发现:" + str(len(check_result)))
\ No newline at end of file
+    if check_result is None:
+        # 没有指定检测的文件,目录或者git
+        print(USAGE)
+        sys.exit(2)
+
+    if write_baseline_path is not None:
+        print("基线写入结果:" + str(Baseline.write(write_baseline_path, check_result)))
+        sys.exit(0)
+
+    if baseline is not None:
+        # 只报告基线里面没有的新结果
+        check_result = baseline.filter(check_result)
+
+    result_count = 0
+    if count_only:
+        # 只输出每种错误的数量
+        for message, count in count_error_report(check_result):
+            print("%d\t%s" % (count, message))
+            result_count += count
+    elif report_format == "text" and output_path is None:
+        # 检测出一个结果就马上输出,不等全部检测完毕
+        for result in check_result:
+            print(result, flush=True)
+            result_count += 1
+    else:
+        output_stream = sys.stdout if output_path is None else open(output_path, "w", encoding="utf-8")
+        writer = report_writer_classes[report_format](output_stream)
+        for result in check_result:
+            writer.write(result)
+        writer.close()
+        result_count = writer.count
+        if output_path is not None:
+            output_stream.close()
+
+    # 机器可读的格式输出到标准输出的时候,统计信息输出到标准错误,避免破坏格式
+    summary_stream = sys.stdout if report_format == "text" or output_path is not None else sys.stderr
+    print("总共发现:" + str(result_count), file=summary_stream)
+
+    if is_profile_enabled():
+        disable_profile()
+        print(format_profile_report(), file=summary_stream)
\ No newline at end of file
@@ -0,0 +1,308 @@
+"""
+检测速度的基准测试: 按照固定的随机数种子生成Qt风格的源代码, 统计check_file和check_dir的速度和内存峰值,
+结果保存为JSON, 可以和其他提交的结果比较
+
+用法:
+    python lintBenchmark.py [--sizes small,medium] [--jobs 4] [--seed 0] [--repeats 5] [--output result.json]
+                            [--compare old.json] [--engine chain|master]
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import platform
+import tempfile
+import statistics
+import tracemalloc
+import cppLint
+
+# 基准测试的规模: 名称->(文件数量, 每个文件大约的行数)
+BENCHMARK_SIZES = {"tiny": (4, 50), "small": (20, 200), "medium": (100, 500), "large": (400, 1000)}
+# 比较结果的时候, 速度下降超过这个比例就认为是性能退化
+REGRESSION_THRESHOLD = 0.1
+# 每个测试重复执行的次数, 使用时间的中位数
+BENCHMARK_REPEATS = 5
+# 时间的中位数小于这个秒数的测试波动太大, 比较的时候不判断是否退化
+MIN_STABLE_SECONDS = 0.2
+
+
+class SourceGenerator:
+    """
+    生成Qt风格的源代码, 相同的种子生成相同的代码.
+    代码里面有Q_OBJECT类,cit开头的成员,嵌套的控制语句,多行的#define,大段的注释和很大的枚举,
+    有一部分代码故意违反规则,让检测的时候产生错误报告
+    """
+    def __init__(self, seed=0):
+        self.rand = random.Random(seed)
+
+    def name(self, prefix="cit"):
+        return prefix + self.rand.choice(("Widget", "Model", "View", "Item", "Task", "Config")) + \
+            str(self.rand.randrange(1000))
+
+    def comment(self, lines):
+        text = ["/*"]
+        text.extend(" * " + " ".join(self.rand.choice(("数据", "界面", "size", "update", "处理", "value"))
+                                      for _ in range(8)) for _ in range(lines))
+        text.append(" */")
+        return "\n".join(text) + "\n"
+
+    def define(self):
+        lines = self.rand.randint(3, 12)
+        body = " \\\n".join("    do_step_%d(x);" % index for index in range(lines))
+        name = "CIT_MACRO_%d" % self.rand.randrange(1000) if self.rand.random() < 0.7 else "bad_macro"
+        return "#define %s(x) \\\n%s\n" % (name, body)
+
+    def enum(self, values):
+        items = ",\n".join("    CIT_VALUE_%d = %d" % (index, index) for index in range(values))
+        if self.rand.random() < 0.5:
+            return "CIT_BEGIN_ENUM(citMode%d)\n%s\nCIT_END_ENUM\n" % (self.rand.randrange(1000), items)
+        return "enum Mode%d\n{\n%s\n};\n" % (self.rand.randrange(1000), items)
+
+    def statement(self, depth, indent):
+        space = "    " * indent
+        choice = self.rand.random()
+        if depth > 0 and choice < 0.25:
+            keyword = self.rand.choice(("if", "for", "while", "switch"))
+            body = "".join(self.statement(depth - 1, indent + 1) for _ in range(self.rand.randint(1, 12)))
+            if keyword == "if":
+                head = "if (l_value > %d)" % self.rand.randrange(100)
+            elif keyword == "for":
+                head = "for (int l_i = 0; l_i < %d; l_i++)" % self.rand.randrange(100)
+            elif keyword == "while":
+                head = "while (l_value < %d)" % self.rand.randrange(100)
+            else:
+                head = "switch (l_value)"
+                body = space + "case 1:\n" + body + space + "    break;\n"
+            return space + head + "\n" + space + "{\n" + body + space + "}\n"
+        return space + self.rand.choice(("l_value = l_value + 1;",
+                                         "int l_count = citCompute(l_value);",
+                                         "int value = 0;",
+                                         "char buffer[16];",
+                                         "memset(l_data, 0, sizeof(l_data));",
+                                         "QString l_text = tr(\"text\");",
+                                         "m_value = (int)l_value;",
+                                         "emit citChanged(l_value);",
+                                         "citUpdate(l_value, m_value);")) + "\n"
+
+    def header(self, class_name, methods):
+        lines = ["#include <QObject>", "#include <QString>", "", self.comment(self.rand.randint(5, 30)),
+                 self.define(), self.enum(self.rand.randint(10, 200)),
+                 "class %s : public QObject" % class_name, "{", "public:",
+                 "    %s();" % class_name, "    virtual ~%s();" % class_name]
+        lines.extend("    void %s(int l_value);" % method for method in methods)
+        lines.extend(["", "private:", "    int m_value;", "    QString m_text;", "    int *count;",
+                      "    Q_OBJECT", "};", ""])
+        return "\n".join(lines)
+
+    def source(self, class_name, methods, line_count):
+        text = ["#include \"%s.h\"\n#include <QDebug>\n\n" % class_name, self.comment(self.rand.randint(5, 40))]
+        length = 0
+        for method in methods:
+            body = "".join(self.statement(3, 1) for _ in range(self.rand.randint(3, 15)))
+            function = "void %s::%s(int l_value)\n{\n%s}\n\n" % (class_name, method, body)
+            text.append(function)
+            length += function.count("\n")
+            if length >= line_count:
+                break
+        return "".join(text)
+
+    def file_pair(self, line_count):
+        """
+        生成一对.h和.cpp文件
+        :param line_count: .cpp文件大约的行数
+        :return: class_name, header, source
+        """
+        class_name = self.name()
+        methods = ["citDo%s%d" % (self.rand.choice(("Work", "Load", "Save")), index) for index in range(line_count // 10 + 1)]
+        return class_name, self.header(class_name, methods), self.source(class_name, methods, line_count)
+
+
+def generate_corpus(dir_path, file_count, line_count, seed=0):
+    """
+    在dir_path下生成基准测试的源代码, .h和.cpp各占一半, 分散在几个子目录里面
+    :param dir_path: 生成的目录
+    :param file_count: 文件数量
+    :param line_count: 每个.cpp文件大约的行数
+    :param seed: 随机数的种子
+    :return: 文件路径的列表
+    """
+    generator = SourceGenerator(seed)
+    file_list = list()
+    for index in range((file_count + 1) // 2):
+        sub_dir = os.path.join(dir_path, "module%d" % (index % 4))
+        os.makedirs(sub_dir, exist_ok=True)
+        class_name, header, source = generator.file_pair(line_count)
+        for suffix, data in ((".h", header), (".cpp", source)):
+            if len(file_list) == file_count:
+                break
+            file_path = os.path.join(sub_dir, "%s_%d%s" % (class_name, index, suffix))
+            with open(file_path, "w", encoding="utf-8") as fp:
+                fp.write(data)
+            file_list.append(file_path)
+    return file_list
+
+
+def count_lines(file_list):
+    total = 0
+    for file_path in file_list:
+        with open(file_path, "rb") as fp:
+            total += fp.read().count(b"\n")
+    return total
+
+
+def measure(func, repeats=BENCHMARK_REPEATS, trace_memory=True):
+    """
+    执行func repeats次统计时间, 再执行一次用tracemalloc统计内存峰值
+    :param func: 测试的函数
+    :param repeats: 统计时间的执行次数
+    :param trace_memory: 是否统计内存峰值, tracemalloc只能统计当前进程的内存
+    :return: seconds, best_seconds, peak_memory, result 时间的中位数, 最短的时间, 内存峰值(没有统计则为None), func的返回值
+    """
+    times = list()
+    result = None
+    for _ in range(max(1, repeats)):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+
+    peak_memory = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return statistics.median(times), min(times), peak_memory, result
+
+
+def run_benchmark(sizes=("small",), jobs=1, seed=0, repeats=BENCHMARK_REPEATS):
+    """
+    执行基准测试
+    :param sizes: BENCHMARK_SIZES里面的规模名称
+    :param jobs: check_dir的并行数量
+    :param seed: 生成代码的随机数种子
+    :param repeats: 每个测试重复执行的次数
+    :return: 结果的列表, 并行检测的时候子进程的内存无法统计, peak_memory_bytes为None
+    """
+    results = list()
+    for size in sizes:
+        file_count, line_count = BENCHMARK_SIZES[size]
+        dir_path = tempfile.mkdtemp(prefix="cpplint_bench_")
+        try:
+            file_list = generate_corpus(dir_path, file_count, line_count, seed)
+            lines = count_lines(file_list)
+            benchmarks = (("check_file", 1, lambda: sum(len(cppLint.check_file(file_path) or [])
+                                                         for file_path in file_list)),
+                          ("check_dir", jobs, lambda: len(cppLint.check_dir(dir_path, jobs))))
+            for name, benchmark_jobs, func in benchmarks:
+                seconds, best_seconds, peak_memory, reports = measure(func, repeats, trace_memory=benchmark_jobs == 1)
+                results.append({"benchmark": name,
+                                "size": size,
+                                "jobs": benchmark_jobs,
+                                "files": len(file_list),
+                                "lines": lines,
+                                "reports": reports,
+                                "repeats": repeats,
+                                "seconds": round(seconds, 4),
+                                "best_seconds": round(best_seconds, 4),
+                                "files_per_sec": round(len(file_list) / seconds, 1),
+                                "lines_per_sec": round(lines / seconds, 1),
+                                "peak_memory_bytes": peak_memory})
+        finally:
+            shutil.rmtree(dir_path)
+    return results
+
+
+def current_commit():
+    try:
+        return cppLint.run_git(["rev-parse", "HEAD"], os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        return None
+
+
+def compare_results(old_result, new_result, threshold=REGRESSION_THRESHOLD, min_seconds=MIN_STABLE_SECONDS):
+    """
+    比较两次基准测试的结果
+    :param old_result: 旧的结果, run_benchmark保存的JSON
+    :param new_result: 新的结果
+    :param threshold: 速度下降超过这个比例就认为是性能退化
+    :param min_seconds: 新旧结果的时间都不小于这个秒数才判断是否退化, 时间太短的测试波动比threshold还大
+    :return: [(benchmark, size, 旧的lines_per_sec, 新的lines_per_sec, 是否退化)], 时间太短没有判断的是否退化为None
+    """
+    old_items = dict(((item["benchmark"], item["size"], item["jobs"]), item) for item in old_result["results"])
+    comparison = list()
+    for item in new_result["results"]:
+        old_item = old_items.get((item["benchmark"], item["size"], item["jobs"]))
+        if old_item is None:
+            continue
+        old_speed = old_item["lines_per_sec"]
+        new_speed = item["lines_per_sec"]
+        is_regression = None
+        if min(old_item["seconds"], item["seconds"]) >= min_seconds:
+            is_regression = new_speed < old_speed * (1 - threshold)
+        comparison.append((item["benchmark"], item["size"], old_speed, new_speed, is_regression))
+    return comparison
+
+
+if __name__ == "__main__":
+    import getopt
+    opts, args = getopt.getopt(sys.argv[1:], "", ["sizes=", "jobs=", "seed=", "repeats=", "output=", "compare=",
+                                                  "engine="])
+    logging.basicConfig(level=logging.WARNING, format="[line:%(lineno)d] %(levelname)s %(message)s")
+    sizes = ["small", "medium"]
+    jobs = 1
+    seed = 0
+    repeats = BENCHMARK_REPEATS
+    output_path = None
+    compare_path = None
+    engine = cppLint.SCANNER_ENGINE_CHAIN
+    for opt, value in opts:
+        if opt == "--sizes":
+            sizes = value.split(",")
+        elif opt == "--jobs":
+            jobs = int(value)
+        elif opt == "--seed":
+            seed = int(value)
+        elif opt == "--repeats":
+            repeats = int(value)
+        elif opt == "--output":
+            output_path = value
+        elif opt == "--compare":
+            compare_path = value
+        elif opt == "--engine":
+            engine = value
+
+    cppLint.set_scanner_engine(engine)
+    result = {"commit": current_commit(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "seed": seed,
+              "engine": engine,
+              "results": run_benchmark(sizes, jobs, seed, repeats)}
+    for item in result["results"]:
+        # 并行检测的时候只能统计父进程的内存, 不输出内存峰值
+        peak_memory = item["peak_memory_bytes"]
+        print("%-10s %-6s 文件:%-5d 行:%-7d %8.1f 文件/秒 %10.1f 行/秒 内存峰值:%s" %
+              (item["benchmark"], item["size"], item["files"], item["lines"], item["files_per_sec"],
+               item["lines_per_sec"], "-" if peak_memory is None else "%.1fMB" % (peak_memory / 1024.0 / 1024.0)))
+
+    if output_path is not None:
+        with open(output_path, "w", encoding="utf-8") as fp:
+            json.dump(result, fp, ensure_ascii=False, indent=2)
+
+    if compare_path is not None:
+        with open(compare_path, "r", encoding="utf-8") as fp:
+            old_result = json.load(fp)
+        regression = False
+        for benchmark, size, old_speed, new_speed, is_regression in compare_results(old_result, result):
+            if is_regression is None:
+                note = "时间太短,不比较"
+            else:
+                note = "性能退化" if is_regression else ""
+            print("%-10s %-6s %10.1f -> %10.1f 行/秒 %s" % (benchmark, size, old_speed, new_speed, note))
+            regression = regression or bool(is_regression)
+        sys.exit(1 if regression else 0)
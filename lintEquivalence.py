@@ -0,0 +1,298 @@
+"""
+比较两种检测配置的结果是否一致, 用来检查性能优化有没有改变检测的结果.
+对真实的源文件和随机修改过的源文件分别用两种配置检测, 比较ErrorReport的(行号, 错误信息, 上下文),
+发现不一致的时候把源代码缩小到仍然不一致的最少的行, 作为复现的例子输出
+
+用法:
+    python lintEquivalence.py -d 目录 [-a chain] [-b master] [--reference 旧版本的cppLint.py] [--mutations 20] [--seed 0]
+"""
+import os
+import random
+import inspect
+import logging
+import importlib.util
+import cppLint
+
+
+class EngineConfig:
+    """
+    一种检测配置: 使用哪个cppLint模块和哪个引擎
+    """
+    def __init__(self, name, module=None, scanner_engine=cppLint.SCANNER_ENGINE_CHAIN):
+        """
+        :param name: 配置的名称,输出差异的时候使用
+        :param module: 检测使用的cppLint模块, None则使用当前的cppLint
+        :param scanner_engine: match_and_check使用的引擎, 旧版本的模块没有引擎的时候忽略
+        """
+        self.name = name
+        self.module = module if module is not None else cppLint
+        self.scanner_engine = scanner_engine
+
+    def __call__(self, data, file_name):
+        """
+        检测源代码
+        :param data: 源代码
+        :param file_name: 文件名
+        :return: [(行号, 错误信息, 上下文)], 检测的时候有异常则返回EngineError
+        """
+        set_scanner_engine = getattr(self.module, "set_scanner_engine", None)
+        if set_scanner_engine is not None:
+            old_dispatch = self.module.file_matcher_dispatch
+            set_scanner_engine(self.scanner_engine)
+        try:
+            return [(er.line, er.message, er.error_context) for er in self.check_data(data, file_name)]
+        except Exception as e:
+            logging.debug("%s检测%s的时候抛出异常", self.name, file_name, exc_info=True)
+            return EngineError(e)
+        finally:
+            if set_scanner_engine is not None:
+                self.module.file_matcher_dispatch = old_dispatch
+
+    def check_data(self, data, file_name):
+        """
+        使用模块检测源代码, 没有check_data的旧版本模块使用和旧版本check_file一样的方式检测
+        :param data: 源代码
+        :param file_name: 文件名
+        :return: ErrorReport的列表
+        """
+        module = self.module
+        if hasattr(module, "check_data"):
+            return module.check_data(data, file_name)
+
+        parser_string = module.remove_unnecessary_data(data)
+        if "context" in inspect.signature(module.match_and_check).parameters:
+            # 已经有FileContext参数,但是还没有check_data的版本
+            return module.match_and_check(parser_string, 0, module.FileContext(file_name))
+
+        # 最早的版本使用FileContext的类属性保存检测的状态
+        module.FileContext.current_file_name = file_name
+        module.FileContext.current_line = 1
+        try:
+            return module.match_and_check(parser_string, 0)
+        finally:
+            module.FileContext.include_system_end = False
+
+
+class EngineError:
+    """
+    检测的时候抛出的异常, 和任何结果都不相等, 两种配置抛出同样的异常也会作为差异报告出来
+    """
+    def __init__(self, error):
+        self.error = error
+
+    def __eq__(self, other):
+        return False
+
+    def __ne__(self, other):
+        return True
+
+    __hash__ = None
+
+    def __str__(self):
+        return "%s: %s" % (type(self.error).__name__, self.error)
+
+
+class Difference:
+    """
+    两种配置检测结果的差异
+    """
+    def __init__(self, file_name, source, result_a, result_b, reproducer):
+        self.file_name = file_name
+        self.source = source            # 出现差异的源代码
+        self.result_a = result_a
+        self.result_b = result_b
+        self.reproducer = reproducer    # 缩小之后仍然有差异的源代码
+
+    def __str__(self):
+        lines = ["%s: 检测结果不一致" % self.file_name]
+        if isinstance(self.result_a, EngineError) or isinstance(self.result_b, EngineError):
+            for sign, result in (("-", self.result_a), ("+", self.result_b)):
+                if isinstance(result, EngineError):
+                    lines.append("  %s 检测的时候抛出异常 %s" % (sign, result))
+        else:
+            only_a = [r for r in self.result_a if r not in self.result_b]
+            only_b = [r for r in self.result_b if r not in self.result_a]
+            lines.extend("  - %r" % (r,) for r in only_a)
+            lines.extend("  + %r" % (r,) for r in only_b)
+            if not only_a and not only_b:
+                lines.append("  结果的顺序不一致")
+        lines.append("复现的代码:")
+        lines.append(self.reproducer)
+        return "\n".join(lines)
+
+
+def load_lint_module(file_path, module_name="cppLint_reference"):
+    """
+    从文件加载另外一个版本的cppLint, 比如git show base:cppLint.py保存出来的文件
+    :param file_path: cppLint.py的路径
+    :param module_name: 模块的名称, 不能和当前的cppLint重名
+    :return: 模块
+    """
+    spec = importlib.util.spec_from_file_location(module_name, file_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def minimise_source(data, is_different, max_tests=2000):
+    """
+    按行缩小源代码(ddmin), 每次尝试删掉一部分行, 删掉之后仍然有差异就保留删除
+    :param data: 有差异的源代码
+    :param is_different: 判断源代码是否仍然有差异的函数
+    :param max_tests: 最多尝试的次数
+    :return: 缩小之后的源代码
+    """
+    lines = data.splitlines(keepends=True)
+    granularity = 2
+    tests = 0
+    while len(lines) >= 2 and tests < max_tests:
+        chunk = (len(lines) + granularity - 1) // granularity
+        reduced = False
+        for start in range(0, len(lines), chunk):
+            candidate = lines[:start] + lines[start+chunk:]
+            tests += 1
+            if candidate and is_different("".join(candidate)):
+                lines = candidate
+                granularity = max(granularity - 1, 2)
+                reduced = True
+                break
+            if tests >= max_tests:
+                break
+        if not reduced:
+            if granularity >= len(lines):
+                break
+            granularity = min(granularity * 2, len(lines))
+    return "".join(lines)
+
+
+def mutate_source(data, rand):
+    """
+    随机修改源代码, 生成合成的测试代码: 删除,复制,交换行, 修改缩进
+    :param data: 源代码
+    :param rand: random.Random
+    :return: 修改之后的源代码
+    """
+    lines = data.splitlines(keepends=True)
+    if not lines:
+        return data
+    for _ in range(rand.randint(1, 4)):
+        index = rand.randrange(len(lines))
+        operation = rand.randrange(4)
+        if operation == 0 and len(lines) > 1:
+            del lines[index]
+        elif operation == 1:
+            lines.insert(index, lines[rand.randrange(len(lines))])
+        elif operation == 2:
+            other = rand.randrange(len(lines))
+            lines[index], lines[other] = lines[other], lines[index]
+        else:
+            lines[index] = rand.choice(("", "    ", "\t")) + lines[index].lstrip(" \t")
+    return "".join(lines)
+
+
+def compare_source(data, file_name, config_a, config_b, minimise=True):
+    """
+    用两种配置检测同一份源代码
+    :param data: 源代码
+    :param file_name: 文件名
+    :param config_a: 检测配置, 参数为(源代码, 文件名)的函数, 比如EngineConfig
+    :param config_b: 检测配置
+    :param minimise: 有差异的时候是否缩小源代码
+    :return: Difference, 没有差异则返回None
+    """
+    result_a = config_a(data, file_name)
+    result_b = config_b(data, file_name)
+    if result_a == result_b:
+        return None
+
+    reproducer = data
+    if minimise:
+        # 缩小的时候保持同样的差异类型, 检测结果不一致的代码不能缩小成两边都抛出异常的代码
+        crashed = (isinstance(result_a, EngineError), isinstance(result_b, EngineError))
+
+        def is_different(d):
+            a, b = config_a(d, file_name), config_b(d, file_name)
+            return (isinstance(a, EngineError), isinstance(b, EngineError)) == crashed and a != b
+        reproducer = minimise_source(data, is_different)
+    return Difference(file_name, data, result_a, result_b, reproducer)
+
+
+def iter_corpus(file_list, mutations=0, seed=0):
+    """
+    生成检测使用的源代码, 每个真实的文件后面跟着mutations个随机修改过的版本
+    :param file_list: 源文件的列表
+    :param mutations: 每个文件生成的合成代码的数量
+    :param seed: 随机数的种子, 相同的种子生成相同的代码
+    :return: 生成器, (文件名, 源代码)
+    """
+    rand = random.Random(seed)
+    for file_path in file_list:
+        try:
+            data = cppLint.read_file_source(file_path)
+        except (OSError, UnicodeDecodeError) as e:
+            logging.error("读取" + file_path + "失败:" + str(e))
+            continue
+        file_name = os.path.basename(file_path)
+        yield file_name, data
+        for _ in range(mutations):
+            yield file_name, mutate_source(data, rand)
+
+
+def compare_corpus(corpus, config_a, config_b, max_differences=10):
+    """
+    用两种配置检测所有的源代码
+    :param corpus: (文件名, 源代码)的列表或者生成器
+    :param config_a: 检测配置
+    :param config_b: 检测配置
+    :param max_differences: 找到这么多个差异之后就停止
+    :return: checked, differences 检测的源代码数量和Difference的列表
+    """
+    checked = 0
+    differences = list()
+    for file_name, data in corpus:
+        checked += 1
+        difference = compare_source(data, file_name, config_a, config_b)
+        if difference is not None:
+            differences.append(difference)
+            if len(differences) >= max_differences:
+                break
+    return checked, differences
+
+
+if __name__ == "__main__":
+    import sys
+    import getopt
+    opts, args = getopt.getopt(sys.argv[1:], "d:f:a:b:", ["reference=", "mutations=", "seed="])
+    # 随机修改过的代码会产生大量的解析错误日志, 只输出比较的结果
+    logging.basicConfig(level=logging.CRITICAL, format="[line:%(lineno)d] %(levelname)s %(message)s")
+    file_list = list()
+    engine_a = cppLint.SCANNER_ENGINE_CHAIN
+    engine_b = cppLint.SCANNER_ENGINE_MASTER
+    reference = None
+    mutations = 0
+    seed = 0
+    for opt, value in opts:
+        if opt == "-d":
+            file_list.extend(cppLint.find_source_files(value))
+        elif opt == "-f":
+            file_list.append(value)
+        elif opt == "-a":
+            engine_a = value
+        elif opt == "-b":
+            engine_b = value
+        elif opt == "--reference":
+            reference = load_lint_module(value)
+        elif opt == "--mutations":
+            mutations = int(value)
+        elif opt == "--seed":
+            seed = int(value)
+
+    # 指定了旧版本的模块的时候, a使用旧版本的模块
+    config_a = EngineConfig("reference" if reference else engine_a, reference, engine_a)
+    config_b = EngineConfig(engine_b, None, engine_b)
+    checked, differences = compare_corpus(iter_corpus(file_list, mutations, seed), config_a, config_b)
+    for difference in differences:
+        print(difference)
+        print()
+    print("%s和%s比较了%d份代码, 发现%d处不一致" % (config_a.name, config_b.name, checked, len(differences)))
+    sys.exit(1 if differences else 0)
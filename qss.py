@@ -1,6 +1,7 @@
 import re
 import os.path
 import logging
+import sourceScanner
 
 
 class ErrorReport:
@@ -193,19 +194,17 @@ def check_dir(dir_path):
     :param dir_path:
     :return:
     """
-    import os
     error_message = list()
-    for root, dirs, files in os.walk(dir_path):
-        for file in files:  # 检查文件
-            if file.endswith(".qss"):
-                try:
-                    check_rule = check_file(root + '/' + file)
-                    if check_rule:
-                        error_message.extend(check_rule)
-                except UnicodeDecodeError as e:
-                    logging.error("解析" + file + "文件编码错误:" + str(e))
-                except AssertionError as e:
-                    logging.error("解析" + file + "文件有断言")
+    for file_path in sourceScanner.scan_files(dir_path, lambda file: file.endswith(".qss"), skip_generated=False):
+        file = os.path.basename(file_path)
+        try:
+            check_rule = check_file(file_path)
+            if check_rule:
+                error_message.extend(check_rule)
+        except UnicodeDecodeError as e:
+            logging.error("解析" + file + "文件编码错误:" + str(e))
+        except AssertionError as e:
+            logging.error("解析" + file + "文件有断言")
 
     return error_message
 
@@ -0,0 +1,157 @@
+import os
+import fnmatch
+import logging
+
+IGNORE_FILE_NAME = ".cpplintignore"
+# 默认跳过的目录, 不需要写到.cpplintignore里面
+DEFAULT_IGNORE_DIRS = (".git", ".svn", ".hg")
+# Qt生成的文件的名称
+GENERATED_FILE_PATTERNS = ("moc_*.cpp", "ui_*.h", "qrc_*.cpp", "*.moc")
+# Qt生成的文件开头的注释, 文件名称被修改过的时候用来识别生成的文件
+GENERATED_FILE_MARKERS = (b"meta object code from reading c++ file",
+                          b"created by: qt user interface compiler",
+                          b"resource object code")
+GENERATED_HEADER_SIZE = 512     # 识别生成的文件的时候读取的字节数
+
+
+class IgnorePattern:
+    """
+    .cpplintignore里面的一条规则, 语法是.gitignore的子集:
+        #开头的是注释
+        以/结尾的规则只匹配目录
+        包含/的规则相对于.cpplintignore所在的目录匹配, 否则匹配任意一层的文件名或者目录名
+        支持*,?,[]通配符
+    """
+    def __init__(self, pattern, base_path):
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        self.anchored = "/" in pattern
+        self.pattern = pattern.lstrip("/")
+        self.base_path = base_path      # .cpplintignore所在的目录相对于扫描目录的路径, 用/分隔
+
+    def match(self, rel_path, name, is_dir):
+        """
+        :param rel_path: 相对于扫描目录的路径, 用/分隔
+        :param name: 文件名或者目录名
+        :param is_dir: 是否是目录
+        :return: True 需要忽略
+        """
+        if self.dir_only and not is_dir:
+            return False
+        if not self.anchored:
+            return fnmatch.fnmatchcase(name, self.pattern)
+        if self.base_path:
+            if not rel_path.startswith(self.base_path + "/"):
+                return False
+            rel_path = rel_path[len(self.base_path) + 1:]
+        return fnmatch.fnmatchcase(rel_path, self.pattern)
+
+
+def load_ignore_patterns(ignore_path, base_path=""):
+    """
+    读取.cpplintignore文件
+    :param ignore_path: .cpplintignore文件的路径
+    :param base_path: .cpplintignore所在的目录相对于扫描目录的路径
+    :return: IgnorePattern的列表
+    """
+    patterns = list()
+    try:
+        with open(ignore_path, "r", encoding="utf-8") as fp:
+            for line in fp:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    patterns.append(IgnorePattern(line, base_path))
+    except (OSError, UnicodeDecodeError) as e:
+        logging.error("读取" + ignore_path + "失败:" + str(e))
+    return patterns
+
+
+def is_generated_name(file_name):
+    """
+    根据文件名判断是否是Qt生成的文件
+    :param file_name: 文件名
+    :return: True 是生成的文件
+    """
+    return any(fnmatch.fnmatchcase(file_name, pattern) for pattern in GENERATED_FILE_PATTERNS)
+
+
+def has_generated_marker(file_path):
+    """
+    根据文件开头的注释判断是否是Qt生成的文件
+    :param file_path: 文件路径
+    :return: True 是生成的文件
+    """
+    try:
+        with open(file_path, "rb") as fp:
+            header = fp.read(GENERATED_HEADER_SIZE).lower()
+    except OSError:
+        return False
+    return any(marker in header for marker in GENERATED_FILE_MARKERS)
+
+
+def scan_files(dir_path, accept, skip_generated=True, check_header=True):
+    """
+    使用os.scandir遍历目录, 忽略的目录不会再进入, 顺序和os.walk一致(先返回目录下的文件,再进入子目录)
+    每一层目录下的.cpplintignore对这个目录和它的子目录生效, 不会进入目录的符号链接,
+    通过符号链接或者硬链接指向同一个文件的只返回第一次遇到的路径
+    :param dir_path: 扫描的目录
+    :param accept: 判断文件名是否需要返回的函数
+    :param skip_generated: 是否跳过Qt生成的文件
+    :param check_header: 是否读取文件开头判断是否是生成的文件
+    :return: 文件路径的列表
+    """
+    file_list = list()
+    seen_files = set()
+
+    def scan(root, rel_root, patterns):
+        try:
+            with os.scandir(root) as it:
+                entries = list(it)
+            root_dev = os.stat(root).st_dev
+        except OSError as e:
+            logging.error("遍历" + root + "失败:" + str(e))
+            return
+
+        for entry in entries:
+            if entry.name == IGNORE_FILE_NAME and entry.is_file():
+                patterns = patterns + load_ignore_patterns(entry.path, rel_root)
+                break
+
+        sub_dirs = list()
+        for entry in entries:
+            name = entry.name
+            rel_path = rel_root + "/" + name if rel_root else name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir and name in DEFAULT_IGNORE_DIRS:
+                continue
+            if any(pattern.match(rel_path, name, is_dir) for pattern in patterns):
+                continue
+            if is_dir:
+                sub_dirs.append((name, rel_path))
+                continue
+            if not accept(name):
+                continue
+            file_path = root + "/" + name
+            if skip_generated and (is_generated_name(name) or (check_header and has_generated_marker(file_path))):
+                continue
+            try:
+                if entry.is_symlink():
+                    stat = entry.stat()
+                    file_id = (stat.st_dev, stat.st_ino)
+                else:
+                    file_id = (root_dev, entry.inode())
+            except OSError:
+                continue
+            if file_id in seen_files:
+                continue
+            seen_files.add(file_id)
+            file_list.append(file_path)
+
+        for name, rel_path in sub_dirs:
+            scan(os.path.join(root, name), rel_path, patterns)
+
+    scan(dir_path, "", [])
+    return file_list
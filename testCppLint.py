@@ -1,6 +1,30 @@
 import cppLint
 import unittest
 import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+
+def hang_check_file(file_path):
+    """
+    模拟卡死的检测,文件名里面有hang的文件一直不结束
+    """
+    if "hang" in file_path:
+        time.sleep(60)
+    return [cppLint.ErrorReport(line=1, message="checked", file_full_path=file_path)]
+
+
+def hang_after_statement(file_path):
+    """
+    模拟解析到第3行的语句之后卡死的检测
+    """
+    data = "int a;\nint b;\nint c;\n"
+    context = cppLint.FileContext(file_path)
+    context.get_line_index(data)
+    context.check_deadline(data.find("int c"))
+    time.sleep(60)
 
 
 class CppLintTest(unittest.TestCase):
@@ -43,6 +67,75 @@ class CppLintTest(unittest.TestCase):
         test_string = cppLint.remove_comment(test_string)
         self.assertEqual(len(test_string), len("kkkjie"))
 
+    def test_strip_comment_and_key(self):
+        test_string = 'std::string l_url = "http://a/*b*/"; // comment\n' \
+                      "unsigned int l_c = '/'; /* a\n" \
+                      "b */ unsigned long l_d;"
+        result = cppLint.remove_unnecessary_data(test_string)
+        self.assertEqual(result, 'std::string l_url = "http://a/*b*/"; \n'
+                                 " int l_c = '/'; \n"
+                                 "  long l_d;")
+        self.assertEqual(result.count("\n"), test_string.count("\n"))
+
+        test_string = '"unsigned int" unsigned int'
+        self.assertEqual(cppLint.remove_unnecessary_key(test_string), '"unsigned int"  int')
+
+        test_string = "/* // */int a;"
+        self.assertEqual(cppLint.remove_comment(test_string), "int a;")
+
+    def test_line_index(self):
+        test_string = "int a;\n\nint b;\nint c;"
+        line_index = cppLint.LineIndex(test_string)
+        for pos in range(-3, len(test_string)+2):
+            self.assertEqual(line_index.line_of(pos), test_string.count("\n", 0, pos)+1)
+            for end_pos in range(-3, len(test_string)+2):
+                self.assertEqual(line_index.count(pos, end_pos), test_string.count("\n", pos, end_pos))
+
+        context = cppLint.FileContext()
+        self.assertIs(context.get_line_index(test_string), context.get_line_index(test_string))
+
+    def test_bracket_index(self):
+        test_string = 'if (a == "(") { f(b[1], (c)); }'
+        self.assertEqual(cppLint.find_token_pair_by_pos(test_string, 3, "("), test_string.find(")", 12))
+        self.assertEqual(cppLint.find_token_pair_by_pos(test_string, test_string.find("{"), "{"), len(test_string)-1)
+        self.assertEqual(cppLint.find_token_pair_by_pos(test_string, test_string.find("["), "["), test_string.find("]"))
+        # 字符串里面的括号不在索引里面,按照字符查找
+        self.assertEqual(cppLint.find_token_pair_by_pos(test_string, 10, "("),
+                         cppLint.scan_token_pair_by_pos(test_string, 10, "("))
+
+        test_string = "std::map<int, std::vector<QString>> l_m; if (a < b && c > d) {}"
+        bracket_index = cppLint.BracketIndex(test_string)
+        self.assertEqual(bracket_index.template_pair(test_string.find("<")), test_string.find(">>")+1)
+        self.assertEqual(bracket_index.template_pair(test_string.find("<Q")), test_string.find(">>"))
+        self.assertIsNone(bracket_index.template_pair(test_string.find("< b")))
+        # 不是模板的'<'按照字符查找
+        self.assertEqual(cppLint.find_token_pair_by_pos(test_string, test_string.find("< b"), "<"),
+                         cppLint.scan_token_pair_by_pos(test_string, test_string.find("< b"), "<"))
+        self.assertEqual(len(bracket_index.unmatched_pos), 0)
+
+        test_string = "void citFunc()\n{\n    if (a) {\n}\n"
+        bracket_index = cppLint.BracketIndex(test_string)
+        self.assertEqual(bracket_index.unmatched_pos, [test_string.find("{")])
+        error_message = cppLint.check_bracket(test_string)
+        self.assertEqual(len(error_message), 1)
+        self.assertEqual(error_message[0].line, 2)
+        self.assertEqual(error_message[0].message, cppLint.BRACKET_NOT_MATCH)
+
+        # 预处理指令里面的括号不参与匹配
+        test_string = "#define CIT_NS_BEGIN namespace foo { \\\n    (\n#include <QString>\n\n" \
+                      "class CitFoo\n{\npublic:\n    char* m_p;\n};\n"
+        self.assertEqual(cppLint.BracketIndex(test_string).unmatched_pos, [])
+        messages = [(er.line, er.message) for er in cppLint.check_data(test_string, "citFoo.h")]
+        self.assertEqual(messages, [(5, cppLint.CLASS_NAME_MUST_CIT_BEGIN),
+                                    (8, cppLint.RAW_POINTER)])
+
+        # 括号不匹配的时候仍然检测前面的语句
+        test_string = "class CitFoo\n{\n    char* m_p;\n};\n}\nint bad_value;\n"
+        messages = [er.message for er in cppLint.check_data(test_string, "citFoo.h")]
+        self.assertEqual(messages[0], cppLint.BRACKET_NOT_MATCH)
+        self.assertIn(cppLint.CLASS_NAME_MUST_CIT_BEGIN, messages)
+        self.assertIn(cppLint.RAW_POINTER, messages)
+
     def test_match_var(self):
         match = cppLint.var_regex.match("m_sProcess = new QProcess();")
         self.assertIsNone(match)
@@ -507,6 +600,771 @@ class CppLintTest(unittest.TestCase):
         file = "./test_data/citChartLayerWidget.cpp"
         result = cppLint.check_file(file)
 
+    def test_check_dir_jobs(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(dir_path, "sub"))
+            for index in range(6):
+                file_path = os.path.join(dir_path, "sub" if index % 2 else "", "citFile%d.cpp" % index)
+                with open(file_path, "w") as fp:
+                    fp.write("int func%d(int a)\n{\n    int b = a;\n    return b;\n}\n" % index)
+            with open(os.path.join(dir_path, "citBad.h"), "w") as fp:
+                fp.write("class citBad {\n")
+
+            serial_result = [str(er) for er in cppLint.check_dir(dir_path)]
+            parallel_result = [str(er) for er in cppLint.check_dir(dir_path, jobs=3)]
+            self.assertEqual(len(serial_result), 13)
+            self.assertEqual(serial_result, parallel_result)
+            thread_result = [str(er) for er in cppLint.check_dir(dir_path, jobs=3, use_threads=True)]
+            self.assertEqual(serial_result, thread_result)
+            self.assertEqual([str(er) for er in cppLint.iter_check_dir(dir_path)], serial_result)
+            self.assertEqual([str(er) for er in cppLint.iter_check_dir(dir_path, jobs=3)], serial_result)
+        finally:
+            shutil.rmtree(dir_path)
+
+    def test_find_source_files(self):
+        import sourceScanner
+        dir_path = tempfile.mkdtemp()
+        try:
+            for sub_dir in ("src", "build", "3rdparty/lib", ".git", "src/gen"):
+                os.makedirs(os.path.join(dir_path, sub_dir))
+            file_data = {"src/citA.cpp": "int a;\n",
+                         "src/citA.h": "int a;\n",
+                         "src/moc_citA.cpp": "int a;\n",
+                         "src/ui_citA.h": "int a;\n",
+                         "src/citRenamed.cpp": "/****\n** Meta object code from reading C++ file 'citA.h'\n",
+                         "src/gen/citGen.cpp": "int a;\n",
+                         "src/citSkip.cpp": "int a;\n",
+                         "build/citBuild.cpp": "int a;\n",
+                         "3rdparty/lib/citLib.cpp": "int a;\n",
+                         ".git/citGit.cpp": "int a;\n",
+                         "citStyle.qss": "",
+                         ".cpplintignore": "# 第三方库\nbuild/\n3rdparty/lib\n",
+                         "src/.cpplintignore": "gen/\ncitSkip.*\n"}
+            for file_name, data in file_data.items():
+                with open(os.path.join(dir_path, file_name), "w") as fp:
+                    fp.write(data)
+            os.link(os.path.join(dir_path, "src/citA.cpp"), os.path.join(dir_path, "src/citLink.cpp"))
+
+            file_list = [os.path.relpath(file_path, dir_path) for file_path in cppLint.find_source_files(dir_path)]
+            # 硬链接指向同一个文件, 只检测第一次遇到的路径
+            self.assertEqual(len(file_list), 2)
+            self.assertIn("src/citA.h", file_list)
+            self.assertTrue("src/citA.cpp" in file_list or "src/citLink.cpp" in file_list)
+            self.assertEqual(sourceScanner.scan_files(dir_path, lambda file: file.endswith(".qss")),
+                             [dir_path + "/citStyle.qss"])
+        finally:
+            shutil.rmtree(dir_path)
+
+    def test_error_report_lazy_context(self):
+        data = "void func(int a)\n{\n    memset(p, 0, 1);\n}\n"
+        result = cppLint.check_data(data, "citA.cpp")
+        self.assertEqual([(er.message, er.error_context) for er in result],
+                         [(cppLint.FUNCTION_NAME_BEGIN_CIT, "void func(int a)"),
+                          (cppLint.MEMSET_MEMCPY, "memset(p, 0, 1);")])
+        self.assertIsNone(result[0].context_string)
+        self.assertFalse(hasattr(result[0], "__dict__"))
+        import pickle
+        copy_report = pickle.loads(pickle.dumps(result[0]))
+        self.assertIsNone(copy_report.source)
+        self.assertEqual(str(copy_report), str(result[0]))
+        self.assertIsNone(result[1].materialize().source)
+        self.assertEqual(result[1].error_context, "memset(p, 0, 1);")
+
+        # 类名称,变量,数组和宏定义的错误也只记录上下文的位置
+        data = "#define max_size 10\nclass CitA\n{\n    int a;\n    char m_buffer[10];\n};\n" \
+               "void citFunc()\n{\n    int value = 0;\n}\n"
+        reports = cppLint.check_data(data, "citA.cpp")
+        self.assertEqual([er.error_context for er in reports],
+                         ["max_size", "CitA", "int a", "char m_buffer[10]", "int value = 0;"])
+        self.assertEqual([er.context_string for er in reports], [None] * len(reports))
+
+        # check_file返回的结果不再引用源代码
+        dir_path = tempfile.mkdtemp()
+        file_path = os.path.join(dir_path, "citA.cpp")
+        with open(file_path, "w") as fp:
+            fp.write(data)
+        reports = cppLint.check_file(file_path)
+        self.assertEqual([er.source for er in reports], [None] * len(reports))
+        self.assertEqual(reports[-1].error_context, "int value = 0;")
+        shutil.rmtree(dir_path)
+
+        report = cppLint.ErrorReport(line=2, message="abc".join(["x", "y"]), source="  a  b ",
+                                     context_start=0, context_end=7)
+        self.assertIs(report.message, cppLint.ErrorReport(message="xabcy").message)
+        report.context_start, report.context_end = cppLint.strip_range(report.source, 0, 7)
+        self.assertEqual(report.error_context, "a  b")
+        self.assertEqual(cppLint.count_error_report(result + [report]),
+                         sorted([(cppLint.FUNCTION_NAME_BEGIN_CIT, 1), (cppLint.MEMSET_MEMCPY, 1), ("xabcy", 1)]))
+
+    def test_iter_check_file(self):
+        data = "void func()\n{\n}\nvoid citFunc2()\n{\n    int a = 1;\n}\n"
+        result = cppLint.iter_check_data(data, "citA.cpp")
+        # 第一个函数检测完毕就返回结果,不需要检测完整个文件
+        self.assertEqual(next(result).message, cppLint.FUNCTION_NAME_BEGIN_CIT)
+        self.assertEqual([er.message for er in result], [cppLint.LOCAL_VAR_MUST_BE_L_BEGIN])
+
+        dir_path = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(dir_path, "citA.cpp")
+            with open(file_path, "w") as fp:
+                fp.write(data)
+            self.assertEqual([str(er) for er in cppLint.iter_check_file(file_path)],
+                             [str(er) for er in cppLint.check_file(file_path)])
+        finally:
+            shutil.rmtree(dir_path)
+
+    def test_main_usage(self):
+        import sys
+        # 没有指定检测的文件,目录或者git的时候输出用法
+        for args, returncode in (([], 2), (["-h"], 0), (["-j", "2"], 2), (["--not-exist"], 2)):
+            process = subprocess.run([sys.executable, cppLint.__file__] + args,
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.assertEqual(process.returncode, returncode)
+            self.assertIn(cppLint.USAGE, process.stdout.decode("utf-8"))
+
+    def test_count_only(self):
+        import io
+        import sys
+        import runpy
+        import logging
+        import contextlib
+
+        dir_path = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(dir_path, "citA.cpp"), "w") as fp:
+                fp.write("void func()\n{\n    int a = 1;\n    memset(p, 0, 1);\n}\n")
+            expect = cppLint.count_error_report(cppLint.check_dir(dir_path))
+            reports = cppLint.check_file_list(cppLint.find_source_files(dir_path), with_context=False)
+            self.assertEqual([er.error_context for er in reports], [None] * len(reports))
+
+            # --count-only不能生成上下文字符串, 在__main__里面记录materialize和error_context的调用
+            calls = list()
+
+            def profile(frame, event, arg):
+                if event == "call" and frame.f_code.co_name in ("materialize", "error_context") \
+                        and frame.f_code.co_filename == cppLint.__file__:
+                    calls.append(frame.f_code.co_name)
+
+            output = io.StringIO()
+            old_argv = sys.argv
+            handler = logging.NullHandler()
+            logging.getLogger().addHandler(handler)
+            sys.argv = ["cppLint.py", "--count-only", "-d", dir_path]
+            sys.setprofile(profile)
+            try:
+                with contextlib.redirect_stdout(output):
+                    runpy.run_path(cppLint.__file__, run_name="__main__")
+            finally:
+                sys.setprofile(None)
+                sys.argv = old_argv
+                logging.getLogger().removeHandler(handler)
+            self.assertEqual(calls, [])
+            self.assertEqual(output.getvalue().splitlines()[:-1], ["%d\t%s" % (count, message)
+                                                                   for message, count in expect])
+        finally:
+            shutil.rmtree(dir_path)
+
+    def test_read_file_source(self):
+        data = "// 中文注释\r\nvoid citFunc()\r\n{\r\n    int a = 1;\r\n}\r\n"
+        expect = data.replace("\r\n", "\n")
+        self.assertEqual(cppLint.decode_source(b"int a;\r\n"), "int a;\n")
+        self.assertEqual(cppLint.decode_source(b"\xef\xbb\xbfint a;\r"), "int a;\n")
+
+        dir_path = tempfile.mkdtemp()
+        old_threshold = cppLint.MMAP_THRESHOLD
+        try:
+            for encoding in ("utf-8", "gb2312"):
+                file_path = os.path.join(dir_path, "citA.cpp")
+                with open(file_path, "wb") as fp:
+                    fp.write(data.encode(encoding))
+                self.assertEqual(cppLint.read_file_source(file_path), expect)
+                cppLint.MMAP_THRESHOLD = 1
+                self.assertEqual(cppLint.read_file_source(file_path), expect)
+                cppLint.MMAP_THRESHOLD = old_threshold
+                self.assertEqual([(er.line, er.message) for er in cppLint.check_file(file_path)],
+                                 [(4, cppLint.LOCAL_VAR_MUST_BE_L_BEGIN)])
+        finally:
+            cppLint.MMAP_THRESHOLD = old_threshold
+            shutil.rmtree(dir_path)
+
+    def test_result_cache(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(dir_path, "citCache.cpp")
+            with open(file_path, "w") as fp:
+                fp.write("int func(int a)\n{\n    int b = a;\n    return b;\n}\n")
+
+            cache = cppLint.ResultCache(os.path.join(dir_path, "cache"))
+            result = [str(er) for er in cppLint.check_file(file_path, cache)]
+            self.assertEqual(len(result), 2)
+            key = cache.make_key("citCache.cpp", cppLint.read_file_source(file_path))
+            self.assertTrue(os.path.exists(cache.cache_path(key)))
+            self.assertEqual([str(er) for er in cppLint.check_file(file_path, cache)], result)
+
+            # 缓存的结果直接返回,不重新解析
+            cache.put(key, [cppLint.ErrorReport(line=1, message=cppLint.VAR_TOO_MANY, error_context="int a")])
+            cache_result = cppLint.check_file(file_path, cache)
+            self.assertEqual(len(cache_result), 1)
+            self.assertEqual(cache_result[0].message, cppLint.VAR_TOO_MANY)
+            self.assertEqual(cache_result[0].file_full_path, os.path.abspath(file_path))
+
+            # 文件名不同的时候,include的检测结果可能不同,不能使用同一个缓存
+            self.assertNotEqual(cache.make_key("citOther.cpp", cppLint.read_file_source(file_path)), key)
+
+            cache.max_size = 0
+            cache.prune()
+            self.assertIsNone(cache.get(key))
+        finally:
+            shutil.rmtree(dir_path)
+
+    def test_check_git_changes(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            def git(*args):
+                subprocess.check_output(["git", "-c", "user.name=test", "-c", "user.email=test@test"] + list(args),
+                                        cwd=dir_path)
+
+            function_string = "int citFunc%d(int a)\n{\n    int b = a;\n    return b;\n}\n"
+            git("init", "-q")
+            for index in range(2):
+                with open(os.path.join(dir_path, "citFile%d.cpp" % index), "w") as fp:
+                    fp.write(function_string % 0)
+            git("add", ".")
+            git("commit", "-q", "-m", "init")
+
+            with open(os.path.join(dir_path, "citFile1.cpp"), "a") as fp:
+                fp.write(function_string % 1)
+            with open(os.path.join(dir_path, "citNew.cpp"), "w") as fp:
+                fp.write(function_string % 2)
+
+            changed_lines = cppLint.git_changed_lines(dir_path)
+            changed_file = os.path.abspath(os.path.join(dir_path, "citFile1.cpp"))
+            new_file = os.path.abspath(os.path.join(dir_path, "citNew.cpp"))
+            self.assertEqual(sorted(changed_lines.keys()), [changed_file, new_file])
+            self.assertEqual(changed_lines[changed_file], set(range(6, 11)))
+            self.assertIsNone(changed_lines[new_file])
+
+            error_message = cppLint.check_git_changes(dir_path)
+            self.assertEqual([er.line for er in error_message], [3, 8, 3])
+            error_message = cppLint.check_git_changes(dir_path, only_hunks=True)
+            self.assertEqual([er.line for er in error_message], [8, 3])
+
+            git("add", "citFile1.cpp")
+            error_message = cppLint.check_git_changes(dir_path, staged=True, only_hunks=True)
+            self.assertEqual([(er.file_full_path, er.line) for er in error_message], [(changed_file, 8)])
+
+            # 暂存之后工作区又修改了, 检测的是暂存区里面的内容, 行号和修改的行一致
+            with open(os.path.join(dir_path, "citFile1.cpp"), "w") as fp:
+                fp.write("\n\n" + function_string % 0 + function_string % 1)
+            error_message = cppLint.check_git_changes(dir_path, staged=True, only_hunks=True)
+            self.assertEqual([(er.file_full_path, er.line) for er in error_message], [(changed_file, 8)])
+
+            # 提交范围检测的是提交B里面的内容
+            git("commit", "-q", "-m", "change")
+            error_message = cppLint.check_git_changes(dir_path, "HEAD~1..HEAD", only_hunks=True)
+            self.assertEqual([(er.file_full_path, er.line) for er in error_message], [(changed_file, 8)])
+            error_message = cppLint.check_git_changes(dir_path, "HEAD~1..HEAD", jobs=2)
+            self.assertEqual([(er.file_full_path, er.line) for er in error_message], [(changed_file, 3),
+                                                                                      (changed_file, 8)])
+        finally:
+            shutil.rmtree(dir_path)
+
+    def test_git_changed_lines_path(self):
+        self.assertEqual(cppLint.unquote_git_path("b/my file.cpp\t"), "b/my file.cpp")
+        self.assertEqual(cppLint.unquote_git_path(r'"b/\344\270\255.cpp"'), "b/中.cpp")
+        self.assertEqual(cppLint.unquote_git_path(r'"b/a\"b\tc.cpp"'), 'b/a"b\tc.cpp')
+
+        dir_path = tempfile.mkdtemp()
+        try:
+            def git(*args):
+                subprocess.check_output(["git", "-c", "user.name=test", "-c", "user.email=test@test"] + list(args),
+                                        cwd=dir_path)
+
+            function_string = "int citFunc%d(int a)\n{\n    int b = a;\n    return b;\n}\n"
+            file_names = ["my file.cpp", "中文.cpp", 'a"b.cpp']
+            git("init", "-q")
+            for file_name in file_names:
+                with open(os.path.join(dir_path, file_name), "w") as fp:
+                    fp.write(function_string % 0)
+            git("add", ".")
+            git("commit", "-q", "-m", "init")
+            for file_name in file_names:
+                with open(os.path.join(dir_path, file_name), "a") as fp:
+                    fp.write(function_string % 1)
+            with open(os.path.join(dir_path, "new 文件.cpp"), "w") as fp:
+                fp.write(function_string % 2)
+
+            changed_lines = cppLint.git_changed_lines(dir_path)
+            for file_name in file_names:
+                self.assertEqual(changed_lines.pop(os.path.abspath(os.path.join(dir_path, file_name))),
+                                 set(range(6, 11)))
+            self.assertEqual(changed_lines, {os.path.abspath(os.path.join(dir_path, "new 文件.cpp")): None})
+        finally:
+            shutil.rmtree(dir_path)
+
+    def test_time_budget(self):
+        data = "void func()\n{\n}\nvoid citFunc2()\n{\n    int a = 1;\n}\n"
+        result = cppLint.check_data(data, "citA.cpp", time_budget=0)
+        self.assertEqual([(er.line, er.message) for er in result], [(1, cppLint.LINT_TIMEOUT.format(0))])
+        self.assertEqual(len(cppLint.check_data(data, "citA.cpp", time_budget=60)), 2)
+
+        # 超时的时候返回已经检测出的结果
+        context = cppLint.FileContext("citA.cpp")
+
+        def expire(event):
+            if event.outcome == "hit":
+                context.deadline = 0
+        context.matcher_hooks = (cppLint.MatcherTrace(expire, ["match_and_check_function"]),)
+        cppLint.install_matcher_hooks()
+        try:
+            self.assertRaises(cppLint.LintTimeout, cppLint.match_and_check, data, 0, context)
+        finally:
+            cppLint.uninstall_matcher_hooks()
+        self.assertEqual([er.message for er in context.error_message], [cppLint.FUNCTION_NAME_BEGIN_CIT])
+        self.assertEqual(context.last_offset, data.find("void citFunc2"))
+
+    def test_watchdog_recycle_worker(self):
+        file_list = ["a.cpp", "hang.cpp", "b.cpp", "c.cpp"]
+        begin = time.time()
+        result = list(cppLint.iter_check_file_list_with_watchdog(file_list, 2, hang_check_file, 0.1))
+        self.assertLess(time.time() - begin, 30)
+        self.assertEqual([(os.path.basename(er.file_full_path), er.message) for er in result],
+                         [("a.cpp", "checked"), ("hang.cpp", cppLint.LINT_TIMEOUT.format(0)),
+                          ("b.cpp", "checked"), ("c.cpp", "checked")])
+        self.assertEqual(result[1].line, 0)
+
+        # 逐个检测的时候也会结束卡死的子进程
+        result = list(cppLint.iter_check_file_list_with_watchdog(["hang.cpp", "a.cpp"], 1, hang_check_file, 0.1))
+        self.assertEqual([er.message for er in result], [cppLint.LINT_TIMEOUT.format(0), "checked"])
+
+        # 子进程被结束的时候报告最后解析的位置和行号
+        result = list(cppLint.iter_check_file_list_with_watchdog(["hang.cpp"], 1, hang_after_statement, 0.1))
+        self.assertEqual([(er.line, er.message) for er in result], [(3, cppLint.LINT_TIMEOUT.format(14))])
+
+    def test_regex_no_backtracking(self):
+        import time
+        # 这些输入以前会让正则表达式指数级回溯而卡死
+        spaces = " \n\t" * 2000
+        hang_corpus = [
+            (cppLint.match_while_stat, "while (" + spaces + "a"),
+            (cppLint.match_switch_stat, "switch (" + spaces + "a"),
+            (cppLint.match_for_stat, "for (" + spaces + ";" + spaces + ";" + spaces + "a"),
+            (cppLint.match_for_stat, "for (;" + ";" * 2000 + "a"),
+            (cppLint.match_delete_stat, "delete" + spaces + "a"),
+            (cppLint.match_using_namespace, "using namespace " + spaces + "a"),
+            (cppLint.match_and_check_enum, "enum {" + spaces + "a"),
+        ]
+        for func, data in hang_corpus:
+            begin = time.time()
+            self.assertEqual(func(data, 0)[:2], (-1, -1))
+            self.assertLess(time.time() - begin, 1)
+
+        hang_regex_corpus = [
+            (cppLint.return_stat_regex, "return " + spaces + "a"),
+            (cppLint.cit_begin_enum_regex, "CIT_BEGIN_ENUM(citA)" + spaces + "a"),
+            (cppLint.qproperty_stat_regex, "Q_PROPERTY(" + " " * 6000 + "a"),
+        ]
+        for regex, data in hang_regex_corpus:
+            begin = time.time()
+            self.assertIsNone(regex.match(data))
+            self.assertLess(time.time() - begin, 1)
+
+        # 能够匹配的语句,匹配的范围不变
+        data = "for (int i = 0; i < 10; ++i) {\n    a = i;\n}\n"
+        self.assertEqual(cppLint.match_for_stat(data, 0), (0, len(data)-2))
+        data = "while (f(a)) {\n}\n"
+        self.assertEqual(cppLint.match_while_stat(data, 0), (0, len(data)-2))
+        self.assertEqual(cppLint.return_stat_regex.match("return a;b;").end(), 9)
+        self.assertEqual(cppLint.qproperty_stat_regex.match("Q_PROPERTY(int a READ a)").end(), 24)
+
+    def test_matcher_dispatch(self):
+        dispatch = cppLint.MatcherDispatch([
+            ("define", ("#define",)),
+            ("prec", ("#if", "#endif")),
+            ("word", cppLint.MatcherDispatch.WORD),
+            ("any", cppLint.MatcherDispatch.ANY),
+        ])
+        self.assertEqual(dispatch.candidates("#define CIT_A 1", 0), {"define", "any"})
+        self.assertEqual(dispatch.candidates("#ifdef CIT_A", 0), {"prec", "any"})
+        self.assertEqual(dispatch.candidates("int a;", 0), {"word", "any"})
+        self.assertEqual(dispatch.candidates("a = (int)b;", 4), {"any"})
+        self.assertEqual(dispatch.candidates("中文 = 1;", 0), {"word", "any"})
+
+        # 按照开头分派之后,检测的结果和每个规则都执行一次的结果一致
+        data = cppLint.remove_unnecessary_data(
+            "#include <QWidget>\n#define CIT_A 1\ntypedef int citInt;\nenum A { B };\n"
+            "class citA : public QObject\n{\n    Q_OBJECT\npublic:\n    citA();\n    ~citA();\n"
+            "    int count;\n    enum { C };\n};\n"
+            "void citA::citRun(int a)\n{\n    if (a) { b = 1; }\n    memset(p, 0, 1);\n"
+            "    int *p = (int*)a;\n    return a;\n}\n")
+        expect = [str(er) for er in cppLint.match_and_check(data, 0)]
+        self.assertNotEqual(expect, [])
+        dispatch_names = ("file_matcher_dispatch", "class_matcher_dispatch", "function_body_matcher_dispatch")
+        old_dispatch = [getattr(cppLint, name) for name in dispatch_names]
+        try:
+            for name, dispatch in zip(dispatch_names, old_dispatch):
+                setattr(cppLint, name, cppLint.MatcherDispatch([(rule, cppLint.MatcherDispatch.ANY)
+                                                                for rule, prefix in dispatch.rules]))
+            result = [str(er) for er in cppLint.match_and_check(data, 0)]
+        finally:
+            for name, dispatch in zip(dispatch_names, old_dispatch):
+                setattr(cppLint, name, dispatch)
+        self.assertEqual(result, expect)
+
+    def test_benchmark(self):
+        import lintBenchmark
+        dir_path = tempfile.mkdtemp()
+        try:
+            file_list = lintBenchmark.generate_corpus(os.path.join(dir_path, "a"), 4, 50, seed=1)
+            other_list = lintBenchmark.generate_corpus(os.path.join(dir_path, "b"), 4, 50, seed=1)
+            self.assertEqual(len(file_list), 4)
+            # 相同的种子生成相同的代码
+            for file_path, other_path in zip(file_list, other_list):
+                with open(file_path) as fp, open(other_path) as other_fp:
+                    self.assertEqual(fp.read(), other_fp.read())
+            messages = set(er.message for er in cppLint.check_dir(os.path.join(dir_path, "a")))
+            self.assertIn(cppLint.LOCAL_VAR_MUST_BE_L_BEGIN, messages)
+        finally:
+            shutil.rmtree(dir_path)
+
+        results = lintBenchmark.run_benchmark(["tiny"], repeats=2)
+        self.assertEqual([(item["benchmark"], item["files"]) for item in results], [("check_file", 4), ("check_dir", 4)])
+        self.assertEqual(results[0]["reports"], results[1]["reports"])
+        self.assertGreater(results[0]["lines_per_sec"], 0)
+        self.assertGreater(results[0]["peak_memory_bytes"], 0)
+        self.assertLessEqual(results[0]["best_seconds"], results[0]["seconds"])
+        # 并行检测的时候不统计内存峰值
+        results_jobs = lintBenchmark.run_benchmark(["tiny"], jobs=2, repeats=1)
+        self.assertEqual([item["peak_memory_bytes"] is None for item in results_jobs], [False, True])
+
+        old_result = {"results": [dict(results[0], lines_per_sec=results[0]["lines_per_sec"] * 2)]}
+        self.assertEqual([item[-1] for item in lintBenchmark.compare_results(old_result, {"results": results},
+                                                                            min_seconds=0)], [True])
+        # 时间太短的测试不判断是否退化
+        self.assertEqual([item[-1] for item in lintBenchmark.compare_results(old_result, {"results": results},
+                                                                            min_seconds=3600)], [None])
+
+    def test_lint_equivalence(self):
+        import random
+        import lintEquivalence
+        data = ("#include <QWidget>\nvoid citFunc(int a)\n{\n    int l_b = a;\n    int l_c[3];\n"
+                "    memset(l_c, 0, 3);\n    return;\n}\n")
+        chain = lintEquivalence.EngineConfig("chain")
+        master = lintEquivalence.EngineConfig("master", scanner_engine=cppLint.SCANNER_ENGINE_MASTER)
+        self.assertIsNone(lintEquivalence.compare_source(data, "citA.cpp", chain, master))
+        self.assertIs(cppLint.file_matcher_dispatch, cppLint.file_dispatch_engines[cppLint.SCANNER_ENGINE_CHAIN])
+
+        # 模拟一个漏掉了数组检测的引擎, 缩小之后只剩下函数和数组的定义
+        def broken(source, file_name):
+            return [report for report in chain(source, file_name) if report[1] != cppLint.RAW_ARRAY]
+
+        difference = lintEquivalence.compare_source(data, "citA.cpp", chain, broken)
+        self.assertEqual([report for report in difference.result_a if report not in difference.result_b],
+                         [(5, cppLint.RAW_ARRAY, "int l_c[3]")])
+        self.assertEqual(difference.reproducer, "void citFunc(int a)\n{\n    int l_c[3];\n}\n")
+        self.assertIn("int l_c[3]", str(difference))
+
+        rand = random.Random(0)
+        corpus = [("citA.cpp", data)] + [("citA.cpp", lintEquivalence.mutate_source(data, rand)) for _ in range(10)]
+        self.assertEqual(lintEquivalence.compare_corpus(corpus, chain, master), (11, []))
+
+        # 两边都抛出异常不能当作结果一致
+        def crash(source, file_name):
+            raise AssertionError()
+        crash_a = lintEquivalence.EngineConfig("crash_a")
+        crash_a.check_data = crash
+        difference = lintEquivalence.compare_source(data, "citA.cpp", crash_a, crash_a, minimise=False)
+        self.assertIsNotNone(difference)
+        self.assertIn("AssertionError", str(difference))
+
+    def test_lint_equivalence_reference(self):
+        import lintEquivalence
+        # 加载仓库第一个提交里面没有check_data的cppLint, 和当前的版本比较
+        repo_dir = os.path.dirname(os.path.abspath(__file__))
+        try:
+            root = cppLint.run_git(["rev-list", "--max-parents=0", "HEAD"], repo_dir).split()[-1]
+            source = cppLint.run_git(["show", root + ":cppLint.py"], repo_dir)
+        except (OSError, subprocess.CalledProcessError):
+            self.skipTest("没有git仓库的历史")
+        dir_path = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(dir_path, "cppLint_reference.py")
+            with open(file_path, "w", encoding="utf-8") as fp:
+                fp.write(source)
+            reference = lintEquivalence.EngineConfig("reference", lintEquivalence.load_lint_module(file_path))
+        finally:
+            shutil.rmtree(dir_path)
+        self.assertFalse(hasattr(reference.module, "check_data"))
+
+        data = ("#include <QWidget>\nclass CitA\n{\n    char* m_p;\n};\nvoid citFunc(int a)\n{\n"
+                "    int l_c[3];\n    memset(l_c, 0, 3);\n}\n")
+        result = reference(data, "citA.h")
+        self.assertNotIsInstance(result, lintEquivalence.EngineError)
+        self.assertGreater(len(result), 2)
+        self.assertIsNone(lintEquivalence.compare_source(data, "citA.h", reference,
+                                                         lintEquivalence.EngineConfig("chain")))
+
+    def test_scanner_engine(self):
+        data = ("#include <QWidget>\n#include \"citA.h\"\n#define max_size 10\n#ifdef CIT_DEBUG\n#endif\n"
+                "using namespace std;\ntypedef int citInt;\nenum Color { RED };\nCIT_BEGIN_ENUM(citMode)\nCIT_END_ENUM\n"
+                "struct citPoint { int x; };\nclass citA : public QObject\n{\n    Q_OBJECT\npublic:\n    int a;\n};\n"
+                "int count = 0;\nstatic int s_value = 1;\nvoid citA::func(int a,int b)\n{\n    int c[3];\n}\n")
+        master = cppLint.file_dispatch_engines[cppLint.SCANNER_ENGINE_MASTER]
+        chain = cppLint.file_dispatch_engines[cppLint.SCANNER_ENGINE_CHAIN]
+        for pos in range(len(data)):
+            self.assertEqual(master.candidates(data, pos), chain.candidates(data, pos))
+
+        expect = [str(er) for er in cppLint.check_data(data, "citA.cpp")]
+        self.assertGreater(len(expect), 5)
+        cppLint.set_scanner_engine(cppLint.SCANNER_ENGINE_MASTER)
+        try:
+            self.assertIs(cppLint.file_matcher_dispatch, master)
+            self.assertEqual([str(er) for er in cppLint.check_data(data, "citA.cpp")], expect)
+        finally:
+            cppLint.set_scanner_engine(cppLint.SCANNER_ENGINE_CHAIN)
+        self.assertIs(cppLint.file_matcher_dispatch, chain)
+        self.assertRaises(ValueError, cppLint.set_scanner_engine, "unknown")
+
+    def test_statement_index(self):
+        data = "void citFunc()\n{\n    int l_a[3];\n    for (;;) {\n    }\n}\n"
+        statement_index = cppLint.StatementIndex(data)
+        self.assertEqual(statement_index.statement_end_pos,
+                         [pos for pos, c in enumerate(data) if c in ";{}"])
+        self.assertEqual(statement_index.statement_end(data.find("int")), data.find(";"))
+        self.assertEqual(statement_index.statement_end(len(data) - 1), len(data))
+        self.assertEqual(cppLint.next_token_pos_not_space(data, data.find("\n")), data.find("{"))
+        self.assertEqual(cppLint.next_token_pos_not_space("a  \n\t", 1), -1)
+        # 规则只在语句的范围里面匹配,检测结果不变
+        self.assertEqual([(er.line, er.message) for er in cppLint.check_data(data, "citA.cpp")],
+                         [(3, cppLint.RAW_ARRAY)])
+
+    def test_count_control_block_lines(self):
+        body = "".join("            l_a = %d;\n" % index for index in range(10))
+        data = ("void citFunc()\n{\n    while (l_a) {\n        for (l_i = 0; l_i < 1; l_i++) {\n"
+                "          if (l_b) {\n" + body + "          }\n        }\n    }\n}\n")
+        start_pos = data.find("while")
+        end_pos = cppLint.match_while_stat(data, start_pos)[1]
+        line_num, error_message = cppLint.count_control_block_lines(data, "while", start_pos, end_pos)
+        # 嵌套的语句只算一行, 只有最内层的if语句超过了行数
+        self.assertEqual(line_num, 2)
+        self.assertEqual([(er.line, er.message, er.error_context) for er in error_message],
+                         [(5, cppLint.TOO_MANY_LINES.format("if"), "if (l_b)")])
+
+    def test_trace(self):
+        match_if_stat = cppLint.match_if_stat
+        events = list()
+        cppLint.enable_trace(events.append, ["match_if_stat", "match_and_check_function"])
+        try:
+            cppLint.match_and_check("void citFunc()\n{\n    if (a) {\n    }\n}\n", 0)
+        finally:
+            cppLint.disable_trace()
+        self.assertIs(cppLint.match_if_stat, match_if_stat)
+        self.assertEqual([(event.matcher, event.offset, event.outcome) for event in events],
+                         [("match_if_stat", 21, "hit"), ("match_and_check_function", 0, "hit")])
+        self.assertRaises(ValueError, cppLint.enable_trace, None, ["not_a_matcher"])
+        self.assertIs(cppLint.match_if_stat, match_if_stat)
+
+        # 钩子只对设置了钩子的上下文生效, 其他上下文不会产生跟踪事件
+        events = list()
+        context = cppLint.FileContext()
+        context.matcher_hooks = (cppLint.MatcherTrace(events.append, ["match_if_stat"]),)
+        cppLint.install_matcher_hooks()
+        try:
+            cppLint.match_and_check("void citFunc()\n{\n    if (a) {\n    }\n}\n", 0)
+            self.assertEqual(events, [])
+            cppLint.match_and_check("void citFunc()\n{\n    if (a) {\n    }\n}\n", 0, context)
+        finally:
+            cppLint.uninstall_matcher_hooks()
+        self.assertEqual([(event.matcher, event.offset) for event in events], [("match_if_stat", 21)])
+        self.assertIs(cppLint.match_if_stat, match_if_stat)
+
+    def test_profile(self):
+        data = "void citFunc()\n{\n    if (a) {\n    }\n    return 1;\n}\n"
+        expect = [str(er) for er in cppLint.match_and_check(data, 0)]
+        cppLint.reset_profile()
+        cppLint.enable_profile()
+        try:
+            result = [str(er) for er in cppLint.match_and_check(data, 0)]
+        finally:
+            cppLint.disable_profile()
+        self.assertEqual(result, expect)
+        self.assertIsNot(type(cppLint.return_stat_regex), cppLint.ProfileRegex)
+
+        stats = dict((counter.name, counter) for counter in cppLint.get_profile_stats())
+        self.assertEqual((stats["match_if_stat"].calls, stats["match_if_stat"].hits), (1, 1))
+        self.assertEqual(stats["match_and_check_function"].kind, "matcher")
+        self.assertEqual((stats["return_stat_regex"].kind, stats["return_stat_regex"].hits), ("regex", 1))
+        self.assertIn("match_if_stat", cppLint.format_profile_report())
+        cppLint.reset_profile()
+        self.assertEqual(cppLint.get_profile_stats(), [])
+
+    def test_trace_and_profile(self):
+        data = "void citFunc()\n{\n    if (a) {\n    }\n    return 1;\n}\n"
+        match_if_stat = cppLint.match_if_stat
+        return_stat_regex = cppLint.return_stat_regex
+        # 开启和关闭的顺序不同, 都能还原原来的匹配函数和正则表达式
+        for disable_order in ((cppLint.disable_trace, cppLint.disable_profile),
+                              (cppLint.disable_profile, cppLint.disable_trace)):
+            events = list()
+            cppLint.reset_profile()
+            cppLint.enable_trace(events.append, ["match_if_stat"])
+            cppLint.enable_profile()
+            try:
+                cppLint.match_and_check(data, 0)
+            finally:
+                disable_order[0]()
+                self.assertIsNot(cppLint.match_if_stat, match_if_stat)
+                disable_order[1]()
+            self.assertIs(cppLint.match_if_stat, match_if_stat)
+            self.assertIs(cppLint.return_stat_regex, return_stat_regex)
+            self.assertEqual([(event.matcher, event.outcome) for event in events], [("match_if_stat", "hit")])
+            stats = dict((counter.name, counter) for counter in cppLint.get_profile_stats())
+            self.assertEqual((stats["match_if_stat"].calls, stats["match_if_stat"].hits), (1, 1))
+        cppLint.reset_profile()
+
+    def test_serve_stream(self):
+        import io
+        import json
+        requests = [
+            {"id": 1, "file_name": "citServer.cpp", "content": "int func(int a)\n{\n    return a;\n}\n"},
+            {"id": 2, "path": "not_exist_file.cpp"},
+            {"id": 3, "method": "shutdown"},
+            {"id": 4, "file_name": "citServer.cpp", "content": ""},
+        ]
+        input_stream = io.StringIO("".join(json.dumps(request) + "\n" for request in requests) + "")
+        output_stream = io.StringIO()
+        self.assertTrue(cppLint.serve_stream(input_stream, output_stream))
+
+        responses = [json.loads(line) for line in output_stream.getvalue().splitlines()]
+        self.assertEqual([response["id"] for response in responses], [1, 2, 3])
+        self.assertEqual(responses[0]["results"], [{"file": "citServer.cpp", "line": 1,
+                                                    "message": cppLint.FUNCTION_NAME_BEGIN_CIT,
+                                                    "context": "int func(int a)"}])
+        self.assertIn("error", responses[1])
+
+    def test_report_writer(self):
+        import io
+        import json
+        self.assertEqual(cppLint.get_rule_id(cppLint.RAW_POINTER), "RAW_POINTER")
+        self.assertEqual(cppLint.get_rule_id(cppLint.TOO_MANY_LINES.format("while")), "TOO_MANY_LINES")
+        self.assertEqual(cppLint.get_rule_id(cppLint.LINT_TIMEOUT.format(10)), "LINT_TIMEOUT")
+        self.assertEqual(cppLint.get_rule_id("not a rule"), cppLint.UNKNOWN_RULE_ID)
+
+        result = cppLint.check_data("int func(int a)\n{\n    int b = a;\n    return b;\n}\n", "citWriter.cpp")
+        output_stream = io.StringIO()
+        writer = cppLint.JsonLinesReportWriter(output_stream, buffer_size=1)
+        for er in result:
+            writer.write(er)
+        writer.close()
+        records = [json.loads(line) for line in output_stream.getvalue().splitlines()]
+        self.assertEqual([record["rule_id"] for record in records], ["FUNCTION_NAME_BEGIN_CIT",
+                                                                      "LOCAL_VAR_MUST_BE_L_BEGIN"])
+        self.assertEqual(records[1]["context"], "int b = a;")
+
+        # 基类默认输出文本格式
+        for writer_class in (cppLint.ReportWriter, cppLint.TextReportWriter):
+            output_stream = io.StringIO()
+            writer = writer_class(output_stream)
+            for er in result:
+                writer.write(er)
+            writer.close()
+            self.assertEqual(output_stream.getvalue(), "".join(str(er) + "\n" for er in result))
+
+        for reports in ([], result):
+            output_stream = io.StringIO()
+            writer = cppLint.SarifReportWriter(output_stream)
+            for er in reports:
+                writer.write(er)
+            writer.close()
+            sarif = json.loads(output_stream.getvalue())
+            self.assertEqual(sarif["version"], "2.1.0")
+            run = sarif["runs"][0]
+            self.assertEqual(len(run["results"]), len(reports))
+            for sarif_result in run["results"]:
+                rule = run["tool"]["driver"]["rules"][sarif_result["ruleIndex"]]
+                self.assertEqual(rule["id"], sarif_result["ruleId"])
+        self.assertEqual(run["results"][1]["locations"][0]["physicalLocation"]["region"],
+                         {"startLine": 3, "snippet": {"text": "int b = a;"}})
+
+        # 机器可读的格式输出到标准输出的时候, 统计信息和--profile的报告输出到标准错误
+        import sys
+        dir_path = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(dir_path, "citWriter.cpp")
+            with open(file_path, "w") as fp:
+                fp.write("int func(int a)\n{\n    int b = a;\n    return b;\n}\n")
+            for report_format in ("sarif", "jsonl"):
+                process = subprocess.run([sys.executable, cppLint.__file__, "--profile", "--format", report_format,
+                                          "-f", file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+                output = process.stdout.decode("utf-8")
+                if report_format == "sarif":
+                    self.assertEqual(len(json.loads(output)["runs"][0]["results"]), 2)
+                else:
+                    self.assertEqual(len([json.loads(line) for line in output.splitlines()]), 2)
+                self.assertIn("match_and_check_function", process.stderr.decode("utf-8"))
+        finally:
+            shutil.rmtree(dir_path)
+
+    def test_baseline(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(dir_path, "citBaseline.cpp")
+            other_file_path = os.path.join(dir_path, "citOther.cpp")
+            for path in (file_path, other_file_path):
+                with open(path, "w") as fp:
+                    fp.write("int func(int a)\n{\n    int b = a;\n    return b;\n}\n")
+            old_result = cppLint.check_file(file_path)
+            baseline_path = os.path.join(dir_path, "baseline.txt")
+            self.assertEqual(cppLint.Baseline.write(baseline_path, old_result, dir_path), 2)
+            baseline = cppLint.Baseline.load(baseline_path, dir_path)
+            self.assertEqual(len(baseline), 2)
+
+            # 内容相同的另外一个文件的指纹不同, 结果不会被基线过滤
+            other_result = cppLint.check_file(other_file_path)
+            self.assertEqual([er.error_context for er in other_result], [er.error_context for er in old_result])
+            self.assertNotEqual(cppLint.fingerprint_error_report(other_result[0], dir_path)[0],
+                                cppLint.fingerprint_error_report(old_result[0], dir_path)[0])
+            self.assertEqual(len(list(baseline.filter(other_result))), 2)
+
+            # 行号和缩进变化了,只有新增的结果需要报告
+            with open(file_path, "w") as fp:
+                fp.write("\n\nint func(int a)\n{\n  int   b = a;\n    int c = b;\n    int b = a;\n    return c;\n}\n")
+            new_result = cppLint.check_file(file_path)
+            self.assertEqual(len(new_result), 4)
+            self.assertEqual([(er.line, er.error_context) for er in baseline.filter(new_result)],
+                             [(6, "int c = b;"), (7, "int b = a;")])
+        finally:
+            shutil.rmtree(dir_path)
+
+    def test_watcher(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(dir_path, "citWatch.cpp")
+            with open(file_path, "w") as fp:
+                fp.write("int func(int a)\n{\n    int b = a;\n    return b;\n}\n")
+
+            watcher = cppLint.Watcher(dir_path)
+            added, removed = watcher.poll()
+            self.assertEqual([er.message for er in added], [cppLint.FUNCTION_NAME_BEGIN_CIT,
+                                                             cppLint.LOCAL_VAR_MUST_BE_L_BEGIN])
+            self.assertEqual(len(removed), 0)
+            self.assertEqual(watcher.poll(), ([], []))
+
+            with open(file_path, "w") as fp:
+                fp.write("\nint citFunc(int a)\n{\n    int b = a;\n    int c = b;\n    return c;\n}\n")
+            os.utime(file_path, ns=(0, 0))
+            added, removed = watcher.poll()
+            self.assertEqual([(er.line, er.error_context) for er in added], [(5, "int c = b;")])
+            self.assertEqual([er.message for er in removed], [cppLint.FUNCTION_NAME_BEGIN_CIT])
+
+            os.remove(file_path)
+            added, removed = watcher.poll()
+            self.assertEqual(len(added), 0)
+            self.assertEqual(len(removed), 2)
+        finally:
+            shutil.rmtree(dir_path)
+
     def test_match_and_check_include(self):
         test_string = "#include <iostream>"
         match = cppLint.system_include_regex.match(test_string)
@@ -522,35 +1380,30 @@ class CppLintTest(unittest.TestCase):
                       '#include "iostream"\n' \
                       "#include <iostream>\n"
 
-        cppLint.FileContext.include_system_end = False
-        cppLint.FileContext.current_file_name = "iostream2"
+        context = cppLint.FileContext("iostream2")
         test_string_start_pos = 0
-        start_pos, end_pos, error_message = cppLint.match_and_check_include(test_string, test_string_start_pos)
+        start_pos, end_pos, error_message = cppLint.match_and_check_include(test_string, test_string_start_pos, context)
         test_string_start_pos = end_pos+2  # +2是为了跳过\n,本来应该+1
-        start_pos, end_pos, error_message = cppLint.match_and_check_include(test_string, test_string_start_pos)
-        self.assertEqual(cppLint.FileContext.include_system_end, True)
+        start_pos, end_pos, error_message = cppLint.match_and_check_include(test_string, test_string_start_pos, context)
+        self.assertEqual(context.include_system_end, True)
         test_string_start_pos = end_pos+2
-        start_pos, end_pos, error_message = cppLint.match_and_check_include(test_string, test_string_start_pos)
+        start_pos, end_pos, error_message = cppLint.match_and_check_include(test_string, test_string_start_pos, context)
         self.assertEqual(len(error_message), 1)
 
         test_string = "#include <iostream>\n" \
                       '#include "iostream"\n' \
                       "#include <iostream>\n"
 
-        cppLint.FileContext.include_system_end = False
-        cppLint.FileContext.current_file_name = "iostream"
+        context = cppLint.FileContext("iostream")
         test_string_start_pos = 0
-        start_pos, end_pos, error_message = cppLint.match_and_check_include(test_string, test_string_start_pos)
+        start_pos, end_pos, error_message = cppLint.match_and_check_include(test_string, test_string_start_pos, context)
         test_string_start_pos = end_pos+2  # +2是为了跳过\n,本来应该+1
-        start_pos, end_pos, error_message = cppLint.match_and_check_include(test_string, test_string_start_pos)
-        self.assertEqual(cppLint.FileContext.include_system_end, False)
+        start_pos, end_pos, error_message = cppLint.match_and_check_include(test_string, test_string_start_pos, context)
+        self.assertEqual(context.include_system_end, False)
         test_string_start_pos = end_pos+2
-        start_pos, end_pos, error_message = cppLint.match_and_check_include(test_string, test_string_start_pos)
+        start_pos, end_pos, error_message = cppLint.match_and_check_include(test_string, test_string_start_pos, context)
         self.assertEqual(len(error_message), 0)
 
-        cppLint.FileContext.include_system_end = False
-        cppLint.FileContext.current_file_name = None
-
     def test_match_and_check_define(self):
         define_string = "#define MAX(A,B) a > b\n"
         dummy_string = "abc"